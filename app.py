@@ -1,5 +1,7 @@
 import os.path
+import atexit
 import sqlite3
+import tempfile
 import sqlalchemy
 import sqlalchemy.orm
 import sqlalchemy.event
@@ -15,8 +17,10 @@ from traces_api.modules.unit.controller import ns as dataset_namespace
 from traces_api.modules.annotated_unit.controller import ns as annotated_unit_namespace
 from traces_api.modules.mix.controller import ns as mix_namespace
 
-from traces_api.trace_tools import TraceAnalyzer, TraceNormalizer, TraceMixing
-from traces_api.compression import Compression
+from traces_api.trace_tools import create_trace_tools, check_storage_compression
+from traces_api.tool_runner import PooledRunner, ContainerWorker
+from traces_api.compression import create_compression
+from traces_api.analysis_cache import AnalysisCache, DEFAULT_MAX_SIZE
 
 
 APP_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -119,6 +123,43 @@ class FlaskApp:
             return config_value
         return "{}/{}".format(APP_DIR, config_value)
 
+    def _create_compression(self, key):
+        """
+        Create compression of file storage selected in config
+
+        :param key: config key in storage section
+        :return: Compression, gzip is used if key is missing
+        """
+        threads = self._config.get("storage", "compression_threads")
+        return create_compression(self._config.get("storage", key) or "gzip", int(threads) if threads else None)
+
+    def _create_trace_tools(self, compressions):
+        """
+        Create trace tools of backend selected in config
+
+        Pooled containers can access temporary directory and all storage directories.
+
+        :param compressions: dict of Compression by config key of storage read by trace tools
+        :return: TraceTools
+        :raises TraceToolsConfigError: backend can't read files compressed by storages
+        """
+        backend = self._config.get("trace_tools", "backend") or "docker"
+        check_storage_compression(backend, compressions)
+        if backend != "pool":
+            return create_trace_tools(backend)
+
+        mounts = [tempfile.gettempdir()] + [
+            self._abs_storage_path(self._config.get("storage", key)) for key in ("ann_units_dir", "units_dir", "mixes_dir")
+        ]
+        runner = PooledRunner(
+            lambda: ContainerWorker(mounts),
+            size=int(self._config.get("trace_tools", "pool_size") or 2),
+            max_jobs=int(self._config.get("trace_tools", "pool_max_jobs") or 100),
+            health_check_interval=float(self._config.get("trace_tools", "pool_health_check_interval") or 60),
+        )
+        atexit.register(runner.close)
+        return create_trace_tools(backend, runner)
+
     def configure(self, binder):
         """
         Configure application, setup binder
@@ -129,16 +170,22 @@ class FlaskApp:
         from traces_api.modules.unit.service import UnitService
         from traces_api.modules.annotated_unit.service import AnnotatedUnitService
         from traces_api.modules.mix.service import MixService
-        from traces_api.storage import FileStorage
+        from traces_api.storage import FileStorage, ContentAddressedStorage
+
+        annotated_unit_compression = self._create_compression("ann_units_compression")
+        unit_compression = self._create_compression("units_compression")
+        trace_tools = self._create_trace_tools(dict(ann_units_compression=annotated_unit_compression, units_compression=unit_compression))
+        analysis_cache = AnalysisCache(self._session_maker, int(self._config.get("analysis_cache", "max_size") or DEFAULT_MAX_SIZE))
 
-        annotated_unit_storage = FileStorage(self._abs_storage_path(self._config.get("storage", "ann_units_dir")), compression=Compression())
-        annotated_unit_service = AnnotatedUnitService(self._session_maker, annotated_unit_storage, TraceAnalyzer(), TraceNormalizer())
+        # Units and annotated units are deduplicated, repeated uploads of the same capture share one file
+        annotated_unit_storage = ContentAddressedStorage(self._abs_storage_path(self._config.get("storage", "ann_units_dir")), compression=annotated_unit_compression, session_maker=self._session_maker, name="ann_units")
+        annotated_unit_service = AnnotatedUnitService(self._session_maker, annotated_unit_storage, trace_tools.analyzer, trace_tools.normalizer, analysis_cache)
 
-        unit_storage = FileStorage(self._abs_storage_path(self._config.get("storage", "units_dir")), compression=Compression(), subdirectories=False)
-        unit_service = UnitService(self._session_maker, annotated_unit_service, unit_storage, TraceAnalyzer())
+        unit_storage = ContentAddressedStorage(self._abs_storage_path(self._config.get("storage", "units_dir")), compression=unit_compression, session_maker=self._session_maker, name="units", subdirectories=False)
+        unit_service = UnitService(self._session_maker, annotated_unit_service, unit_storage, trace_tools.analyzer, analysis_cache)
 
-        mix_storage = FileStorage(self._abs_storage_path(self._config.get("storage", "mixes_dir")), compression=Compression())
-        mix_service = MixService(self._session_maker, self._engine, annotated_unit_service, mix_storage, TraceNormalizer(), TraceMixing())
+        mix_storage = FileStorage(self._abs_storage_path(self._config.get("storage", "mixes_dir")), compression=self._create_compression("mixes_compression"))
+        mix_service = MixService(self._session_maker, self._engine, annotated_unit_service, mix_storage, trace_tools.normalizer, trace_tools.mixing)
 
         binder.bind(UnitService, to=unit_service)
         binder.bind(AnnotatedUnitService, to=annotated_unit_service)
@@ -36,7 +36,8 @@
 Script to provide information about given PCAP file via standard output in JSON format. This information serves
 as an input for a trace normalization and annotation.
 
-Currently available information: TCP conversations, caputre file properties, and MAC-IP pairs.
+Currently available information: TCP conversations, caputre file properties, MAC-IP pairs, and flow statistics
+(UDP conversations, ICMP conversations, and IPv6 endpoints).
 
 Requirements:
     * tshark
@@ -44,7 +45,16 @@ Requirements:
     * Python 3
 
 Usage:
-    $ ./trace-analyzer.py -f <capture_file> -t -p -c
+    $ ./trace-analyzer.py -f <capture_file> -t -p -c [-s]
+
+    $ ./trace-analyzer.py -b <manifest_json> -t -p -c [-j <number_of_workers>]
+
+    Use --concurrent to run all tools at once, total time is then given by the slowest tool.
+
+    With -s all conversations and endpoints (including TCP conversations if -t is set) are computed by single tshark
+    run and printed as one JSON dictionary.
+
+Batch manifest is JSON list of jobs {"input": <capture_file>}, one JSON result line is printed for every job.
 """
 
 # Common python modules
@@ -54,6 +64,11 @@ import subprocess  # Executes commands in shell
 import re  # Regular expressions support
 import shlex  # Split the string s using shell-like syntax
 import json  # JSON processing functions
+import io  # In-memory text streams
+import contextlib  # Redirection of standard output
+import functools  # Partial application of job parameters
+import multiprocessing  # Worker pool for batch mode
+from concurrent.futures import ThreadPoolExecutor  # Threads reading outputs of concurrent commands
 from distutils.spawn import find_executable  # Check if required tool is available in PATH
 
 
@@ -69,17 +84,27 @@ def check_requirements():
     return True
 
 
-def run_command(command, quiet):
+def start_command(command, quiet):
     """
-    Run given command and provide its output as a result.
+    Start given command without waiting for its output.
 
     :param command: command to be run
     :param quiet: set to true to not print any information output
-    :return: command output or None if error occurred
+    :return: started process
     """
     if not quiet:
         print("[info] Running command: " + command)
-    command_process = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def finish_command(command, command_process):
+    """
+    Wait for started command and provide its output as a result.
+
+    :param command: command that was run
+    :param command_process: process returned by start_command
+    :return: command output or None if error occurred
+    """
     stdout, stderr = command_process.communicate()
 
     if stderr:
@@ -89,6 +114,41 @@ def run_command(command, quiet):
         return stdout
 
 
+def run_command(command, quiet):
+    """
+    Run given command and provide its output as a result.
+
+    :param command: command to be run
+    :param quiet: set to true to not print any information output
+    :return: command output or None if error occurred
+    """
+    return finish_command(command, start_command(command, quiet))
+
+
+def run_analyses(analyses, quiet, concurrent):
+    """
+    Run analyses and process their outputs.
+
+    :param analyses: list of tuples (command, function processing command output, result used if error occurred)
+    :param quiet: set to true to not print any information output
+    :param concurrent: set to true to run all commands together, their outputs are read concurrently
+    :return: list of results in order of analyses
+    """
+    commands = [command for command, _, _ in analyses]
+    if concurrent:
+        processes = [start_command(command, quiet) for command in commands]
+        # Every pipe is drained by its own thread, so no process blocks on full pipe while others are read
+        with ThreadPoolExecutor(max(len(processes), 1)) as executor:
+            outputs = list(executor.map(finish_command, commands, processes))
+    else:
+        outputs = (finish_command(command, start_command(command, quiet)) for command in commands)
+
+    results = []
+    for (_, process_output, default), command_output in zip(analyses, outputs):
+        results.append(process_output(command_output) if command_output else default)
+    return results
+
+
 def process_tshark_conversations(tshark_output):
     """
     Process output from the tshark conversations command and return parsed array of dictionaries.
@@ -120,6 +180,15 @@ def process_tshark_conversations(tshark_output):
     return tshark_result
 
 
+def tcp_conversations_analysis(filename):
+    """
+    :param filename: capture file to compute TCP conversations on
+    :return: analysis tuple for run_analyses
+    """
+    command = "tshark -r {filename} -q -z conv,tcp".format(filename=filename)
+    return command, process_tshark_conversations, []
+
+
 def get_tcp_conversations(filename, quiet):
     """
     Compute TCP conversations info and return result as dictionary.
@@ -128,13 +197,114 @@ def get_tcp_conversations(filename, quiet):
     :param quiet: set to true to not print any information output
     :return: TCP conversations stats as array of dictionaries or empty array if error occurred
     """
-    command = "tshark -r {filename} -q -z conv,tcp".format(filename=filename)
-    command_output = run_command(command, quiet)
+    return run_analyses([tcp_conversations_analysis(filename)], quiet, False)[0]
 
-    if command_output:
-        return process_tshark_conversations(command_output)
-    else:
-        return []
+
+def split_tshark_statistics(tshark_output):
+    """
+    Split output of tshark run with multiple statistics into data lines of individual statistics tables.
+
+    :param tshark_output: output obtained by running tshark command with -q and -z options
+    :return: dictionary with table title (e.g. "UDP Conversations") as key and list of data lines as value
+    """
+    tables = {}
+    title = None
+    for line in tshark_output.decode('utf-8').split('\n'):
+        if line.startswith("==="):
+            title = None
+        elif title is None:
+            if line.strip():
+                title = line.strip()
+                tables.setdefault(title, [])
+        elif line.strip() and not line.startswith("Filter:") and "|" not in line:
+            tables[title].append(line)
+    return tables
+
+
+def parse_port_conversation(fields):
+    """
+    :param fields: whitespace separated fields of TCP or UDP conversation line, addresses are in form IP:port
+    :return: dictionary with parsed conversation
+    """
+    ip_a, port_a = fields[0].rsplit(":", 1)
+    ip_b, port_b = fields[2].rsplit(":", 1)
+    conversation = {"IP A": ip_a, "Port A": int(port_a), "IP B": ip_b, "Port B": int(port_b)}
+    conversation.update(parse_conversation_counters(fields[3:]))
+    return conversation
+
+
+def parse_ip_conversation(fields):
+    """
+    :param fields: whitespace separated fields of IPv4 or IPv6 conversation line
+    :return: dictionary with parsed conversation
+    """
+    conversation = {"IP A": fields[0], "IP B": fields[2]}
+    conversation.update(parse_conversation_counters(fields[3:]))
+    return conversation
+
+
+def parse_conversation_counters(fields):
+    """
+    :param fields: frame and byte counters and relative start of conversation line
+    :return: dictionary with parsed counters
+    """
+    return {
+        "Frames B-A": int(fields[0]),
+        "Bytes B-A": int(fields[1]),
+        "Frames A-B": int(fields[2]),
+        "Bytes A-B": int(fields[3]),
+        "Frames": int(fields[4]),
+        "Bytes": int(fields[5]),
+        "Relative start": float(fields[6].replace(',', '.'))
+    }
+
+
+def parse_endpoint(fields):
+    """
+    :param fields: whitespace separated fields of endpoints line
+    :return: dictionary with parsed endpoint
+    """
+    return {
+        "IP": fields[0],
+        "Packets": int(fields[1]),
+        "Bytes": int(fields[2]),
+        "Tx Packets": int(fields[3]),
+        "Tx Bytes": int(fields[4]),
+        "Rx Packets": int(fields[5]),
+        "Rx Bytes": int(fields[6]),
+    }
+
+
+# Statistics tables as tuples (result key, tshark statistics, table title, function parsing fields of data line)
+TCP_STATISTICS = ("tcp_conversations", "conv,tcp", "TCP Conversations", parse_port_conversation)
+FLOW_STATISTICS = [
+    ("udp_conversations", "conv,udp", "UDP Conversations", parse_port_conversation),
+    ("icmp_conversations", "conv,ip,icmp", "IPv4 Conversations", parse_ip_conversation),
+    ("icmp_conversations", "conv,ipv6,icmpv6", "IPv6 Conversations", parse_ip_conversation),
+    ("ipv6_endpoints", "endpoints,ipv6", "IPv6 Endpoints", parse_endpoint),
+]
+
+
+def flow_statistics_analysis(filename, tcp_conversations):
+    """
+    All statistics tables are computed by single tshark run.
+
+    :param filename: capture file to analyse
+    :param tcp_conversations: set to true to compute also TCP conversations
+    :return: analysis tuple for run_analyses, result is dictionary with list of items for every result key
+    """
+    statistics = ([TCP_STATISTICS] if tcp_conversations else []) + FLOW_STATISTICS
+    command = "tshark -nr {filename} -q ".format(filename=filename)
+    command += " ".join("-z " + option for _, option, _, _ in statistics)
+
+    def process_flow_statistics(tshark_output):
+        tables = split_tshark_statistics(tshark_output)
+        result = {key: [] for key, _, _, _ in statistics}
+        for key, _, title, parse in statistics:
+            result[key] += [parse(line.split()) for line in tables.get(title, [])]
+        return result
+
+    return command, process_flow_statistics, {key: [] for key, _, _, _ in statistics}
 
 
 def process_capture_file_properties(capinfos_output):
@@ -157,6 +327,15 @@ def process_capture_file_properties(capinfos_output):
     return capinfos_result
 
 
+def capture_file_properties_analysis(filename):
+    """
+    :param filename: capture file to analyse
+    :return: analysis tuple for run_analyses
+    """
+    command = "capinfos -S -M {filename}".format(filename=filename)
+    return command, process_capture_file_properties, {}
+
+
 def get_capture_file_properties(filename, quiet):
     """
     Provide information about the capture file.
@@ -165,13 +344,7 @@ def get_capture_file_properties(filename, quiet):
     :param quiet: set to true to not print any information output
     :return: dictionary object with file properties or or empty dictionary if error occurred
     """
-    command = "capinfos -S -M {filename}".format(filename=filename)
-    command_output = run_command(command, quiet)
-
-    if command_output:
-        return process_capture_file_properties(command_output)
-    else:
-        return {}
+    return run_analyses([capture_file_properties_analysis(filename)], quiet, False)[0]
 
 
 def process_mac_ip_pairs(tshark_output):
@@ -196,54 +369,164 @@ def process_mac_ip_pairs(tshark_output):
     return tshark_result
 
 
+def process_mac_ip_src_dst_pairs(tshark_output):
+    """
+    Process output from the tshark command with source and destination MAC-IP pairs on every line.
+
+    :param tshark_output: output obtained by running tshark command with fields eth.src, ip.src, eth.dst, ip.dst
+    :return: array of dictionaries with parsed unique source pairs followed by unique destination pairs
+    """
+    # Remove white spaces, split lines, and get only unique lines
+    output_lines = tshark_output.decode('utf-8').strip().split('\n')
+    output_lines_unique = set(output_lines)
+
+    src_pairs = set()
+    dst_pairs = set()
+    for line in output_lines_unique:
+        fields = line.split('\t') + [''] * 3
+        src_pairs.add((fields[0], fields[1]))
+        dst_pairs.add((fields[2], fields[3]))
+
+    return [{"MAC": mac, "IP": ip} for mac, ip in list(src_pairs) + list(dst_pairs)]
+
+
+def mac_ip_pairs_analysis(filename):
+    """
+    :param filename: capture file to analyse
+    :return: analysis tuple for run_analyses
+    """
+    command = "tshark -nr {filename} -T fields -e eth.src -e ip.src -e eth.dst -e ip.dst -E separator=/t"\
+        .format(filename=filename)
+    return command, process_mac_ip_src_dst_pairs, []
+
+
 def get_mac_ip_pairs(filename, quiet):
     """
     Compute mapping of MAC-IP addresses.
 
+    Source and destination pairs are extracted by single tshark run.
+
     :param filename: capture file to analyse
     :param quiet: set to true to not print any information output
     :return: MAC-IP mapping as array of dictionaries or empty array if error occurred
     """
-    command_src = "tshark -nr {filename} -T fields -e eth.src -e ip.src -E separator=/t".format(filename=filename)
-    command_dst = "tshark -nr {filename} -T fields -e eth.dst -e ip.dst -E separator=/t".format(filename=filename)
-    command_src_output = run_command(command_src, quiet)
-    command_dst_output = run_command(command_dst, quiet)
+    return run_analyses([mac_ip_pairs_analysis(filename)], quiet, False)[0]
 
-    pairs_result = []
-    if command_src_output:
-        pairs_result += process_mac_ip_pairs(command_src_output)
-    if command_dst_output:
-        pairs_result += process_mac_ip_pairs(command_dst_output)
-    return pairs_result
+
+def create_analyses(filename, tcp_conversations, pairs_mac_ip, capture_info, flow_statistics=False):
+    """
+    Create list of requested analyses of given file.
+
+    :param filename: capture file to analyse
+    :param tcp_conversations: set to true to compute TCP conversations
+    :param pairs_mac_ip: set to true to compute MAC-IP pairs
+    :param capture_info: set to true to provide capture file properties
+    :param flow_statistics: set to true to compute UDP and ICMP conversations and IPv6 endpoints
+    :return: list of tuples (name, analysis tuple for run_analyses), name is None for analyses returning dictionary
+             of named results
+    """
+    analyses = []
+    if flow_statistics:
+        analyses.append((None, flow_statistics_analysis(filename, tcp_conversations)))
+    elif tcp_conversations:
+        analyses.append(("tcp_conversations", tcp_conversations_analysis(filename)))
+    if pairs_mac_ip:
+        analyses.append(("pairs_mac_ip", mac_ip_pairs_analysis(filename)))
+    if capture_info:
+        analyses.append(("capture_info", capture_file_properties_analysis(filename)))
+    return analyses
+
+
+def analyze_job(options, job):
+    """
+    Analyse one job of batch manifest, information output is captured and returned in result.
+
+    :param options: dictionary with tcp_conversations, pairs_mac_ip, capture_info, flow_statistics and concurrent flags
+    :param job: dictionary with input
+    :return: dictionary with input, results of requested analyses, success and log
+    """
+    analyses = create_analyses(
+        job["input"], options["tcp_conversations"], options["pairs_mac_ip"], options["capture_info"],
+        options["flow_statistics"]
+    )
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        results = run_analyses([analysis for _, analysis in analyses], True, options["concurrent"])
+
+    result = {"input": job["input"]}
+    for (name, _), value in zip(analyses, results):
+        if name is None:
+            result.update(value)
+        else:
+            result[name] = value
+    result["success"] = "[error]" not in log.getvalue()
+    result["log"] = log.getvalue()
+    return result
+
+
+def analyze_batch(jobs, options, workers):
+    """
+    Analyse all jobs of batch manifest by pool of workers and print one JSON result line per job.
+
+    :param jobs: list of dictionaries with input
+    :param options: dictionary with tcp_conversations, pairs_mac_ip, capture_info, flow_statistics and concurrent flags
+    :param workers: number of worker processes
+    :return: True if all jobs succeeded
+    """
+    success = True
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap(functools.partial(analyze_job, options), jobs):
+            success = success and result["success"]
+            print(json.dumps(result), flush=True)
+    return success
 
 
 if __name__ == "__main__":
     # Argument parser automatically creates -h argument
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--filename", help="Capture filename to calculate statistics on.",
-                        type=str, required=True)
+                        type=str, required=False)
     parser.add_argument("-t", "--tcp_conversations", help="Show TCP conversations.",
                         action='store_true', required=False)
     parser.add_argument("-p", "--pairs_mac_ip", help="Show mapping of IP to MAC addresses.",
                         action='store_true', required=False)
     parser.add_argument("-c", "--capture_info", help="Show capture file properties.",
                         action='store_true', required=False)
+    parser.add_argument("-s", "--flow_statistics", help="Show UDP and ICMP conversations and IPv6 endpoints.",
+                        action='store_true', required=False)
     parser.add_argument("-q", "--quiet", help="Do not print any information",
                         action='store_true', required=False)
+    parser.add_argument("--concurrent", help="Run all tools concurrently.",
+                        action='store_true', required=False)
+    parser.add_argument("-b", "--batch", help="JSON manifest with list of jobs (input).",
+                        type=argparse.FileType('r'), required=False)
+    parser.add_argument("-j", "--jobs", help="Number of worker processes used in batch mode.",
+                        type=int, required=False, default=multiprocessing.cpu_count())
     args = parser.parse_args()
 
+    if not args.batch and not args.filename:
+        parser.error("argument -f/--filename is required without -b/--batch")
+
     if not check_requirements():
         print("[error] Script requirements not satisfied. Please install \"tshark\" and \"capinfos\" tools!")
         sys.exit(1)
 
-    if args.tcp_conversations:
-        tcp_conversations = get_tcp_conversations(args.filename, args.quiet)
-        print(json.dumps(tcp_conversations))
-
-    if args.pairs_mac_ip:
-        mac_ip_pairs = get_mac_ip_pairs(args.filename, args.quiet)
-        print(json.dumps(mac_ip_pairs))
-
-    if args.capture_info:
-        capture_info = get_capture_file_properties(args.filename, args.quiet)
-        print(json.dumps(capture_info))
+    if args.batch:
+        try:
+            batch_jobs = json.load(args.batch)
+        except ValueError as exc:
+            print("[error] JSON manifest not correctly loaded: " + str(exc))
+            sys.exit(1)
+
+        batch_options = dict(
+            tcp_conversations=args.tcp_conversations, pairs_mac_ip=args.pairs_mac_ip,
+            capture_info=args.capture_info, flow_statistics=args.flow_statistics, concurrent=args.concurrent,
+        )
+        sys.exit(0 if analyze_batch(batch_jobs, batch_options, args.jobs) else 2)
+
+    analyses = create_analyses(
+        args.filename, args.tcp_conversations, args.pairs_mac_ip, args.capture_info, args.flow_statistics
+    )
+    for result in run_analyses([analysis for _, analysis in analyses], args.quiet, args.concurrent):
+        print(json.dumps(result))
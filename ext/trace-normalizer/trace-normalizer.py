@@ -36,17 +36,21 @@
 Script facilitating packet trace normalization. Enables to easily change IP and MAC addresses, and reset capture
 start time to zero.
 
-Due to the tcprewrite and bittwiste, the sciprt converts given capture file to PCAP format and
-at the end back to PCAP-Ng format.
+Due to the tcprewrite and MAC addresses rewriting, the sciprt converts given capture file to PCAP format if IP or MAC
+addresses are changed. Output is written in format given by "output_format" configuration option (pcap or pcapng, default
+pcapng), conversions are made only if they are needed.
 
 Requirements:
     * tcprewrite
     * editcap
-    * bittwiste
     * Python 3
 
 Usage:
     $ ./trace-normalizer.py -i <input_capture_file> -o <output_capture_file> -c <configuration_json>
+    $ ./trace-normalizer.py -b <manifest_json> [-j <number_of_workers>]
+
+Batch manifest is JSON list of jobs {"input": <input_capture_file>, "output": <output_capture_file>,
+"configuration": <configuration>}, one JSON result line is printed for every job.
 """
 
 # Common python modules
@@ -57,6 +61,11 @@ import subprocess  # Executes commands in shell
 import shlex  # Split the string s using shell-like syntax
 import shutil  # Copy files and directory trees
 import json  # JSON processing functions
+import struct  # Packing of binary PCAP headers
+import io  # In-memory text streams
+import tempfile  # Unique temporary files
+import contextlib  # Redirection of standard output
+import multiprocessing  # Worker pool for batch mode
 from distutils.spawn import find_executable  # Check if required tool is available in PATH
 
 
@@ -66,7 +75,7 @@ def check_requirements():
 
     :return: True if all tools are available, False otherwise
     """
-    for tool in ["tcprewrite", "editcap", "bittwiste"]:
+    for tool in ["tcprewrite", "editcap"]:
         if not find_executable(tool):
             return False
     return True
@@ -92,6 +101,45 @@ def run_command(command, quiet):
         return stdout
 
 
+# Magic numbers of capture file formats
+CAPTURE_FORMATS = {
+    b"\x0a\x0d\x0d\x0a": "pcapng",
+    b"\xd4\xc3\xb2\xa1": "pcap",
+    b"\xa1\xb2\xc3\xd4": "pcap",
+    b"\x4d\x3c\xb2\xa1": "pcap",
+    b"\xa1\xb2\x3c\x4d": "pcap",
+}
+
+
+def get_capture_format(filename):
+    """
+    Detect format of given capture file.
+
+    :param filename: capture file
+    :return: "pcap", "pcapng" or None if format is unknown (e.g. compressed file)
+    """
+    try:
+        with open(filename, "rb") as capture_file:
+            return CAPTURE_FORMATS.get(capture_file.read(4))
+    except IOError:
+        return None
+
+
+def convert(input_file, output_file, output_format, quiet):
+    """
+    Converts given input file to given format and store it in the output_file.
+
+    :param input_file: capture file to convert
+    :param output_file: output file path
+    :param output_format: pcap or pcapng
+    :param quiet: set to true to not print any information output
+    """
+    command = "editcap -F {output_format} {input_file} {output_file}".format(
+        output_format=output_format, input_file=input_file, output_file=output_file
+    )
+    run_command(command, quiet)
+
+
 def convert_to_pcap(input_file, output_file, quiet):
     """
     Converts given input file to PCAP format and store it in the output_file.
@@ -100,8 +148,7 @@ def convert_to_pcap(input_file, output_file, quiet):
     :param output_file: output file path
     :param quiet: set to true to not print any information output
     """
-    command = "editcap -F pcap {input_file} {output_file}".format(input_file=input_file, output_file=output_file)
-    run_command(command, quiet)
+    convert(input_file, output_file, "pcap", quiet)
 
 
 def convert_to_pcapng(input_file, output_file, quiet):
@@ -112,11 +159,10 @@ def convert_to_pcapng(input_file, output_file, quiet):
     :param output_file: output file path
     :param quiet: set to true to not print any information output
     """
-    command = "editcap -F pcapng {input_file} {output_file}".format(input_file=input_file, output_file=output_file)
-    run_command(command, quiet)
+    convert(input_file, output_file, "pcapng", quiet)
 
 
-def reset_timestamp(input_file, output_file, configuration, quiet):
+def reset_timestamp(input_file, output_file, configuration, quiet, output_format="pcapng"):
     """
     Reset timestamp to zero epoch time in given input file and writes result to the output_file.
 
@@ -124,9 +170,11 @@ def reset_timestamp(input_file, output_file, configuration, quiet):
     :param output_file: temporary output file path
     :param configuration: parsed script configuration
     :param quiet: set to true to not print any information output
+    :param output_format: format of output_file (pcap or pcapng)
     """
-    command = "editcap -t -{timestamp} {input_file} {output_file}".format(
-        timestamp=configuration["timestamp"], input_file=input_file, output_file=output_file
+    command = "editcap -F {output_format} -t -{timestamp} {input_file} {output_file}".format(
+        output_format=output_format, timestamp=configuration["timestamp"], input_file=input_file,
+        output_file=output_file
     )
     run_command(command, quiet)
 
@@ -151,87 +199,207 @@ def normalize_ip_addresses(input_file, output_file, configuration, quiet):
     run_command(command, quiet)
 
 
+# Magic numbers of PCAP files in little endian byte order
+PCAP_MAGIC_LITTLE_ENDIAN = (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1")
+
+LINKTYPE_ETHERNET = 1
+
+BUFFER_SIZE = 1024 * 1024
+
+
+def parse_mac_address(address):
+    """
+    :param address: MAC address string e.g. 08:00:27:bd:c2:37
+    :return: 6 bytes of MAC address
+    """
+    return bytes.fromhex(address.replace(":", "").replace("-", ""))
+
+
 def normalize_mac_addresses(input_file, output_file, configuration, quiet):
     """
     Change MAC addresses based on given configuration and writes result to the output_file.
 
-    (Bittwiste tool can change only one MAC address in its run.)
+    All mappings are applied in one pass over PCAP file, source and destination address of every ethernet frame
+    is looked up in mapping table.
 
-    :param input_file: temporary capture file to normalize
+    :param input_file: temporary capture file in PCAP format to normalize
     :param output_file: temporary output file path
     :param configuration: parsed script configuration
     :param quiet: set to true to not print any information output
     """
-    # Handlers for a current output files
-    tmp_input = input_file
-    tmp_output = output_file
+    mapping = {
+        parse_mac_address(m["original"]): parse_mac_address(m["new"]) for m in configuration["MAC"]
+    }
+    if not quiet:
+        print("[info] Rewriting {} MAC addresses in {}".format(len(mapping), input_file))
+
+    with open(input_file, "rb", BUFFER_SIZE) as f_in, open(output_file, "wb", BUFFER_SIZE) as f_out:
+        header = f_in.read(24)
+        if len(header) < 24:
+            print("[error] File {} is not valid PCAP file".format(input_file))
+            return
+        f_out.write(header)
+
+        endian = "<" if header[:4] in PCAP_MAGIC_LITTLE_ENDIAN else ">"
+        link_type = struct.unpack(endian + "I", header[20:24])[0] & 0xffff
+        record_header = struct.Struct(endian + "IIII")
+
+        while True:
+            record = f_in.read(16)
+            if len(record) < 16:
+                break
+            data = f_in.read(record_header.unpack(record)[2])
+
+            if link_type == LINKTYPE_ETHERNET and len(data) >= 12:
+                dst = mapping.get(data[0:6])
+                src = mapping.get(data[6:12])
+                if dst or src:
+                    data = (dst or data[0:6]) + (src or data[6:12]) + data[12:]
+
+            f_out.write(record)
+            f_out.write(data)
+
+
+def normalize(input_file, output_file, configuration, quiet):
+    """
+    Normalize given capture file based on configuration.
+
+    Temporary capture files are unique, so more files can be normalized at once.
+
+    :param input_file: capture file to normalize
+    :param output_file: filename for a normalized capture
+    :param configuration: parsed script configuration
+    :param quiet: set to true to not print any information output
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="normalizer_")
+    tmp_capture_in = os.path.join(tmp_dir, "capture_in.pcap")
+    tmp_capture_out = os.path.join(tmp_dir, "capture_out.pcap")
+
+    output_format = configuration.get("output_format", "pcapng")
+    # PCAP format is required by tcprewrite and MAC addresses rewriting
+    rewrite_addresses = "IP" in configuration or "MAC" in configuration
 
-    for mapping in configuration["MAC"]:
-        command = "bittwiste -I {input_file} -O {output_file} -T eth -s {original},{new} -d {original},{new}".format(
-            input_file=tmp_input, output_file=tmp_output, original=mapping["original"], new=mapping["new"]
-        )
-        run_command(command, quiet)
-        # Switch output file handlers
-        tmp_input, tmp_output = tmp_output, tmp_input
+    current_file = input_file
+    current_format = get_capture_format(input_file)
 
-    # Copy last temporary file to output_file if it is not specified output_file
-    if tmp_input != output_file:
-        shutil.copy2(tmp_input, output_file)
+    try:
+        if "timestamp" in configuration:
+            if not quiet:
+                print("[info] Starting trace normalization...")
+            current_format = "pcap" if rewrite_addresses else output_format
+            reset_timestamp(current_file, tmp_capture_out, configuration, quiet, current_format)
+            os.rename(tmp_capture_out, tmp_capture_in)
+            current_file = tmp_capture_in
+
+        if rewrite_addresses and current_format != "pcap":
+            if not quiet:
+                print("[info] Converting input file to PCAP format...")
+            convert_to_pcap(current_file, tmp_capture_out, quiet)
+            os.rename(tmp_capture_out, tmp_capture_in)
+            current_file, current_format = tmp_capture_in, "pcap"
+
+        if "IP" in configuration:
+            if not quiet:
+                print("[info] Starting IP addresses normalization...")
+            normalize_ip_addresses(current_file, tmp_capture_out, configuration, quiet)
+            os.rename(tmp_capture_out, tmp_capture_in)
+            current_file = tmp_capture_in
+
+        if "MAC" in configuration:
+            if not quiet:
+                print("[info] Starting MAC addresses normalization...")
+            normalize_mac_addresses(current_file, tmp_capture_out, configuration, quiet)
+            os.rename(tmp_capture_out, tmp_capture_in)
+            current_file = tmp_capture_in
+
+        if current_format != output_format:
+            if not quiet:
+                print("[info] Converting output file to {} format...".format(output_format))
+            convert(current_file, output_file, output_format, quiet)
+        elif current_file == input_file:
+            shutil.copyfile(input_file, output_file)
+        else:
+            shutil.move(current_file, output_file)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if not quiet:
+        print("[info] Trace file normalized!")
+
+
+def normalize_job(job):
+    """
+    Normalize one job of batch manifest, information output is captured and returned in result.
+
+    :param job: dictionary with input, output and configuration
+    :return: dictionary with input, output, success and log
+    """
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            normalize(job["input"], job["output"], job.get("configuration", {}), True)
+        success = "[error]" not in log.getvalue() and os.path.exists(job["output"])
+    except Exception as exc:
+        log.write("[error] " + str(exc))
+        success = False
+
+    return {"input": job["input"], "output": job["output"], "success": success, "log": log.getvalue()}
+
+
+def normalize_batch(jobs, workers):
+    """
+    Normalize all jobs of batch manifest by pool of workers and print one JSON result line per job.
+
+    :param jobs: list of dictionaries with input, output and configuration
+    :param workers: number of worker processes
+    :return: True if all jobs succeeded
+    """
+    success = True
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap(normalize_job, jobs):
+            success = success and result["success"]
+            print(json.dumps(result), flush=True)
+    return success
 
 
 if __name__ == "__main__":
     # Argument parser automatically creates -h argument
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input_file", help="Capture filename to normalize.", type=str, required=True)
-    parser.add_argument("-o", "--output_file", help="Filename for a normalized capture.", type=str, required=True)
+    parser.add_argument("-i", "--input_file", help="Capture filename to normalize.", type=str, required=False)
+    parser.add_argument("-o", "--output_file", help="Filename for a normalized capture.", type=str, required=False)
     parser.add_argument("-c", "--configuration", help="Configuration JSON with mapping of IP and MAC addresses.",
-                        type=argparse.FileType('r'), required=False, default="./trace-normalizer.json")
+                        type=argparse.FileType('r'), required=False)
+    parser.add_argument("-b", "--batch", help="JSON manifest with list of jobs (input, output, configuration).",
+                        type=argparse.FileType('r'), required=False)
+    parser.add_argument("-j", "--jobs", help="Number of worker processes used in batch mode.",
+                        type=int, required=False, default=multiprocessing.cpu_count())
     parser.add_argument("-q", "--quiet", help="Do not print any information", action='store_true', required=False)
     args = parser.parse_args()
 
+    if not args.batch and not (args.input_file and args.output_file):
+        parser.error("arguments -i/--input_file and -o/--output_file are required without -b/--batch")
+
     if not check_requirements():
-        print("[error] Requirements missing, install \"tcprewrite\", \"editcap\", and \"bittwiste\" tools!")
+        print("[error] Requirements missing, install \"tcprewrite\" and \"editcap\" tools!")
         sys.exit(1)
 
+    if args.batch:
+        try:
+            batch_jobs = json.load(args.batch)
+        except ValueError as exc:
+            print("[error] JSON manifest not correctly loaded: " + str(exc))
+            sys.exit(1)
+
+        sys.exit(0 if normalize_batch(batch_jobs, args.jobs) else 2)
+
     try:
-        configuration = json.load(args.configuration)
-    except ValueError as exc:
+        if args.configuration:
+            configuration = json.load(args.configuration)
+        else:
+            with open("./trace-normalizer.json") as configuration_file:
+                configuration = json.load(configuration_file)
+    except (OSError, ValueError) as exc:
         print("[error] JSON configuration not correctly loaded: " + str(exc))
         sys.exit(1)
 
-    # Define names for temporary capture files
-    tmp_capture_in = "normalizer_tmp_capture_in.pcap"
-    tmp_capture_out = "normalizer_tmp_capture_out.pcap"
-
-    # PCAP format is required by tcprewrite and bittwiste tools
-    if not args.quiet:
-        print("[info] Converting input file to PCAP format...")
-    convert_to_pcap(args.input_file, tmp_capture_out, args.quiet)
-    os.rename(tmp_capture_out, tmp_capture_in)
-
-    if "timestamp" in configuration:
-        if not args.quiet:
-            print("[info] Starting trace normalization...")
-        reset_timestamp(tmp_capture_in, tmp_capture_out, configuration, args.quiet)
-        os.rename(tmp_capture_out, tmp_capture_in)
-
-    if "IP" in configuration:
-        if not args.quiet:
-            print("[info] Starting IP addresses normalization...")
-        normalize_ip_addresses(tmp_capture_in, tmp_capture_out, configuration, args.quiet)
-        os.rename(tmp_capture_out, tmp_capture_in)
-
-    if "MAC" in configuration:
-        if not args.quiet:
-            print("[info] Starting MAC addresses normalization...")
-        normalize_mac_addresses(tmp_capture_in, tmp_capture_out, configuration, args.quiet)
-        os.rename(tmp_capture_out, tmp_capture_in)
-
-    if not args.quiet:
-        print("[info] Converting output file to PCAP-Ng format...")
-    convert_to_pcapng(tmp_capture_in, args.output_file, args.quiet)
-
-    os.remove(tmp_capture_in)
-
-    if not args.quiet:
-        print("[info] Trace file normalized!")
+    normalize(args.input_file, args.output_file, configuration, args.quiet)
@@ -6,7 +6,14 @@ from traces_api.config import Config
 
 
 @pytest.fixture
-def app(sqlalchemy_session, sqlalchemy_engine, config):
+def trace_tools_backend(config):
+    return config.get("trace_tools", "backend")
+
+
+@pytest.fixture
+def app(sqlalchemy_session, sqlalchemy_engine, config, trace_tools_backend):
+    # Tests can run against specific backend by parametrizing trace_tools_backend
+    config.config["trace_tools"]["backend"] = trace_tools_backend
     app = FlaskApp(sqlalchemy_session, sqlalchemy_engine, config).create_app()
     return app
 
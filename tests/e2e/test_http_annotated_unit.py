@@ -1,4 +1,7 @@
+import gzip
+import pytest
 from .conftest import create_ann_unit
+from traces_api.pcap.reader import PcapReader
 
 
 def test_get_ann_unit(client, id_ann_unit1):
@@ -15,6 +18,11 @@ def test_get_ann_unit(client, id_ann_unit1):
     assert set(r.json["labels"]) == {"important", "second_label"}
     assert r.json["ip_details"] == {'intermediate_nodes': ['172.16.0.0'], 'source_nodes': ['172.16.0.0'], 'target_nodes': ['172.16.0.0']}
     assert r.json["creation_time"]
+    assert r.json["stats"].get("tcp_conversations") is None
+
+    r = client.get("/annotated_unit/%s/conversations" % id_ann_unit1)
+    assert r.status_code == 200
+    assert r.json["total"] == 61
 
 
 def test_get_ann_unit_invalid_id(client, id_ann_unit1):
@@ -38,6 +46,80 @@ def test_download_ann_unit_invalid_id(client, id_ann_unit1):
     assert r.status_code == 404
 
 
+def test_download_ann_unit_encoding(client, id_ann_unit1):
+    r = client.get("/annotated_unit/%s/download" % id_ann_unit1, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.headers["Vary"] == "Accept-Encoding"
+    assert len(list(PcapReader(gzip.decompress(r.data)))) > 0
+
+    r = client.get("/annotated_unit/%s/download" % id_ann_unit1)
+    assert r.status_code == 200
+    assert "Content-Encoding" not in r.headers
+    assert len(list(PcapReader(r.data))) > 0
+
+
+@pytest.mark.parametrize("trace_tools_backend", ["docker", "native"])
+def test_download_ann_unit_time_range(client, id_ann_unit1):
+    # Time range is derived from stored packets, their timestamps depend on normalization
+    r = client.get("/annotated_unit/%s/download" % id_ann_unit1)
+    times = sorted(p.time for p in PcapReader(r.data))
+    start, end = times[0], times[len(times) // 2]
+
+    r = client.get("/annotated_unit/%s/download?from=%r&to=%r" % (id_ann_unit1, start, end))
+    assert r.status_code == 200
+    selected = [p.time for p in PcapReader(r.data)]
+    assert 0 < len(selected) < len(times)
+    assert all(start - 0.000001 <= t <= end + 0.000001 for t in selected)
+
+    r = client.get("/annotated_unit/%s/download?to=%r" % (id_ann_unit1, start - 1))
+    assert r.status_code == 200
+    assert len(list(PcapReader(r.data))) == 0
+
+
+def test_download_ann_unit_filter(client, id_ann_unit1):
+    r = client.get("/annotated_unit/%s/download?filter=tcp" % id_ann_unit1)
+    assert r.status_code == 200
+    assert len(list(PcapReader(r.data))) > 0
+
+    r = client.get("/annotated_unit/%s/download?filter=udp and port 53" % id_ann_unit1)
+    assert r.status_code == 200
+    assert len(list(PcapReader(r.data))) == 0
+
+    r = client.get("/annotated_unit/%s/download?filter=host 10.0" % id_ann_unit1)
+    assert r.status_code == 400
+
+
+def test_ann_unit_packets(client, id_ann_unit1):
+    r = client.get("/annotated_unit/%s/packets?offset=1&limit=2" % id_ann_unit1)
+    assert r.status_code == 200
+    assert [p["number"] for p in r.json["data"]] == [1, 2]
+
+    r = client.get("/annotated_unit/%s/packets" % 456325)
+    assert r.status_code == 404
+
+
+def test_ann_unit_conversations(client, id_ann_unit1):
+    r = client.get("/annotated_unit/%s/conversations?limit=5&sort_by=frames&order=desc" % id_ann_unit1)
+    assert r.status_code == 200
+    assert r.json["total"] == 61
+    frames = [c["Frames"] for c in r.json["data"]]
+    assert len(frames) == 5
+    assert frames == sorted(frames, reverse=True)
+
+    r = client.get("/annotated_unit/%s/conversations?sort_by=unknown" % id_ann_unit1)
+    assert r.status_code == 400
+
+
+@pytest.mark.parametrize("trace_tools_backend", ["docker", "native"])
+def test_ann_unit_timeseries(client, id_ann_unit1):
+    for resolution in (0.5, 100000):
+        r = client.get("/annotated_unit/%s/timeseries?resolution=%s" % (id_ann_unit1, resolution))
+        assert r.status_code == 200
+        assert r.json["resolution"] >= resolution
+        assert sum(r.json["packets"]) == 2486
+
+
 def test_delete_ann_unit(client, id_ann_unit1):
     r = client.delete(
         "/annotated_unit/%s/delete" % id_ann_unit1
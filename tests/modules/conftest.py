@@ -9,7 +9,7 @@ from traces_api.modules.unit.service import Mapping, IPDetails
 from traces_api.modules.annotated_unit.service import AnnotatedUnitService
 from traces_api.modules.unit.service import UnitService
 
-from traces_api.storage import FileStorage
+from traces_api.storage import ContentAddressedStorage
 from traces_api.trace_tools import TraceNormalizer, TraceAnalyzer
 from traces_api.compression import Compression
 
@@ -19,14 +19,14 @@ APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/../.."
 
 @pytest.fixture()
 def service_annotated_unit(sqlalchemy_session):
-    return AnnotatedUnitService(sqlalchemy_session, FileStorage(storage_folder="{}/storage/ann_units".format(APP_DIR), compression=Compression()), TraceAnalyzer(), TraceNormalizer())
+    return AnnotatedUnitService(sqlalchemy_session, ContentAddressedStorage(storage_folder="{}/storage/ann_units".format(APP_DIR), compression=Compression(), session_maker=sqlalchemy_session, name="ann_units"), TraceAnalyzer(), TraceNormalizer())
 
 
 @pytest.fixture()
 def service_unit(sqlalchemy_session, service_annotated_unit):
     analyzer = mock.Mock()
     analyzer.analyze.return_value = {}
-    return UnitService(sqlalchemy_session, service_annotated_unit, FileStorage(storage_folder="{}/storage/units".format(APP_DIR), compression=Compression(), subdirectories=False), TraceAnalyzer())
+    return UnitService(sqlalchemy_session, service_annotated_unit, ContentAddressedStorage(storage_folder="{}/storage/units".format(APP_DIR), compression=Compression(), session_maker=sqlalchemy_session, name="units", subdirectories=False), TraceAnalyzer())
 
 
 @pytest.fixture()
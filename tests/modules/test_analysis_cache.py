@@ -0,0 +1,69 @@
+import werkzeug.datastructures
+from io import BytesIO
+from unittest import mock
+
+from traces_api.analysis_cache import AnalysisCache, file_digest
+from traces_api.compression import Compression
+from traces_api.storage import ContentAddressedStorage
+from traces_api.trace_tools import NativeTraceAnalyzer
+from traces_api.modules.unit.service import UnitService
+
+
+def create_analyzer(version="1"):
+    analyzer = mock.Mock()
+    analyzer.VERSION = version
+    analyzer.analyze.side_effect = lambda location: dict(location=location)
+    return analyzer
+
+
+def test_analyze_cached(sqlalchemy_session):
+    cache = AnalysisCache(sqlalchemy_session)
+    analyzer = create_analyzer()
+
+    assert cache.analyze(analyzer, "tests/fixtures/hydra-1_tasks.pcap") == dict(location="tests/fixtures/hydra-1_tasks.pcap")
+    assert cache.analyze(analyzer, "tests/fixtures/hydra-1_tasks.pcap") == dict(location="tests/fixtures/hydra-1_tasks.pcap")
+    assert analyzer.analyze.call_count == 1
+
+    # New version of analyzer does not use analyses of previous version
+    cache.analyze(create_analyzer("2"), "tests/fixtures/hydra-1_tasks.pcap")
+    assert cache.get(file_digest("tests/fixtures/hydra-1_tasks.pcap"), "2") is not None
+
+
+def test_file_digest_compressed(tmpdir):
+    compressed_file = str(tmpdir.join("hydra.pcap.gz"))
+    Compression().compress_file("tests/fixtures/hydra-1_tasks.pcap", compressed_file)
+
+    assert file_digest(compressed_file) == file_digest("tests/fixtures/hydra-1_tasks.pcap")
+
+
+def test_eviction(sqlalchemy_session):
+    cache = AnalysisCache(sqlalchemy_session, max_size=100)
+
+    cache.put("a" * 64, "1", dict(data="x" * 30))
+    cache.put("b" * 64, "1", dict(data="x" * 30))
+    assert cache.get("a" * 64, "1") is not None
+
+    # Least recently used analysis is evicted
+    cache.put("c" * 64, "1", dict(data="x" * 30))
+    assert cache.get("a" * 64, "1") is not None
+    assert cache.get("b" * 64, "1") is None
+    assert cache.get("c" * 64, "1") is not None
+
+    # Analysis bigger than cache is not stored
+    cache.put("d" * 64, "1", dict(data="x" * 200))
+    assert cache.get("d" * 64, "1") is None
+
+
+def test_stream_analysis_cached(sqlalchemy_session, service_annotated_unit, file_hydra_1_binary, tmpdir):
+    cache = AnalysisCache(sqlalchemy_session)
+    analyzer = NativeTraceAnalyzer()
+    storage = ContentAddressedStorage(str(tmpdir), Compression(), sqlalchemy_session, "units", subdirectories=False)
+    service = UnitService(sqlalchemy_session, service_annotated_unit, storage, analyzer, cache)
+
+    file = werkzeug.datastructures.FileStorage(stream=BytesIO(file_hydra_1_binary), filename="file.pcap")
+    unit, analyzed_data = service.unit_upload(file)
+
+    # Analysis computed while upload was saved is available to analyses of saved files
+    cached = cache.get(storage.get_digest(unit.uploaded_file_location), analyzer.VERSION)
+    assert cached is not None
+    assert cached["tcp_conversations"] == analyzed_data["tcp_conversations"]
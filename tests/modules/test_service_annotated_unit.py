@@ -1,6 +1,8 @@
+import json
 import pytest
 
 from traces_api.modules.annotated_unit.service import AnnotatedUnitDoesntExistsException, OperatorEnum
+from traces_api.database.tools import migrate_annotated_unit_conversations
 from .conftest import create_ann_unit
 
 
@@ -27,6 +29,64 @@ def test_download_invalid_id(service_annotated_unit):
         service_annotated_unit.download_annotated_unit(1221212)
 
 
+def test_packets(service_annotated_unit, ann_unit1):
+    packets = service_annotated_unit.get_annotated_unit_packets(ann_unit1.id_annotated_unit, offset=2, limit=5)
+
+    assert [p["number"] for p in packets] == [2, 3, 4, 5, 6]
+    assert all(p["ip_src"] and p["protocol"] for p in packets)
+
+
+def test_conversations(service_annotated_unit, ann_unit1):
+    total, conversations = service_annotated_unit.get_annotated_unit_conversations(ann_unit1.id_annotated_unit, limit=10)
+    assert total == 61
+    assert len(conversations) == 10
+    ann_unit = service_annotated_unit.get_annotated_unit(ann_unit1.id_annotated_unit)
+    assert "tcp_conversations" not in ann_unit.dict()["stats"]
+    assert len([c for c in ann_unit.conversations if c.protocol == "tcp"]) == 61
+
+    total, conversations = service_annotated_unit.get_annotated_unit_conversations(
+        ann_unit1.id_annotated_unit, port=22, sort_by="bytes", descending=True
+    )
+    assert total == 61
+    assert [c.bytes for c in conversations] == sorted((c.bytes for c in conversations), reverse=True)
+
+    total, conversations = service_annotated_unit.get_annotated_unit_conversations(ann_unit1.id_annotated_unit, port=1)
+    assert (total, conversations) == (0, [])
+
+
+def test_conversations_migrated_from_stats(service_annotated_unit, ann_unit1, sqlalchemy_engine):
+    ann_unit = service_annotated_unit.get_annotated_unit(ann_unit1.id_annotated_unit)
+    conversations = [c.dict() for c in ann_unit.conversations if c.protocol == "tcp"]
+
+    # Annotated unit created before conversation table existed
+    stats = json.loads(ann_unit.stats)
+    stats["tcp_conversations"] = conversations
+    ann_unit.stats = json.dumps(stats)
+    ann_unit.conversations = []
+    service_annotated_unit._session.commit()
+
+    migrate_annotated_unit_conversations(sqlalchemy_engine)
+    service_annotated_unit._session.expire_all()
+
+    total, _ = service_annotated_unit.get_annotated_unit_conversations(ann_unit1.id_annotated_unit)
+    assert total == 61
+    ann_unit = service_annotated_unit.get_annotated_unit(ann_unit1.id_annotated_unit)
+    assert "tcp_conversations" not in json.loads(ann_unit.stats)
+    assert [c.dict() for c in ann_unit.conversations if c.protocol == "tcp"] == conversations
+
+
+def test_timeseries(service_annotated_unit, ann_unit1):
+    timeseries = service_annotated_unit.get_annotated_unit_timeseries(ann_unit1.id_annotated_unit, resolution=1)
+    assert timeseries["resolution"] >= 1
+    assert sum(timeseries["packets"]) == 2486
+    assert len(timeseries["packets"]) == len(timeseries["bytes"])
+
+
+def test_conversations_invalid_id(service_annotated_unit):
+    with pytest.raises(AnnotatedUnitDoesntExistsException):
+        service_annotated_unit.get_annotated_unit_conversations(1221212)
+
+
 def test_delete(service_annotated_unit, ann_unit1):
     unit2 = service_annotated_unit.get_annotated_unit(ann_unit1.id_annotated_unit)
     assert unit2
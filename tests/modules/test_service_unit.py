@@ -1,7 +1,10 @@
+import os
 import pytest
+import hashlib
 from io import BytesIO
 
 from traces_api.modules.unit.service import UnitDoesntExistsException, Mapping, IPDetails, IPDetailsUnknownIPException
+from traces_api.trace_tools import TraceAnalyzerError
 
 import werkzeug.datastructures
 
@@ -50,6 +53,37 @@ def test_delete(service_unit):
     assert service_unit._get_unit(unit1.id_unit) is None
 
 
+def test_unit_upload_deduplicated(service_unit, file_hydra_1_binary):
+    units = []
+    for _ in range(2):
+        file = werkzeug.datastructures.FileStorage(stream=BytesIO(file_hydra_1_binary), content_type="application/vnd.tcpdump.pcap", filename="file.pcap")
+        unit, _ = service_unit.unit_upload(file)
+        units.append(unit)
+
+    assert units[0].id_unit != units[1].id_unit
+    assert units[0].uploaded_file_location == units[1].uploaded_file_location
+    file_location = service_unit._file_storage.get_file(units[0].uploaded_file_location).location
+
+    service_unit.unit_delete(units[0].id_unit)
+    assert os.path.exists(file_location)
+
+    service_unit.unit_delete(units[1].id_unit)
+    assert not os.path.exists(file_location)
+
+
+def test_unit_upload_failed_releases_file(service_unit, file_hydra_1_binary, monkeypatch):
+    def analyze(location):
+        raise TraceAnalyzerError("Analysis failed")
+
+    monkeypatch.setattr(service_unit._trace_analyzer, "analyze", analyze)
+    file = werkzeug.datastructures.FileStorage(stream=BytesIO(file_hydra_1_binary), content_type="application/vnd.tcpdump.pcap", filename="file.pcap")
+    with pytest.raises(TraceAnalyzerError):
+        service_unit.unit_upload(file)
+
+    file_name = "%s.pcap.gz" % hashlib.sha256(file_hydra_1_binary).hexdigest()
+    assert not os.path.exists(service_unit._file_storage.get_file(file_name).location)
+
+
 def test_delete_invalid_id(service_unit):
     with pytest.raises(UnitDoesntExistsException):
         service_unit.unit_delete(123456)
@@ -1,7 +1,23 @@
-from traces_api.compression import Compression
+from traces_api.compression import Compression, IndexedCompression, create_compression
+from traces_api.pcap.codecs import Codec, get_codec, iter_decompressed, CODECS
+from traces_api.pcap.reader import open_capture
+from traces_api.pcap.analyzer import StreamAnalysis, analyze_capture
+from traces_api.storage import FileStorage
+from traces_api.pcap.index import PacketIndex, INDEX_SUFFIX, compress_indexed, iter_blocks, BGZF_BLOCK_SIZE, BGZF_EOF
+from traces_api.pcap import index as pcap_index
+from traces_api.pcap.timeseries import load_timeseries, TIMESERIES_SUFFIX
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import os
+import gzip
+import zlib
+import struct
 import uuid
+import pytest
 import tempfile
 
+AVAILABLE_CODECS = [codec.name for codec in CODECS if codec.is_available()]
+
 
 def create_empty_file():
     random_file_path = "/tmp/trace_api_%s" % str(uuid.uuid4())
@@ -32,3 +48,200 @@ def test_compression():
     decompressed_file = create_empty_file()
     gzip.decompress_file(compressed_file, decompressed_file)
     assert read_file(decompressed_file) == b"TEST INPUT"
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_indexed_compression(threads):
+    with open("tests/fixtures/hydra-1_tasks.pcap", "rb") as f:
+        data = f.read()
+
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/hydra.pcapng.gz"
+        IndexedCompression(interval=100, threads=threads).compress(BytesIO(data), compressed_file)
+
+        with gzip.open(compressed_file, "rb") as f:
+            assert f.read() == data
+
+        index = PacketIndex.load(compressed_file + INDEX_SUFFIX)
+        timeseries = load_timeseries(compressed_file + TIMESERIES_SUFFIX)
+        compressed = read_file(compressed_file)
+
+    assert sum(timeseries[0].packets) == 2486
+
+    assert index.packet_count == 2486
+    assert len(index) == 25
+    assert list(index.packets[:3]) == [0, 100, 200]
+    assert index.uncompressed_size == len(data)
+    assert index.compressed_size == len(compressed)
+    assert not index.ordered
+
+    # Every block is gzip member that starts with its first packet
+    for block in range(len(index)):
+        position, end_position, offset, end_offset = index.block_range(block)
+        assert zlib.decompress(compressed[position:end_position], 31) == data[offset:end_offset]
+        assert index.min_timestamps[block] <= index.max_timestamps[block]
+
+
+@pytest.mark.parametrize("file, interval", [("medusa-1_tasks.pcap", 100000), ("medusa-1_tasks.pcap", 1000), ("README.md", 100)])
+def test_parallel_compression(file, interval):
+    with open("tests/fixtures/" + file, "rb") as f:
+        data = f.read()
+
+    serial, parallel = BytesIO(), BytesIO()
+    serial_index = compress_indexed(BytesIO(data), serial, interval, level=6)
+    with ThreadPoolExecutor(4) as executor:
+        parallel_index = compress_indexed(BytesIO(data), parallel, interval, level=6, executor=executor)
+
+    assert gzip.decompress(parallel.getvalue()) == data
+    # Blocks are primed by previous data, so compression ratio is close to serial compression
+    assert len(parallel.getvalue()) < len(serial.getvalue()) * 1.05
+
+    if serial_index is None:
+        assert parallel_index is None
+        return
+
+    assert list(parallel_index.packets) == list(serial_index.packets)
+    assert list(parallel_index.offsets) == list(serial_index.offsets)
+    assert parallel_index.compressed_size == len(parallel.getvalue())
+    for block in range(len(parallel_index)):
+        position, end_position, offset, end_offset = parallel_index.block_range(block)
+        assert zlib.decompress(parallel.getvalue()[position:end_position], 31) == data[offset:end_offset]
+
+
+def test_indexed_compression_not_capture():
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/file.gz"
+        IndexedCompression().compress([b"TEST ", b"INPUT"], compressed_file)
+
+        with gzip.open(compressed_file, "rb") as f:
+            assert f.read() == b"TEST INPUT"
+        assert not os.path.exists(compressed_file + INDEX_SUFFIX)
+        assert not os.path.exists(compressed_file + TIMESERIES_SUFFIX)
+
+
+def test_codec_is_abstract():
+    with pytest.raises(TypeError):
+        Codec()
+
+
+@pytest.mark.parametrize("name", AVAILABLE_CODECS)
+def test_codec_compression(name):
+    compression = Compression(get_codec(name, 1))
+
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/file." + compression.extension
+        compression.compress([b"TEST ", b"INPUT" * 1000], compressed_file)
+        assert read_file(compressed_file) != b"TEST " + b"INPUT" * 1000
+
+        decompressed_file = directory + "/file"
+        Compression.decompress_file(compressed_file, decompressed_file)
+        assert read_file(decompressed_file) == b"TEST " + b"INPUT" * 1000
+
+
+@pytest.mark.parametrize("name", AVAILABLE_CODECS)
+def test_iter_decompressed(name):
+    compression = Compression(get_codec(name, 1))
+
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/file." + compression.extension
+        compression.compress([b"TEST ", b"INPUT" * 1000], compressed_file)
+
+        chunks = list(iter_decompressed(compressed_file, chunk_size=1000))
+        assert all(len(chunk) <= 1000 for chunk in chunks)
+        assert b"".join(chunks) == b"TEST " + b"INPUT" * 1000
+
+    assert b"".join(iter_decompressed("tests/fixtures/hydra-1_tasks.pcap")) == read_file(
+        "tests/fixtures/hydra-1_tasks.pcap"
+    )
+
+
+@pytest.mark.parametrize("name", AVAILABLE_CODECS)
+def test_codec_storage(name):
+    with tempfile.TemporaryDirectory() as directory:
+        storage = FileStorage(directory, compression=create_compression(name), subdirectories=False)
+        with open("tests/fixtures/hydra-1_tasks.pcap", "rb") as f:
+            file_name = storage.save_file(f, "pcap")
+
+        file = storage.get_file(file_name)
+        assert file.is_compressed()
+        assert file.codec.extension == get_codec(name).extension
+        assert file.format == "pcap"
+        assert file_name.endswith(".pcap." + file.codec.extension)
+
+        with open_capture(file.location) as reader:
+            assert len(list(reader)) == 2486
+
+
+def test_create_compression():
+    assert isinstance(create_compression("gzip:1"), IndexedCompression)
+    assert isinstance(create_compression("bgzf"), IndexedCompression)
+    assert create_compression("lzma:9").extension == "xz"
+
+    for specification in ("unknown", "gzip:fast"):
+        with pytest.raises(ValueError):
+            create_compression(specification)
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_bgzf_compression(threads, monkeypatch):
+    with open("tests/fixtures/medusa-1_tasks.pcap", "rb") as f:
+        data = f.read()
+
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/medusa.pcap.gz"
+        IndexedCompression(threads=threads, block_size=BGZF_BLOCK_SIZE).compress(BytesIO(data), compressed_file)
+
+        with gzip.open(compressed_file, "rb") as f:
+            assert f.read() == data
+
+        index = PacketIndex.load(compressed_file + INDEX_SUFFIX)
+        compressed = read_file(compressed_file)
+
+        # Parallel decompression of blocks returns the same data
+        monkeypatch.setattr(pcap_index, "_DECOMPRESSION_THREADS", threads)
+        blocks = range(3, len(index))
+        with open(compressed_file, "rb") as f:
+            assert b"".join(iter_blocks(f, index, blocks)) == data[:index.header_length] + data[index.offsets[3]:]
+
+    assert compressed.endswith(BGZF_EOF)
+    assert index.packet_count == 8475
+    assert len(index) > len(data) // BGZF_BLOCK_SIZE
+
+    # Every member holds its size in BC extra field
+    position = 0
+    while position < len(compressed):
+        assert compressed[position + 12:position + 14] == b"BC"
+        size, = struct.unpack("<H", compressed[position + 16:position + 18])
+        decompressed = zlib.decompress(compressed[position:position + size + 1], 31)
+        assert len(decompressed) <= BGZF_BLOCK_SIZE
+        position += size + 1
+    assert position == len(compressed)
+
+    for block in range(len(index)):
+        position, end_position, offset, end_offset = index.block_range(block)
+        assert end_offset - offset <= BGZF_BLOCK_SIZE
+        assert index.block_of_packet(index.packets[block]) == block
+
+
+@pytest.mark.parametrize("specification, codec", [("gzip", "gzip"), ("bgzf", "gzip"), ("lzma", "lzma")])
+def test_compression_stream_analysis(specification, codec):
+    compression = create_compression(specification, threads=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/hydra.pcap." + compression.extension
+        analysis = StreamAnalysis()
+        with open("tests/fixtures/hydra-1_tasks.pcap", "rb") as f:
+            compression.compress(f, compressed_file, analysis=analysis)
+
+        assert analysis.finished
+        # Analysis computed during compression is the same as analysis of saved file
+        assert analysis.result(compressed_file, codec) == analyze_capture(compressed_file)
+
+
+def test_compression_stream_analysis_not_capture():
+    with tempfile.TemporaryDirectory() as directory:
+        for compression in (create_compression("gzip"), create_compression("bz2")):
+            analysis = StreamAnalysis()
+            compression.compress([b"TEST ", b"INPUT"], directory + "/file", analysis=analysis)
+            assert not analysis.finished
+            assert read_file(directory + "/file") != b"TEST INPUT"
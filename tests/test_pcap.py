@@ -0,0 +1,357 @@
+import gzip
+import struct
+import pytest
+import tempfile
+from io import BytesIO
+
+from traces_api.pcap.reader import PcapReader, PcapError, Packet, open_capture
+from traces_api.pcap.writer import create_writer, iter_capture
+from traces_api.pcap.rewrite import PacketRewriter
+from traces_api.pcap.merge import merge_packets
+from traces_api.pcap.slice import slice_capture
+from traces_api.pcap.filter import compile_filter, FilterError
+from traces_api.pcap.preview import preview_capture
+from traces_api.pcap.analyzer import CaptureAnalyzer
+from traces_api.pcap.timeseries import TimeSeriesBuilder, build_timeseries, save_timeseries, load_timeseries, select_level
+from traces_api.compression import IndexedCompression
+
+
+HYDRA_FILE = "tests/fixtures/hydra-1_tasks.pcap"
+
+
+def create_pcap(packets, endian="<", nanosecond=False, link_type=1):
+    magic = 0xa1b23c4d if nanosecond else 0xa1b2c3d4
+    data = struct.pack(endian + "IHHiIII", magic, 2, 4, 0, 0, 65535, link_type)
+    for seconds, fraction, payload in packets:
+        data += struct.pack(endian + "IIII", seconds, fraction, len(payload), len(payload)) + payload
+    return data
+
+
+def read_all(reader):
+    return [(p.timestamp, p.length, p.link_type, bytes(p.data)) for p in reader]
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_read_pcap(endian):
+    reader = PcapReader(create_pcap([(10, 5, b"abc"), (11, 0, b"defgh")], endian=endian))
+
+    assert reader.format == "pcap"
+    assert reader.link_type == 1
+    assert not reader.nanosecond
+    assert read_all(reader) == [
+        (10000005000, 3, 1, b"abc"),
+        (11000000000, 5, 1, b"defgh"),
+    ]
+
+
+def test_read_pcap_nanosecond():
+    reader = PcapReader(create_pcap([(10, 5, b"abc")], nanosecond=True))
+
+    assert reader.nanosecond
+    assert [p.timestamp for p in reader] == [10000000005]
+
+
+def test_read_pcap_truncated():
+    data = create_pcap([(10, 5, b"abc"), (11, 0, b"defgh")])
+    reader = PcapReader(data[:-2])
+
+    assert len(list(reader)) == 1
+
+
+def test_read_invalid_file():
+    with pytest.raises(PcapError):
+        PcapReader(b"NOT A CAPTURE FILE AT ALL")
+
+
+def test_read_pcapng():
+    with open_capture(HYDRA_FILE) as reader:
+        assert reader.format == "pcapng"
+        assert reader.link_type == 1
+
+        packets = read_all(reader)
+
+    assert len(packets) == 2486
+    assert all(len(data) <= length for _, length, _, data in packets)
+
+
+def test_read_sources_are_equal():
+    with open(HYDRA_FILE, "rb") as f:
+        stream_packets = read_all(PcapReader(f, chunk_size=1000))
+
+    with tempfile.NamedTemporaryFile(suffix=".gz") as f_gz:
+        with open(HYDRA_FILE, "rb") as f_in, gzip.open(f_gz.name, "wb") as f_out:
+            f_out.write(f_in.read())
+
+        with open_capture(f_gz.name) as reader:
+            gzip_packets = read_all(reader)
+
+    with open_capture(HYDRA_FILE, use_mmap=True) as reader:
+        mmap_packets = read_all(reader)
+
+    assert stream_packets == gzip_packets == mmap_packets
+
+
+def internet_checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def create_udp_packet(src_ip, dst_ip, payload=b"payload"):
+    udp = struct.pack("!HHHH", 1234, 53, 8 + len(payload), 0) + payload
+    pseudo_header = src_ip + dst_ip + struct.pack("!BBH", 0, 17, len(udp))
+    udp = udp[:6] + struct.pack("!H", internet_checksum(pseudo_header + udp)) + udp[8:]
+
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(udp), 1, 0, 64, 17, 0, src_ip, dst_ip)
+    ip = ip[:10] + struct.pack("!H", internet_checksum(ip)) + ip[12:]
+
+    ethernet = bytes.fromhex("080027bdc237080027908fc4") + b"\x08\x00"
+    return ethernet + ip + udp
+
+
+@pytest.mark.parametrize("format", ["pcap", "pcapng"])
+def test_write_read(format):
+    packets = [Packet(1000000001000, 3, 1, 0, b"abc"), Packet(1000000002000, 10, 1, 0, b"defgh")]
+
+    stream = BytesIO()
+    writer = create_writer(stream, format)
+    for packet in packets:
+        writer.write(packet)
+    writer.close()
+
+    reader = PcapReader(stream.getvalue())
+    assert reader.format == format
+    assert read_all(reader) == [(1000000001000, 3, 1, b"abc"), (1000000002000, 10, 1, b"defgh")]
+
+
+def test_rewrite():
+    data = create_udp_packet(bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2]))
+    rewriter = PacketRewriter(
+        ip_mapping={"10.0.0.1": "172.16.0.1"},
+        mac_mapping={"08:00:27:bd:c2:37": "00:00:00:00:00:01"},
+        timestamp_shift=1000,
+    )
+
+    packet = rewriter.rewrite(Packet(5000, len(data), 1, 0, data))
+    new_data = bytes(packet.data)
+
+    assert packet.timestamp == 4000
+    assert new_data[0:6] == bytes.fromhex("000000000001")
+    assert new_data[26:30] == bytes([172, 16, 0, 1])
+    assert new_data[30:34] == bytes([10, 0, 0, 2])
+
+    # IP header and UDP checksums are still valid
+    assert internet_checksum(new_data[14:34]) == 0
+    udp = new_data[34:]
+    assert internet_checksum(new_data[26:34] + struct.pack("!BBH", 0, 17, len(udp)) + udp) == 0
+
+
+@pytest.mark.parametrize("format", ["pcap", "pcapng"])
+def test_rewrite_timestamp_before_epoch(format):
+    rewriter = PacketRewriter(timestamp_shift=10000000000)
+    packets = [rewriter.rewrite(Packet(timestamp, 3, 1, 0, b"abc")) for timestamp in (1000000000, 2500000000)]
+    assert [p.timestamp for p in packets] == [-9000000000, -7500000000]
+
+    stream = BytesIO()
+    writer = create_writer(stream, format)
+    for packet in packets:
+        writer.write(packet)
+    writer.close()
+
+    # Timestamps wrap around as in editcap, order and differences of packets are preserved
+    timestamps = [p.timestamp for p in PcapReader(stream.getvalue())]
+    assert timestamps[1] - timestamps[0] == 1500000000
+    if format == "pcap":
+        assert timestamps[0] == (2 ** 32 - 9) * 1000000000
+
+
+def test_rewrite_unchanged_packet_is_not_copied():
+    data = create_udp_packet(bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2]))
+    rewriter = PacketRewriter(ip_mapping={"1.2.3.4": "4.3.2.1"})
+
+    packet = rewriter.rewrite(Packet(5000, len(data), 1, 0, data))
+    assert packet.data is data
+
+
+def test_merge_packets():
+    first = [Packet(1, 1, 1, 0, b"a"), Packet(5, 1, 1, 0, b"b")]
+    second = [Packet(2, 1, 1, 0, b"c"), Packet(5, 1, 1, 0, b"d"), Packet(7, 1, 1, 0, b"e")]
+
+    assert [p.data for p in merge_packets([first, second])] == [b"a", b"c", b"b", b"d", b"e"]
+
+
+def test_slice_capture():
+    with open_capture(HYDRA_FILE) as reader:
+        timestamps = sorted(p.timestamp for p in reader)
+    start, end = timestamps[500], timestamps[1500]
+
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/hydra.pcapng.gz"
+        with open(HYDRA_FILE, "rb") as f:
+            IndexedCompression(interval=100).compress(f, compressed_file)
+
+        indexed = read_all(PcapReader(b"".join(slice_capture(compressed_file, start, end, format="pcap"))))
+        scanned = read_all(PcapReader(b"".join(slice_capture(HYDRA_FILE, start, end, format="pcap"))))
+
+    assert indexed == scanned
+    assert len(indexed) == len([t for t in timestamps if start <= t <= end])
+
+
+@pytest.mark.parametrize("block_size", [None, 1000])
+def test_indexed_pcapng_interface_in_skipped_block(block_size):
+    # Writer describes second interface just before its first packet, in the middle of capture
+    packets = [Packet(i * 1000, 3, 1 if i < 50 else 101, 0, b"abc") for i in range(100)]
+    data = b"".join(iter_capture(packets, "pcapng"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/capture.pcapng.gz"
+        IndexedCompression(interval=10, block_size=block_size).compress([data], compressed_file)
+
+        sliced = list(PcapReader(b"".join(slice_capture(compressed_file, 70000, 90000))))
+        assert [(p.timestamp, p.link_type) for p in sliced] == [(i * 1000, 101) for i in range(70, 91)]
+
+        assert [p["number"] for p in preview_capture(compressed_file, 80, 5)] == [80, 81, 82, 83, 84]
+
+
+def test_slice_capture_empty():
+    reader = PcapReader(b"".join(slice_capture(HYDRA_FILE, end=0)))
+
+    assert reader.format == "pcapng"
+    assert list(reader) == []
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("", True),
+    ("udp", True),
+    ("tcp", False),
+    ("host 10.0.0.1", True),
+    ("src host 10.0.0.2", False),
+    ("dst 10.0.0.2", True),
+    ("net 10.0.0.0/8 and not net 10.1.0.0/16", True),
+    ("udp dst port 53", True),
+    ("tcp port 53", False),
+    ("portrange 1000-2000", True),
+    ("ether dst 08:00:27:bd:c2:37", True),
+    ("ether src host 08:00:27:bd:c2:37", False),
+    ("ip proto udp && !ip6", True),
+    ("icmp or (ip and port 80)", False),
+    ("greater 1000", False),
+])
+def test_compile_filter(expression, expected):
+    data = create_udp_packet(bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2]))
+
+    assert compile_filter(expression)(Packet(0, len(data), 1, 0, data)) is expected
+
+
+@pytest.mark.parametrize("expression", ["host", "host 10.0.0", "port x-y", "(udp", "udp and", "ether port 80", "foo"])
+def test_compile_filter_invalid(expression):
+    with pytest.raises(FilterError):
+        compile_filter(expression)
+
+
+def test_slice_capture_filter():
+    predicate = compile_filter("tcp dst port 22")
+    with open_capture(HYDRA_FILE) as reader:
+        expected = [(p.timestamp, bytes(p.data)) for p in reader if predicate(p)]
+
+    reader = PcapReader(b"".join(slice_capture(HYDRA_FILE, predicate=predicate)))
+
+    assert 0 < len(expected) < 2486
+    assert [(p.timestamp, bytes(p.data)) for p in reader] == expected
+
+
+def test_preview_capture():
+    with tempfile.TemporaryDirectory() as directory:
+        compressed_file = directory + "/hydra.pcapng.gz"
+        with open(HYDRA_FILE, "rb") as f:
+            IndexedCompression(interval=100).compress(f, compressed_file)
+
+        for offset, limit in [(0, 3), (150, 100), (2480, 100), (5000, 10)]:
+            indexed = preview_capture(compressed_file, offset, limit)
+            assert indexed == preview_capture(HYDRA_FILE, offset, limit)
+            assert [p["number"] for p in indexed] == list(range(offset, min(offset + limit, 2486)))
+
+    packet = preview_capture(HYDRA_FILE, 0, 1)[0]
+    assert packet["protocol"] == "tcp"
+    assert packet["tcp_flags"] == ["SYN"]
+    assert packet["captured_length"] == packet["length"]
+
+
+def test_analyzer_flow_statistics():
+    ipv6_src, ipv6_dst = bytes(15) + b"\x01", bytes(15) + b"\x02"
+    udp6 = bytes(12) + b"\x86\xdd" + struct.pack("!IHBB16s16s", 6 << 28, 8, 17, 64, ipv6_src, ipv6_dst)
+    udp6 += struct.pack("!HHHH", 443, 5000, 8, 0)
+    icmp = bytes(12) + b"\x08\x00" + struct.pack("!BBHHHBBH4s4s", 0x45, 0, 28, 1, 0, 64, 1, 0, b"\x0a\x00\x00\x01",
+                                                   b"\x0a\x00\x00\x02") + b"\x08\x00\x00\x00" + bytes(4)
+    udp = create_udp_packet(bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2]))
+    udp_reply = create_udp_packet(bytes([10, 0, 0, 2]), bytes([10, 0, 0, 1]))
+    # reply from 10.0.0.2:53 to 10.0.0.1:1234 belongs to the same conversation
+    udp_reply = udp_reply[:34] + struct.pack("!HH", 53, 1234) + udp_reply[38:]
+
+    analyzer = CaptureAnalyzer()
+    for timestamp, data in enumerate([udp, udp6, icmp, udp_reply, udp6]):
+        analyzer.add(Packet(timestamp * 1000000000, len(data), 1, 0, data))
+
+    udp_conversations = analyzer.udp_conversations()
+    assert [(c["IP A"], c["Port A"], c["IP B"], c["Port B"], c["Frames A-B"], c["Frames B-A"]) for c in udp_conversations] == [
+        ("10.0.0.1", 1234, "10.0.0.2", 53, 1, 1),
+        ("::1", 443, "::2", 5000, 2, 0),
+    ]
+    assert udp_conversations[1]["Relative start"] == 1.0
+
+    assert [(c["IP A"], c["IP B"], c["Frames"], c["Bytes"]) for c in analyzer.icmp_conversations()] == [
+        ("10.0.0.1", "10.0.0.2", 1, len(icmp))
+    ]
+    assert analyzer.ipv6_endpoints() == [
+        {"IP": "::1", "Packets": 2, "Bytes": 2 * len(udp6), "Tx Packets": 2, "Tx Bytes": 2 * len(udp6),
+         "Rx Packets": 0, "Rx Bytes": 0},
+        {"IP": "::2", "Packets": 2, "Bytes": 2 * len(udp6), "Tx Packets": 0, "Tx Bytes": 0,
+         "Rx Packets": 2, "Rx Bytes": 2 * len(udp6)},
+    ]
+    assert analyzer.tcp_conversations() == []
+
+
+def test_timeseries_builder():
+    builder = TimeSeriesBuilder(width=10, max_buckets=100)
+    for timestamp in [35, 5, 12, 18]:
+        builder.add(timestamp, 100)
+
+    levels = builder.levels()
+    assert len(levels) == 1
+    assert (levels[0].width, levels[0].start) == (10, 0)
+    assert list(levels[0].packets) == [1, 2, 0, 1]
+    assert list(levels[0].bytes) == [100, 200, 0, 100]
+
+    # Time span that needs more than max_buckets buckets makes buckets wider
+    builder.add(2005, 50)
+    level = builder.levels()[0]
+    assert (level.width, level.start) == (100, 0)
+    assert list(level.packets) == [4] + [0] * 19 + [1]
+
+
+def test_timeseries_levels():
+    levels = build_timeseries(HYDRA_FILE)
+
+    assert len(levels) > 1
+    for finer, coarser in zip(levels, levels[1:]):
+        assert coarser.width == finer.width * 10
+        assert sum(coarser.packets) == sum(finer.packets) == 2486
+        assert sum(coarser.bytes) == sum(finer.bytes)
+    assert len(levels[-1]) <= 100
+
+    assert select_level(levels, 0) is levels[0]
+    assert select_level(levels, levels[1].width) is levels[1]
+    assert select_level(levels, levels[-1].width) is levels[-1]
+
+    coarsest = select_level(levels, 10 ** 18)
+    assert coarsest.width >= 10 ** 18
+    assert sum(coarsest.packets) == sum(levels[-1].packets)
+    assert select_level(levels, levels[-1].width * 2.5).width == levels[-1].width * 3
+
+    with tempfile.NamedTemporaryFile() as f:
+        save_timeseries(f.name, levels)
+        loaded = load_timeseries(f.name)
+    assert [level.dict() for level in loaded] == [level.dict() for level in levels]
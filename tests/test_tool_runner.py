@@ -0,0 +1,104 @@
+import pytest
+
+from traces_api.tool_runner import PooledRunner, LocalRunner, LocalWorker, Worker, ToolRunnerError
+
+
+class FlakyWorker(Worker):
+    def __init__(self, healthy=True):
+        super().__init__()
+        self.healthy = healthy
+        self.stopped = False
+
+    def execute(self, args):
+        return 0, b"done"
+
+    def is_healthy(self):
+        return self.healthy
+
+    def stop(self):
+        self.stopped = True
+
+
+class RestrictedWorker(LocalWorker):
+    def can_access(self, location):
+        return location.startswith("/allowed/")
+
+
+def test_worker_is_abstract():
+    with pytest.raises(TypeError):
+        Worker()
+
+
+def test_local_runner():
+    assert LocalRunner().run(["python3", "-c", "print('ok')"]) == (0, b"ok\n")
+
+    with pytest.raises(ToolRunnerError):
+        LocalRunner().run(["/NON_EXISTING_BINARY____"])
+
+
+def test_local_worker():
+    runner = PooledRunner(LocalWorker, size=1)
+
+    assert runner.run(["python3", "-c", "print('ok')"]) == (0, b"ok\n")
+    assert runner.run(["python3", "-c", "import sys; sys.exit(3)"])[0] == 3
+
+
+def test_pool_reuses_workers():
+    runner = PooledRunner(FlakyWorker, size=2, max_jobs=100)
+
+    for _ in range(5):
+        runner.run(["job"])
+
+    assert len(runner.workers) == 1
+    assert runner.workers[0].jobs == 5
+
+
+def test_pool_recycles_workers():
+    created = []
+
+    def factory():
+        created.append(FlakyWorker())
+        return created[-1]
+
+    runner = PooledRunner(factory, size=1, max_jobs=2)
+    for _ in range(5):
+        runner.run(["job"])
+
+    assert len(created) == 3
+    assert [w.stopped for w in created] == [True, True, False]
+
+
+def test_pool_replaces_unhealthy_worker():
+    created = []
+
+    def factory():
+        created.append(FlakyWorker())
+        return created[-1]
+
+    runner = PooledRunner(factory, size=1, health_check_interval=0)
+    runner.run(["job"])
+    created[0].healthy = False
+    runner.run(["job"])
+
+    assert len(created) == 2
+    assert created[0].stopped
+    assert runner.workers == [created[1]]
+
+
+def test_pool_inaccessible_files():
+    runner = PooledRunner(RestrictedWorker, size=1)
+
+    with pytest.raises(ToolRunnerError):
+        runner.run(["python3", "-c", "pass"], files=["/elsewhere/file.pcap"])
+
+    assert runner.run(["python3", "-c", "pass"], files=["/allowed/file.pcap"])[0] == 0
+
+
+def test_pool_close():
+    runner = PooledRunner(FlakyWorker, size=2)
+    runner.run(["job"])
+    worker = runner.workers[0]
+    runner.close()
+
+    assert worker.stopped
+    assert runner.workers == []
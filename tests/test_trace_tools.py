@@ -1,9 +1,14 @@
 import pytest
 import os.path
+import json
 import tempfile
 
-from traces_api.trace_tools import TraceNormalizer, TraceNormalizerError
-from traces_api.trace_tools import TraceAnalyzer, TraceAnalyzerError
+from traces_api.trace_tools import TraceNormalizer, TraceNormalizerError, NativeTraceNormalizer
+from traces_api.trace_tools import TraceAnalyzer, TraceAnalyzerError, NativeTraceAnalyzer
+from traces_api.trace_tools import NativeTraceMixing, create_trace_tools, check_storage_compression, TraceToolsConfigError
+from traces_api.compression import create_compression
+from traces_api.compare_trace_tools import compare_backends
+from traces_api.pcap.reader import open_capture
 
 
 @pytest.fixture()
@@ -11,16 +16,31 @@ def analyzer():
     return TraceAnalyzer()
 
 
+@pytest.fixture()
+def native_analyzer():
+    return NativeTraceAnalyzer()
+
+
 @pytest.fixture()
 def normalizer():
     return TraceNormalizer()
 
 
+@pytest.fixture()
+def native_normalizer():
+    return NativeTraceNormalizer()
+
+
 @pytest.fixture()
 def hydra_1_file():
     return os.path.dirname(os.path.realpath(__file__)) + "/fixtures/hydra-1_tasks.pcap"
 
 
+@pytest.fixture()
+def medusa_1_file():
+    return os.path.dirname(os.path.realpath(__file__)) + "/fixtures/medusa-1_tasks.pcap"
+
+
 def compare_list_dict(list_1, list_2):
     sl1 = sorted(sorted(i.items()) for i in list_1)
     sl2 = sorted(sorted(i.items()) for i in list_2)
@@ -53,6 +73,44 @@ def test_analyzer_get_tcp_conversations(analyzer, hydra_1_file):
                                  'Bytes A-B', 'Frames', 'Bytes', 'Relative start'}
 
 
+def test_native_analyzer_invalid_input(native_analyzer):
+    with pytest.raises(TraceAnalyzerError):
+        native_analyzer.analyze("/tmp/NON_EXISTING_FILE____")
+
+
+def test_native_analyzer_get_pairs_mac_ip(native_analyzer, hydra_1_file):
+    response = native_analyzer.analyze(hydra_1_file)["pairs_mac_ip"]
+
+    expected = [{'MAC': '08:00:27:bd:c2:37', 'IP': '240.125.0.2'},
+                {'MAC': '08:00:27:90:8f:c4', 'IP': '240.0.1.2'},
+                {'MAC': '08:00:27:bd:c2:37', 'IP': '240.125.0.2'},
+                {'MAC': '08:00:27:90:8f:c4', 'IP': '240.0.1.2'}]
+
+    assert compare_list_dict(response, expected)
+
+
+def test_native_analyzer_get_tcp_conversations(native_analyzer, hydra_1_file):
+    response = native_analyzer.analyze(hydra_1_file)["tcp_conversations"]
+
+    assert len(response) == 61
+
+    for r in response:
+        assert set(r.keys()) == {'IP A', 'Port A', 'IP B', 'Port B', 'Frames B-A', 'Bytes B-A', 'Frames A-B',
+                                 'Bytes A-B', 'Frames', 'Bytes', 'Relative start'}
+        assert r["Frames"] == r["Frames A-B"] + r["Frames B-A"]
+
+    assert [r["Frames"] for r in response] == sorted((r["Frames"] for r in response), reverse=True)
+
+
+def test_native_analyzer_capture_info(native_analyzer, hydra_1_file):
+    response = native_analyzer.analyze(hydra_1_file)["capture_info"]
+
+    assert response["Number of packets"] == "2486"
+    assert response["File encapsulation"] == "Ethernet"
+    assert response["Number of interfaces in file"] == "1"
+    assert len(response["SHA256"]) == 64
+
+
 def test_normalizer_invalid_input(normalizer):
     with pytest.raises(TraceNormalizerError):
         normalizer.normalize("/tmp/NON_EXISTING_FILE____", "/tmp/NON_EXISTING_FILE____2", dict())
@@ -82,3 +140,138 @@ def test_normalizer(analyzer, normalizer, hydra_1_file):
         response = analyzer.analyze(f.name)
 
         compare_list_dict(response["pairs_mac_ip"], expected)
+
+
+def test_native_normalizer_invalid_input(native_normalizer):
+    with pytest.raises(TraceNormalizerError):
+        native_normalizer.normalize("/tmp/NON_EXISTING_FILE____", "/tmp/NON_EXISTING_FILE____2", dict())
+
+
+def test_native_normalizer(native_analyzer, native_normalizer, hydra_1_file):
+    configuration = dict(
+        IP=[
+            dict(original="240.0.1.2", new="172.16.0.1"),
+            dict(original="240.125.0.2", new="172.16.0.2"),
+            dict(original="240.125.1.2", new="172.16.0.3"),
+        ],
+        MAC=[
+            dict(original="08:00:27:bd:c2:37", new="00:00:00:00:00:00"),
+        ]
+    )
+
+    with tempfile.NamedTemporaryFile() as f:
+        f.file.close()
+
+        native_normalizer.normalize(hydra_1_file, f.name, configuration)
+
+        expected = [{'MAC': '00:00:00:00:00:00', 'IP': '172.16.0.2'},
+                    {'MAC': '08:00:27:90:8f:c4', 'IP': '172.16.0.1'},
+                    {'MAC': '00:00:00:00:00:00', 'IP': '172.16.0.2'},
+                    {'MAC': '08:00:27:90:8f:c4', 'IP': '172.16.0.1'}]
+        response = native_analyzer.analyze(f.name)
+
+        assert compare_list_dict(response["pairs_mac_ip"], expected)
+        assert len(response["tcp_conversations"]) == 61
+
+
+def test_native_mixer(native_analyzer, hydra_1_file, medusa_1_file):
+    with tempfile.NamedTemporaryFile() as f:
+        f.file.close()
+
+        mixer = NativeTraceMixing.create_new_mixer(f.name)
+        mixer.mix(hydra_1_file)
+        mixer.mix(medusa_1_file)
+
+        response = native_analyzer.analyze(mixer.get_mixed_file_location())
+
+        assert response["capture_info"]["Number of packets"] == str(14 + 2486 + 8475)
+        assert len(response["tcp_conversations"]) == 1 + 61 + 196
+
+
+def test_native_mix_annotated_units(native_analyzer, native_normalizer, hydra_1_file, medusa_1_file):
+    configuration = dict(IP=[dict(original="240.0.1.2", new="172.16.0.1")])
+    progress = []
+
+    chunks = NativeTraceMixing().mix_annotated_units(
+        native_normalizer, [(hydra_1_file, configuration), (medusa_1_file, configuration)], progress.append
+    )
+
+    with tempfile.NamedTemporaryFile() as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+
+        response = native_analyzer.analyze(f.name)
+
+    assert progress == [1, 2]
+    assert response["capture_info"]["Number of packets"] == str(14 + 2486 + 8475)
+    assert len(response["tcp_conversations"]) == 1 + 61 + 196
+
+
+@pytest.mark.parametrize("backend, analyzer_class", [
+    ("docker", TraceAnalyzer), ("local", TraceAnalyzer), ("native", NativeTraceAnalyzer)
+])
+def test_create_trace_tools(backend, analyzer_class):
+    tools = create_trace_tools(backend)
+    assert type(tools.analyzer) == analyzer_class
+
+
+def test_create_trace_tools_invalid_backend():
+    with pytest.raises(ValueError):
+        create_trace_tools("pool")
+    with pytest.raises(ValueError):
+        create_trace_tools("UNKNOWN")
+
+
+@pytest.mark.parametrize("backend", ["docker", "local", "pool"])
+def test_check_storage_compression(backend):
+    check_storage_compression(backend, dict(units=create_compression("gzip:1"), ann_units=create_compression("bgzf")))
+    check_storage_compression("native", dict(units=create_compression("bz2")))
+
+    with pytest.raises(TraceToolsConfigError):
+        check_storage_compression(backend, dict(units=create_compression("gzip"), ann_units=create_compression("bz2")))
+
+
+def test_compare_backends(hydra_1_file):
+    results = compare_backends(hydra_1_file, ["native", "native"])
+
+    assert [r["backend"] for r in results] == ["native", "native"]
+    assert all(r["analysis_equal"] and r["normalization_equal"] for r in results)
+
+
+class BatchRunner:
+    def __init__(self, success=True):
+        self.success = success
+
+    def run(self, args, files=()):
+        with open(args[args.index("-b") + 1]) as f:
+            jobs = json.load(f)
+
+        lines = [json.dumps(dict(job, success=self.success, log="")) for job in jobs]
+        return (0 if self.success else 2), "\n".join(lines).encode()
+
+
+def test_normalizer_batch():
+    TraceNormalizer(BatchRunner()).normalize_batch([("/tmp/a", "/tmp/b", {}), ("/tmp/c", "/tmp/d", {})])
+
+    with pytest.raises(TraceNormalizerError):
+        TraceNormalizer(BatchRunner(success=False)).normalize_batch([("/tmp/a", "/tmp/b", {})])
+
+
+def test_native_analyzer_batch(native_analyzer, hydra_1_file, medusa_1_file):
+    response = native_analyzer.analyze_batch([hydra_1_file, medusa_1_file])
+
+    assert [len(r["tcp_conversations"]) for r in response] == [61, 196]
+
+
+@pytest.mark.parametrize("output_format", ["pcap", "pcapng"])
+def test_native_normalizer_output_format(native_normalizer, hydra_1_file, output_format):
+    configuration = native_normalizer.prepare_configuration(None, None, None, output_format=output_format)
+
+    with tempfile.NamedTemporaryFile() as f:
+        f.file.close()
+        native_normalizer.normalize(hydra_1_file, f.name, configuration)
+
+        with open_capture(f.name) as reader:
+            assert reader.format == output_format
+            assert len(list(reader)) == 2486
@@ -0,0 +1,135 @@
+import json
+import hashlib
+import sqlalchemy.exc
+
+from datetime import datetime
+from sqlalchemy import func
+
+from traces_api.database.model.analysis_cache import ModelAnalysisCache
+from traces_api.pcap.codecs import iter_decompressed
+
+# 256 MB of serialized analyses
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+def file_digest(location):
+    """
+    Compute SHA-256 of uncompressed content of file
+
+    :param location: file location, file can be compressed
+    :return: hex digest
+    """
+    hasher = hashlib.sha256()
+    for chunk in iter_decompressed(location):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class AnalysisCache:
+    """
+    Persistent cache of capture analyses
+
+    Analyses are keyed by SHA-256 of capture content and version of analyzer, so captures with the same content are
+    analyzed only once. When total size of cached analyses exceeds max_size, least recently used analyses are evicted.
+    """
+
+    def __init__(self, session_maker, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param session_maker: SqlAlchemy session maker
+        :param max_size: maximal total size of cached analyses in bytes
+        """
+        self._session_maker = session_maker
+        self._max_size = max_size
+
+    @property
+    def _session(self):
+        return self._session_maker()
+
+    def analyze(self, trace_analyzer, location, digest=None):
+        """
+        Return cached analysis of capture or analyze it by analyzer and cache the result
+
+        :param trace_analyzer: TraceAnalyzer, its VERSION is part of cache key
+        :param location: capture location
+        :param digest: SHA-256 of uncompressed capture if it is already known, it is computed from file if None
+        :return: dict that contains analyzed information
+        """
+        digest = digest or file_digest(location)
+
+        analysis = self.get(digest, trace_analyzer.VERSION)
+        if analysis is None:
+            analysis = trace_analyzer.analyze(location)
+            self.put(digest, trace_analyzer.VERSION, analysis)
+        return analysis
+
+    def get(self, digest, analyzer_version):
+        """
+        :param digest: SHA-256 of capture
+        :param analyzer_version: version of analyzer
+        :return: cached analysis or None
+        """
+        cached = self._session.query(ModelAnalysisCache).filter(
+            ModelAnalysisCache.sha256 == digest, ModelAnalysisCache.analyzer_version == analyzer_version
+        ).first()
+        if cached is None:
+            return None
+
+        cached.last_access_time = datetime.now()
+        self._session.commit()
+        return json.loads(cached.analysis)
+
+    def put(self, digest, analyzer_version, analysis):
+        """
+        Cache analysis and evict least recently used analyses if cache is full
+
+        :param digest: SHA-256 of capture
+        :param analyzer_version: version of analyzer
+        :param analysis: JSON serializable analysis
+        """
+        serialized = json.dumps(analysis)
+        if len(serialized) > self._max_size:
+            return
+
+        now = datetime.now()
+        self._session.add(ModelAnalysisCache(
+            sha256=digest,
+            analyzer_version=analyzer_version,
+            analysis=serialized,
+            size=len(serialized),
+            creation_time=now,
+            last_access_time=now,
+        ))
+        try:
+            self._session.commit()
+        except sqlalchemy.exc.IntegrityError:
+            # Same capture was analyzed concurrently
+            self._session.rollback()
+            return
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove least recently used analyses until total size fits into max_size
+        """
+        session = self._session
+        excess = (session.query(func.sum(ModelAnalysisCache.size)).scalar() or 0) - self._max_size
+        if excess <= 0:
+            return
+
+        rows = session.query(
+            ModelAnalysisCache.sha256, ModelAnalysisCache.analyzer_version, ModelAnalysisCache.size
+        ).order_by(ModelAnalysisCache.last_access_time).yield_per(100)
+
+        evicted = []
+        for sha256, analyzer_version, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((sha256, analyzer_version))
+            excess -= size
+
+        for sha256, analyzer_version in evicted:
+            session.query(ModelAnalysisCache).filter(
+                ModelAnalysisCache.sha256 == sha256, ModelAnalysisCache.analyzer_version == analyzer_version
+            ).delete(synchronize_session=False)
+        session.commit()
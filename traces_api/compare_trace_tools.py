@@ -0,0 +1,108 @@
+"""
+Compare trace tools backends for speed and output equality
+
+Usage:
+    python3 -m traces_api.compare_trace_tools -f tests/fixtures/hydra-1_tasks.pcap -b docker native
+"""
+import os
+import time
+import json
+import argparse
+import tempfile
+
+from traces_api.trace_tools import create_trace_tools, NativeTraceAnalyzer, BACKENDS
+
+CONVERSATION_KEYS = ["tcp_conversations", "udp_conversations", "icmp_conversations"]
+
+# Capture information which does not depend on file format written by normalizer
+COMPARED_CAPTURE_INFO = ["Number of packets", "Data size", "First packet time", "Last packet time"]
+
+
+def comparable_analysis(result):
+    """
+    Convert analysis result into form that does not depend on order of items and precision of backend
+
+    :param result: dict returned by TraceAnalyzer.analyze
+    :return: dict
+    """
+    comparable = {}
+    for key in CONVERSATION_KEYS:
+        conversations = []
+        for conversation in result.get(key, []):
+            conversation = dict(conversation)
+            conversation["Relative start"] = round(float(conversation["Relative start"]), 6)
+            conversations.append(sorted(conversation.items()))
+        comparable[key] = sorted(conversations)
+
+    return dict(
+        comparable,
+        ipv6_endpoints=sorted(sorted(endpoint.items()) for endpoint in result.get("ipv6_endpoints", [])),
+        pairs_mac_ip=sorted(sorted(pair.items()) for pair in result["pairs_mac_ip"]),
+        capture_info={key: result["capture_info"].get(key) for key in COMPARED_CAPTURE_INFO},
+    )
+
+
+def compare_backends(location, backends, configuration=None):
+    """
+    Analyze and normalize the same file by every backend
+
+    Normalized files are analyzed by native analyzer, so only normalization is compared.
+    Outputs are compared with outputs of first backend.
+
+    :param location: captured traffic dump
+    :param backends: list of backend names
+    :param configuration: normalizer configuration, only timestamps are reset if None
+    :return: list of dicts with backend, analyze_time, normalize_time, analysis_equal and normalization_equal
+    """
+    configuration = configuration or dict(timestamp=0)
+    reference_analyzer = NativeTraceAnalyzer()
+
+    results = []
+    expected = None
+    for backend in backends:
+        tools = create_trace_tools(backend)
+
+        start = time.perf_counter()
+        analysis = comparable_analysis(tools.analyzer.analyze(location))
+        analyze_time = time.perf_counter() - start
+
+        fd, output_location = tempfile.mkstemp(prefix="trace_api_")
+        os.close(fd)
+        try:
+            start = time.perf_counter()
+            tools.normalizer.normalize(location, output_location, configuration)
+            normalize_time = time.perf_counter() - start
+
+            normalization = comparable_analysis(reference_analyzer.analyze(output_location))
+        finally:
+            os.remove(output_location)
+
+        if expected is None:
+            expected = analysis, normalization
+
+        results.append(dict(
+            backend=backend,
+            analyze_time=analyze_time,
+            normalize_time=normalize_time,
+            analysis_equal=analysis == expected[0],
+            normalization_equal=normalization == expected[1],
+        ))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare trace tools backends")
+    parser.add_argument("-f", "--file", required=True, help="captured traffic dump")
+    parser.add_argument("-b", "--backends", nargs="+", choices=[b for b in BACKENDS if b != "pool"],
+                        default=["docker", "native"], help="compared backends, first one is reference")
+    parser.add_argument("-c", "--configuration", help="normalizer configuration file")
+    args = parser.parse_args()
+
+    normalizer_configuration = None
+    if args.configuration:
+        with open(args.configuration) as f:
+            normalizer_configuration = json.load(f)
+
+    for row in compare_backends(args.file, args.backends, normalizer_configuration):
+        print(json.dumps(row))
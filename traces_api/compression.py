@@ -1,10 +1,42 @@
-import gzip
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from traces_api.pcap.codecs import GzipCodec, BgzfCodec, get_codec, detect_codec, COPY_SIZE
+from traces_api.pcap.index import compress_indexed, iter_analyzed, DEFAULT_INTERVAL, INDEX_SUFFIX, BGZF_BLOCK_SIZE
+from traces_api.pcap.timeseries import TimeSeriesBuilder, save_timeseries, TIMESERIES_SUFFIX
 
 
 class Compression:
+    """
+    Compression of stored files by one codec
 
-    @staticmethod
-    def compress_file(file_location, output_location):
+    Example usage:
+        compression = Compression(get_codec("lzma", 9))
+        compression.compress(stream, "unit.pcap." + compression.extension)
+    """
+
+    def __init__(self, codec=None):
+        """
+        :param codec: Codec used for compression, gzip is used if None
+        """
+        self._codec = codec or GzipCodec()
+
+    @property
+    def codec(self):
+        """
+        :return: Codec of compressed files
+        """
+        return self._codec
+
+    @property
+    def extension(self):
+        """
+        :return: extension of compressed files (without dot)
+        """
+        return self._codec.extension
+
+    def compress_file(self, file_location, output_location):
         """
         Compress specific file
         :param file_location: file to be compressed
@@ -12,30 +44,107 @@ class Compression:
         :return:
         """
         with open(file_location, "rb") as f_in:
-            Compression.compress(f_in, output_location)
+            self.compress(f_in, output_location)
 
-    @staticmethod
-    def compress(file_stream, output_location):
+    def compress(self, file_stream, output_location, analysis=None):
         """
         Compress file stream and save output to file
-        :param file_stream: stream to be compressed
+        :param file_stream: stream or iterable of bytes to be compressed
         :param output_location: compressed file
+        :param analysis: StreamAnalysis of compressed capture, it is fed while data are compressed
         :return:
         """
-        f_out = gzip.open(output_location, "wb")
-        f_out.writelines(file_stream)
-        f_out.close()
+        if analysis is not None:
+            file_stream = iter_analyzed(file_stream, analysis)
+
+        with open(output_location, "wb") as f, self._codec.open(f, "wb") as f_out:
+            f_out.writelines(file_stream)
 
     @staticmethod
     def decompress_file(file_location, output_location):
         """
-        Decompress file
+        Decompress file compressed by any known codec
         :param file_location: compressed file location to be decompressed
         :param output_location: decompressed file
         :return:
         """
-        with gzip.open(file_location, "rb") as f_in:
-            f_out = open(output_location, "wb")
-            f_out.writelines(f_in)
-            f_out.close()
+        with open(file_location, "rb") as f:
+            codec = detect_codec(f)
+            if codec is None:
+                raise ValueError("Unknown compression of %s" % file_location)
+
+            with codec.open(f, "rb") as f_in, open(output_location, "wb") as f_out:
+                while True:
+                    data = f_in.read(COPY_SIZE)
+                    if not data:
+                        break
+                    f_out.write(data)
+
+
+class IndexedCompression(Compression):
+    """
+    Gzip compression that builds packet index and traffic time-series of compressed captures in the same pass
+
+    Index and time-series are saved next to compressed file (location + INDEX_SUFFIX, location + TIMESERIES_SUFFIX),
+    they are not created for data that are not captures. Compressed file remains valid gzip file.
+
+    Blocks of data are deflated in parallel by thread pool shared by all compressions of this object.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, level=GzipCodec.default_level, threads=None, block_size=None):
+        """
+        :param interval: number of packets in one indexed block
+        :param level: gzip compression level
+        :param threads: number of compression threads, number of CPUs is used if None, 1 disables thread pool
+        :param block_size: maximal uncompressed size of gzip member, files are saved in blocked format (BGZF) if set
+        """
+        super().__init__(BgzfCodec(level) if block_size else GzipCodec(level))
+        self._interval = interval
+        self._block_size = block_size
+
+        threads = threads or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="compression") if threads > 1 else None
+
+    def compress(self, file_stream, output_location, analysis=None):
+        """
+        Compress file stream, save output to file and save packet index and time-series
+        :param file_stream: stream or iterable of bytes to be compressed
+        :param output_location: compressed file
+        :param analysis: StreamAnalysis of compressed capture, it is fed by packets parsed for index
+        :return:
+        """
+        timeseries = TimeSeriesBuilder()
+        with open(output_location, "wb") as f_out:
+            index = compress_indexed(
+                file_stream, f_out, self._interval, self._codec.level, timeseries=timeseries, executor=self._executor,
+                block_size=self._block_size, analysis=analysis
+            )
+
+        if index is not None:
+            index.save(output_location + INDEX_SUFFIX)
+            save_timeseries(output_location + TIMESERIES_SUFFIX, timeseries.levels())
+
+
+def create_compression(specification, threads=None):
+    """
+    Create compression from configuration value
+
+    Gzip and bgzf compressions also build packet index and time-series of stored captures.
+
+    :param specification: codec name optionally followed by level e.g. "gzip", "gzip:1", "bgzf", "lzma:9"
+    :param threads: number of threads of parallel gzip compression, number of CPUs is used if None
+    :return: Compression
+    :raises ValueError: specification is invalid
+    """
+    name, _, level = specification.strip().partition(":")
+    try:
+        level = int(level) if level else None
+    except ValueError:
+        raise ValueError("Invalid compression level in %s" % specification)
 
+    codec = get_codec(name, level)
+    if isinstance(codec, BgzfCodec):
+        return IndexedCompression(level=codec.level, threads=threads, block_size=BGZF_BLOCK_SIZE)
+    if isinstance(codec, GzipCodec):
+        return IndexedCompression(level=codec.level, threads=threads)
+    return Compression(codec)
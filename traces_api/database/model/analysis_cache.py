@@ -0,0 +1,22 @@
+from sqlalchemy import Column, BigInteger, String, DateTime, Text, Index
+
+from traces_api.database import Base
+
+
+class ModelAnalysisCache(Base):
+    """
+    Cached analysis of capture, capture is identified by SHA-256 of its uncompressed content
+    """
+
+    __tablename__ = "analysis_cache"
+
+    sha256 = Column(String(64), primary_key=True)
+    analyzer_version = Column(String(64), primary_key=True)
+    analysis = Column(Text(), nullable=False)
+    size = Column(BigInteger(), nullable=False)
+    creation_time = Column(DateTime, nullable=False)
+    last_access_time = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_analysis_cache_last_access_time", "last_access_time"),
+    )
@@ -1,10 +1,16 @@
 import json
-from sqlalchemy import Column, BigInteger, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime, ForeignKey, Text, Float, Index
 from sqlalchemy.orm import relationship
 
 from traces_api.database import Base
 
 
+"""
+Conversations stored in conversation table as tuples (protocol, key of analysis)
+"""
+CONVERSATION_PROTOCOLS = [("tcp", "tcp_conversations"), ("udp", "udp_conversations")]
+
+
 class ModelAnnotatedUnit(Base):
 
     __tablename__ = "annotated_unit"
@@ -18,6 +24,11 @@ class ModelAnnotatedUnit(Base):
     file_location = Column(String(255), nullable=False)
 
     labels = relationship("ModelAnnotatedUnitLabel", cascade="all,delete,delete-orphan")
+    # Conversations are deleted by database, so they are never loaded just to be deleted
+    conversations = relationship(
+        "ModelAnnotatedUnitConversation", cascade="all,delete,delete-orphan", passive_deletes=True,
+        order_by="ModelAnnotatedUnitConversation.id_conversation"
+    )
 
     def dict(self):
         return dict(
@@ -43,3 +54,91 @@ class ModelAnnotatedUnitLabel(Base):
     )
     label = Column(String(32), primary_key=True)
 
+
+class ModelAnnotatedUnitConversation(Base):
+
+    __tablename__ = "annotated_unit_conversation"
+
+    id_conversation = Column(BigInteger(), primary_key=True, autoincrement=True)
+    id_annotated_unit = Column(
+        BigInteger(),
+        ForeignKey('annotated_unit.id_annotated_unit', ondelete="CASCADE", onupdate="RESTRICT"),
+        nullable=False
+    )
+    protocol = Column(String(8), nullable=False)
+    ip_a = Column(String(45), nullable=False)
+    port_a = Column(Integer(), nullable=False)
+    ip_b = Column(String(45), nullable=False)
+    port_b = Column(Integer(), nullable=False)
+    frames_a_b = Column(BigInteger(), nullable=False)
+    bytes_a_b = Column(BigInteger(), nullable=False)
+    frames_b_a = Column(BigInteger(), nullable=False)
+    bytes_b_a = Column(BigInteger(), nullable=False)
+    frames = Column(BigInteger(), nullable=False)
+    bytes = Column(BigInteger(), nullable=False)
+    relative_start = Column(Float(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_annotated_unit_conversation_start", "id_annotated_unit", "protocol", "relative_start"),
+        Index("ix_annotated_unit_conversation_ip_a", "id_annotated_unit", "protocol", "ip_a"),
+        Index("ix_annotated_unit_conversation_ip_b", "id_annotated_unit", "protocol", "ip_b"),
+        Index("ix_annotated_unit_conversation_port_a", "id_annotated_unit", "protocol", "port_a"),
+        Index("ix_annotated_unit_conversation_port_b", "id_annotated_unit", "protocol", "port_b"),
+        Index("ix_annotated_unit_conversation_frames", "id_annotated_unit", "protocol", "frames"),
+        Index("ix_annotated_unit_conversation_bytes", "id_annotated_unit", "protocol", "bytes"),
+    )
+
+    @staticmethod
+    def row_from_analysis(id_annotated_unit, protocol, conversation):
+        """
+        Convert conversation returned by TraceAnalyzer into table row
+
+        :param id_annotated_unit:
+        :param protocol: tcp or udp
+        :param conversation: dict with keys "IP A", "Port A", ...
+        :return: dict of column values
+        """
+        return dict(
+            id_annotated_unit=id_annotated_unit,
+            protocol=protocol,
+            ip_a=conversation["IP A"],
+            port_a=int(conversation["Port A"]),
+            ip_b=conversation["IP B"],
+            port_b=int(conversation["Port B"]),
+            frames_a_b=int(conversation["Frames A-B"]),
+            bytes_a_b=int(conversation["Bytes A-B"]),
+            frames_b_a=int(conversation["Frames B-A"]),
+            bytes_b_a=int(conversation["Bytes B-A"]),
+            frames=int(conversation["Frames"]),
+            bytes=int(conversation["Bytes"]),
+            relative_start=float(conversation["Relative start"]),
+        )
+
+    @staticmethod
+    def rows_from_analysis(id_annotated_unit, analysis):
+        """
+        Remove conversations from analysis and convert them into table rows
+
+        :param id_annotated_unit:
+        :param analysis: dict returned by TraceAnalyzer, conversations are removed from it
+        :return: list of dicts of column values
+        """
+        return [
+            ModelAnnotatedUnitConversation.row_from_analysis(id_annotated_unit, protocol, conversation)
+            for protocol, key in CONVERSATION_PROTOCOLS for conversation in analysis.pop(key, None) or []
+        ]
+
+    def dict(self):
+        return {
+            "IP A": self.ip_a,
+            "Port A": self.port_a,
+            "IP B": self.ip_b,
+            "Port B": self.port_b,
+            "Frames A-B": self.frames_a_b,
+            "Bytes A-B": self.bytes_a_b,
+            "Frames B-A": self.frames_b_a,
+            "Bytes B-A": self.bytes_b_a,
+            "Frames": self.frames,
+            "Bytes": self.bytes,
+            "Relative start": self.relative_start,
+        }
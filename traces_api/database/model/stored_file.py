@@ -0,0 +1,24 @@
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime, Index
+
+from traces_api.database import Base
+
+
+class ModelStoredFile(Base):
+    """
+    Distinct content saved in content addressed file storage
+
+    Content is referenced by units and annotated units, file is removed when its last reference is released.
+    """
+
+    __tablename__ = "stored_file"
+
+    storage = Column(String(32), primary_key=True)
+    file_location = Column(String(255), primary_key=True)
+    sha256 = Column(String(64), nullable=False)
+    size = Column(BigInteger(), nullable=False)
+    reference_count = Column(Integer(), nullable=False)
+    creation_time = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_stored_file_sha256", "storage", "sha256"),
+    )
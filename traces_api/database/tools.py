@@ -1,8 +1,15 @@
+import json
+import sqlalchemy.orm
+from sqlalchemy import or_
+
 from . import Base
 
 from .model.unit import ModelUnit
-from .model.annotated_unit import ModelAnnotatedUnit, ModelAnnotatedUnitLabel
+from .model.annotated_unit import ModelAnnotatedUnit, ModelAnnotatedUnitLabel, ModelAnnotatedUnitConversation
+from .model.annotated_unit import CONVERSATION_PROTOCOLS
 from .model.mix import ModelMix, ModelMixFileGeneration, ModelMixLabel, ModelMixOrigin
+from .model.stored_file import ModelStoredFile
+from .model.analysis_cache import ModelAnalysisCache
 
 
 """
@@ -12,10 +19,13 @@ TABLES = [
     ModelUnit.__table__,
     ModelAnnotatedUnit.__table__,
     ModelAnnotatedUnitLabel.__table__,
+    ModelAnnotatedUnitConversation.__table__,
     ModelMix.__table__,
     ModelMixLabel.__table__,
     ModelMixOrigin.__table__,
     ModelMixFileGeneration.__table__,
+    ModelStoredFile.__table__,
+    ModelAnalysisCache.__table__,
 ]
 
 
@@ -26,6 +36,32 @@ def create_database(engine):
     :return:
     """
     Base.metadata.create_all(engine, tables=TABLES)
+    migrate_annotated_unit_conversations(engine)
+
+
+def migrate_annotated_unit_conversations(engine):
+    """
+    Move conversations of annotated units created before conversation table existed from stats to the table
+
+    Every annotated unit is migrated in its own transaction, so interrupted migration continues on next start.
+    :param engine: sqlalchemy engine
+    """
+    session = sqlalchemy.orm.Session(bind=engine)
+    try:
+        ids = [id_annotated_unit for id_annotated_unit, in session.query(ModelAnnotatedUnit.id_annotated_unit).filter(
+            or_(*[ModelAnnotatedUnit.stats.contains('"%s"' % key) for _, key in CONVERSATION_PROTOCOLS])
+        )]
+
+        for id_annotated_unit in ids:
+            ann_unit = session.query(ModelAnnotatedUnit).get(id_annotated_unit)
+            stats = json.loads(ann_unit.stats)
+            rows = ModelAnnotatedUnitConversation.rows_from_analysis(id_annotated_unit, stats)
+            if rows:
+                session.execute(ModelAnnotatedUnitConversation.__table__.insert(), rows)
+            ann_unit.stats = json.dumps(stats)
+            session.commit()
+    finally:
+        session.close()
 
 
 def recreate_database(engine):
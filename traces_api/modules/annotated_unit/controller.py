@@ -1,11 +1,15 @@
-from flask import send_file, request
+from flask import request
 from flask_restplus import Resource
 from flask_injector import inject
 from pathvalidate import sanitize_filename
 
-from traces_api.tools import escape
+from traces_api.tools import escape, send_stream, send_capture
 from traces_api.api.restplus import api
+from traces_api.schemas import download_fields
+from traces_api.pcap.filter import FilterError
 from .schemas import ann_unit_details_response, ann_unit_find_response, ann_unit_find, ann_unit_update
+from .schemas import ann_unit_packets, ann_unit_packets_response, ann_unit_conversations, ann_unit_conversations_response
+from .schemas import ann_unit_timeseries, ann_unit_timeseries_response
 from .service import AnnotatedUnitService, AnnotatedUnitDoesntExistsException, OperatorEnum, UnableToRemoveAnnotatedUnitException
 from traces_api.modules.mix.service import MixService
 
@@ -40,24 +44,80 @@ class AnnUnitDownload(Resource):
         super().__init__(*args, **kwargs)
         self._service_ann_unit = service_ann_unit
 
+    @api.expect(download_fields)
     @api.response(200, "Annotated unit returned")
     @ns.produces(["application/binary"])
-    @api.doc(responses={404: "Annotated unit not found"})
+    @api.doc(responses={404: "Annotated unit not found", 400: "Invalid packet filter"})
     def get(self, id_annotated_unit):
         ann_unit = self._service_ann_unit.get_annotated_unit(id_annotated_unit)
+
+        args = download_fields.parse_args()
+        if args["from"] is not None or args["to"] is not None or args["filter"]:
+            file, chunks = self._service_ann_unit.download_annotated_unit_packets(id_annotated_unit, args["from"], args["to"], args["filter"])
+            file_name = "%s.%s" % (sanitize_filename(ann_unit.name), sanitize_filename(file.format))
+            return send_stream(chunks, file_name)
+
         file = self._service_ann_unit.download_annotated_unit(id_annotated_unit)
 
         file_name = "%s.%s" % (sanitize_filename(ann_unit.name), sanitize_filename(file.format))
-        if file.is_compressed():
-            file_name += ".gz"
-
-        return send_file(
-            file.location,
-            mimetype="application/vnd.tcpdump.pcap",
-            attachment_filename=file_name,
-            as_attachment=True,
-            cache_timeout=0
+        return send_capture(file, file_name)
+
+
+@ns.route('/<id_annotated_unit>/packets')
+@api.doc(params={'id_annotated_unit': 'ID of annotated unit'})
+class AnnUnitPackets(Resource):
+
+    @inject
+    def __init__(self, service_ann_unit: AnnotatedUnitService, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._service_ann_unit = service_ann_unit
+
+    @api.expect(ann_unit_packets)
+    @api.marshal_with(ann_unit_packets_response)
+    @api.doc(responses={404: "Annotated unit not found"})
+    def get(self, id_annotated_unit):
+        args = ann_unit_packets.parse_args()
+        packets = self._service_ann_unit.get_annotated_unit_packets(id_annotated_unit, args["offset"], args["limit"])
+        return dict(data=packets)
+
+
+@ns.route('/<id_annotated_unit>/conversations')
+@api.doc(params={'id_annotated_unit': 'ID of annotated unit'})
+class AnnUnitConversations(Resource):
+
+    @inject
+    def __init__(self, service_ann_unit: AnnotatedUnitService, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._service_ann_unit = service_ann_unit
+
+    @api.expect(ann_unit_conversations)
+    @api.marshal_with(ann_unit_conversations_response)
+    @api.doc(responses={404: "Annotated unit not found"})
+    def get(self, id_annotated_unit):
+        args = ann_unit_conversations.parse_args()
+        total, conversations = self._service_ann_unit.get_annotated_unit_conversations(
+            id_annotated_unit, protocol=args["protocol"], limit=args["limit"], page=args["page"], ip=args["ip"], port=args["port"],
+            min_frames=args["min_frames"], min_bytes=args["min_bytes"], sort_by=args["sort_by"],
+            descending=args["order"] == "desc"
         )
+        return dict(total=total, data=[c.dict() for c in conversations])
+
+
+@ns.route('/<id_annotated_unit>/timeseries')
+@api.doc(params={'id_annotated_unit': 'ID of annotated unit'})
+class AnnUnitTimeSeries(Resource):
+
+    @inject
+    def __init__(self, service_ann_unit: AnnotatedUnitService, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._service_ann_unit = service_ann_unit
+
+    @api.expect(ann_unit_timeseries)
+    @api.marshal_with(ann_unit_timeseries_response)
+    @api.doc(responses={404: "Annotated unit not found"})
+    def get(self, id_annotated_unit):
+        args = ann_unit_timeseries.parse_args()
+        return self._service_ann_unit.get_annotated_unit_timeseries(id_annotated_unit, args["resolution"])
 
 
 @ns.route('/<id_annotated_unit>/update')
@@ -133,3 +193,8 @@ def handle_ann_unit_unable_to_delete(error):
         return {'message': "{}. First you need to remove mix/es: {}".format(error_msg, ", ".join(mixes))}, 409, {}
 
     return {'message': error_msg}, 409, {}
+
+
+@ns.errorhandler(FilterError)
+def handle_invalid_filter(error):
+    return {'message': "Invalid packet filter: %s" % error}, 400, {}
@@ -1,10 +1,11 @@
-from flask_restplus import fields
+from flask_restplus import fields, reqparse
 
 from traces_api.api.restplus import api
 
 
-from traces_api.schemas import id_annotated_unit, label_field, ips, analytical_data
-from .service import OperatorEnum
+from traces_api.schemas import id_annotated_unit, label_field, ips, tcp_conversation, pairs_mac_ip, capture_info
+from traces_api.schemas import icmp_conversations, ipv6_endpoints
+from .service import OperatorEnum, CONVERSATION_SORT_COLUMNS, CONVERSATION_PROTOCOLS
 
 
 ann_unit_basic = dict(
@@ -18,7 +19,12 @@ ann_unit = ann_unit_basic.copy()
 ann_unit.update(dict(
     ip_details=ips,
     description=fields.String(),
-    stats=analytical_data,
+    stats=fields.Nested(api.model("AnnotatedUnitStats", dict(
+        icmp_conversations=icmp_conversations,
+        ipv6_endpoints=ipv6_endpoints,
+        pairs_mac_ip=pairs_mac_ip,
+        capture_info=capture_info,
+    )), description="Analysis of annotated unit, TCP and UDP conversations are available using conversations endpoint"),
 ))
 
 ann_unit_update = api.model("AnnUnitUpdate", dict(
@@ -46,3 +52,53 @@ ann_unit_find_response = api.model("AnnotatedUnitFindResponse",
                                    dict(data=fields.List(fields.Nested(api.model("AnnUnitBasic", ann_unit_basic)))))
 
 
+ann_unit_packets = reqparse.RequestParser()
+ann_unit_packets.add_argument('offset', type=int, location='args', default=0, help='Number of first packet, starting from 0')
+ann_unit_packets.add_argument('limit', type=int, location='args', default=100, help='Maximal number of packets (at most 1000)')
+
+ann_unit_packets_response = api.model("AnnotatedUnitPacketsResponse", dict(data=fields.List(fields.Nested(api.model("PacketPreview", dict(
+    number=fields.Integer(description="Number of packet in annotated unit, starting from 0", example=0),
+    time=fields.Float(description="Capture time in unixtime", example=1541346574.1234),
+    length=fields.Integer(description="Original length of packet", example=74),
+    captured_length=fields.Integer(description="Number of captured bytes", example=74),
+    eth_src=fields.String(example="08:00:27:bd:c2:37"),
+    eth_dst=fields.String(example="08:00:27:90:8f:c4"),
+    ip_src=fields.String(example="10.0.0.1"),
+    ip_dst=fields.String(example="10.0.0.2"),
+    protocol=fields.String(example="tcp"),
+    src_port=fields.Integer(example=34810),
+    dst_port=fields.Integer(example=22),
+    tcp_flags=fields.List(fields.String(example="SYN")),
+))))))
+
+ann_unit_conversations = reqparse.RequestParser()
+ann_unit_conversations.add_argument(
+    'protocol', type=str, location='args', default="tcp", choices=[protocol for protocol, _ in CONVERSATION_PROTOCOLS]
+)
+ann_unit_conversations.add_argument('limit', type=int, location='args', default=100, help='Limit number of rows')
+ann_unit_conversations.add_argument('page', type=int, location='args', default=0, help='Number of page to return, counting from 0')
+ann_unit_conversations.add_argument('ip', type=str, location='args', help='IP address on any side of conversation')
+ann_unit_conversations.add_argument('port', type=int, location='args', help='Port on any side of conversation')
+ann_unit_conversations.add_argument('min_frames', type=int, location='args', help='Minimal number of frames')
+ann_unit_conversations.add_argument('min_bytes', type=int, location='args', help='Minimal number of bytes')
+ann_unit_conversations.add_argument(
+    'sort_by', type=str, location='args', default="relative_start", choices=sorted(CONVERSATION_SORT_COLUMNS)
+)
+ann_unit_conversations.add_argument('order', type=str, location='args', default="asc", choices=["asc", "desc"])
+
+ann_unit_conversations_response = api.model("AnnotatedUnitConversationsResponse", dict(
+    total=fields.Integer(description="Number of conversations matching criteria", example=61),
+    data=fields.List(fields.Nested(tcp_conversation)),
+))
+
+ann_unit_timeseries = reqparse.RequestParser()
+ann_unit_timeseries.add_argument(
+    'resolution', type=float, location='args', help='Interval in seconds, coarser interval is used if it is not precomputed'
+)
+
+ann_unit_timeseries_response = api.model("AnnotatedUnitTimeSeriesResponse", dict(
+    resolution=fields.Float(description="Interval in seconds", example=0.1),
+    start=fields.Float(description="Start of first interval in unixtime", example=1541346574.1),
+    packets=fields.List(fields.Integer(), description="Number of packets in every interval"),
+    bytes=fields.List(fields.Integer(), description="Number of bytes in every interval"),
+))
@@ -1,14 +1,21 @@
+import os
 import json
 import sqlalchemy.exc
 from enum import Enum
 from datetime import datetime
-from sqlalchemy import desc, or_, and_
+from sqlalchemy import desc, asc, or_, and_, func
 
-from traces_api.database.model.annotated_unit import ModelAnnotatedUnit, ModelAnnotatedUnitLabel
+from traces_api.database.model.annotated_unit import ModelAnnotatedUnit, ModelAnnotatedUnitLabel, ModelAnnotatedUnitConversation
+from traces_api.database.model.annotated_unit import CONVERSATION_PROTOCOLS
 
 from traces_api.trace_tools import TraceAnalyzer, TraceNormalizer
 from traces_api.storage import FileStorage, File
+from traces_api.analysis_cache import AnalysisCache
 from traces_api.tools import escape
+from traces_api.pcap.slice import slice_capture, timestamp_from_seconds
+from traces_api.pcap.filter import compile_filter
+from traces_api.pcap.preview import preview_capture
+from traces_api.pcap.timeseries import load_timeseries, save_timeseries, build_timeseries, select_level, TIMESERIES_SUFFIX
 
 
 class AnnotatedUnitDoesntExistsException(Exception):
@@ -39,22 +46,38 @@ class OperatorEnum(Enum):
     OR = "OR"
 
 
+"""
+Columns by which conversations of annotated unit can be sorted
+"""
+CONVERSATION_SORT_COLUMNS = dict(
+    ip_a=ModelAnnotatedUnitConversation.ip_a,
+    port_a=ModelAnnotatedUnitConversation.port_a,
+    ip_b=ModelAnnotatedUnitConversation.ip_b,
+    port_b=ModelAnnotatedUnitConversation.port_b,
+    frames=ModelAnnotatedUnitConversation.frames,
+    bytes=ModelAnnotatedUnitConversation.bytes,
+    relative_start=ModelAnnotatedUnitConversation.relative_start,
+)
+
+
 class AnnotatedUnitService:
     """
     This class allows to perform all business logic regarding to annotated units
     """
 
-    def __init__(self, session_maker, file_storage: FileStorage, trace_analyzer: TraceAnalyzer, trace_normalizer: TraceNormalizer):
+    def __init__(self, session_maker, file_storage: FileStorage, trace_analyzer: TraceAnalyzer, trace_normalizer: TraceNormalizer, analysis_cache: AnalysisCache = None):
         """
         :param session_maker: SqlAlchemy session maker
         :param file_storage: file storage used for storing datasets
         :param trace_analyzer: trace analyzer tool
         :param trace_normalizer: trace normalizer tool
+        :param analysis_cache: cache of analyses, every normalized unit is analyzed if None
         """
         self._session_maker = session_maker
         self._file_storage = file_storage
         self._trace_analyzer = trace_analyzer
         self._trace_normalizer = trace_normalizer
+        self._analysis_cache = analysis_cache
 
     @property
     def _session(self):
@@ -75,27 +98,68 @@ class AnnotatedUnitService:
         :return: new annotated unit
         """
         new_ann_unit_file = File.create_new()
+        try:
+            # Normalized file keeps format of unit, so it is stored under correct format
+            configuration = self._trace_normalizer.prepare_configuration(
+                ip_mapping, mac_mapping, timestamp, output_format=unit_file.format
+            )
+            self._trace_normalizer.normalize(unit_file.location, new_ann_unit_file.location, configuration)
+
+            with open(new_ann_unit_file.location, "rb") as f:
+                ann_unit_file_name = self._file_storage.save_file(f, format=unit_file.format)
+
+            try:
+                analyzed_data = escape(self._analyze_normalized(new_ann_unit_file.location, ann_unit_file_name))
+                # Conversations are stored in separate table, stats keep only small part of analysis
+                conversations = {key: analyzed_data.pop(key, None) for _, key in CONVERSATION_PROTOCOLS}
+
+                annotated_unit = ModelAnnotatedUnit(
+                    name=name,
+                    description=description,
+                    creation_time=datetime.now(),
+                    stats=json.dumps(analyzed_data),
+                    ip_details=json.dumps(ip_details.dict()),
+                    file_location=ann_unit_file_name,
+                    labels=[ModelAnnotatedUnitLabel(label=l.lower()) for l in labels]
+                )
 
-        configuration = self._trace_normalizer.prepare_configuration(ip_mapping, mac_mapping, timestamp)
-        self._trace_normalizer.normalize(unit_file.location, new_ann_unit_file.location, configuration)
-
-        analyzed_data = escape(self._trace_analyzer.analyze(new_ann_unit_file.location))
+                self._session.add(annotated_unit)
+                self._session.flush()
+
+                rows = ModelAnnotatedUnitConversation.rows_from_analysis(annotated_unit.id_annotated_unit, conversations)
+                if rows:
+                    self._session.execute(ModelAnnotatedUnitConversation.__table__.insert(), rows)
+            except Exception:
+                self._session.rollback()
+                self.release_annotated_unit_file(ann_unit_file_name)
+                raise
+        finally:
+            os.remove(new_ann_unit_file.location)
+        return annotated_unit
 
-        with open(new_ann_unit_file.location, "rb") as f:
-            ann_unit_file_name = self._file_storage.save_file(f, format=unit_file.format)
+    def _analyze_normalized(self, location, file_location):
+        """
+        :param location: location of normalized capture
+        :param file_location: relative location of the same capture saved in file storage
+        :return: dict that contains analyzed information
+        """
+        if self._analysis_cache is None:
+            return self._trace_analyzer.analyze(location)
+        # Normalizations of the same unit with the same configuration give the same capture, digest computed by
+        # storage while saving is reused, so capture is not hashed again
+        digest = self._file_storage.get_digest(file_location)
+        return self._analysis_cache.analyze(self._trace_analyzer, location, digest)
+
+    def release_annotated_unit_file(self, file_location):
+        """
+        Release stored file of annotated unit that was not committed to database
 
-        annotated_unit = ModelAnnotatedUnit(
-            name=name,
-            description=description,
-            creation_time=datetime.now(),
-            stats=json.dumps(analyzed_data),
-            ip_details=json.dumps(ip_details.dict()),
-            file_location=ann_unit_file_name,
-            labels=[ModelAnnotatedUnitLabel(label=l.lower()) for l in labels]
-        )
+        Annotated unit returned by create_annotated_unit is committed by caller, caller releases its file when
+        commit fails.
 
-        self._session.add(annotated_unit)
-        return annotated_unit
+        :param file_location: file location of annotated unit
+        """
+        self._file_storage.remove_file(file_location)
 
     def update_annotated_unit(self, id_annotated_unit, name=None, description=None, labels=None):
         """
@@ -147,6 +211,107 @@ class AnnotatedUnitService:
 
         return self._file_storage.get_file(ann_unit.file_location)
 
+    def download_annotated_unit_packets(self, id_annotated_unit, time_from=None, time_to=None, packet_filter=None):
+        """
+        Return packets of annotated unit captured in time range that match packet filter
+
+        :param id_annotated_unit:
+        :param time_from: start of time range in seconds since epoch, unlimited if None
+        :param time_to: end of time range in seconds since epoch, unlimited if None
+        :param packet_filter: filter expression (see traces_api.pcap.filter), every packet matches if None
+        :return: tuple (File, generator of bytes chunks of capture with selected packets)
+        :raises FilterError: packet filter is invalid
+        """
+        predicate = compile_filter(packet_filter) if packet_filter else None
+        file = self.download_annotated_unit(id_annotated_unit)
+        chunks = slice_capture(
+            file.location, timestamp_from_seconds(time_from), timestamp_from_seconds(time_to),
+            format=file.format, predicate=predicate
+        )
+        return file, chunks
+
+    def get_annotated_unit_packets(self, id_annotated_unit, offset=0, limit=100):
+        """
+        Decode headers of window of annotated unit packets
+
+        :param id_annotated_unit:
+        :param offset: number of first packet, starting from 0
+        :param limit: maximal number of packets
+        :return: list of dicts with decoded headers of packets
+        """
+        file = self.download_annotated_unit(id_annotated_unit)
+        return preview_capture(file.location, offset, limit)
+
+    def get_annotated_unit_timeseries(self, id_annotated_unit, resolution=None):
+        """
+        Return packets and bytes per time interval of annotated unit
+
+        Time-series is computed when annotated unit is stored, annotated units stored without it are read once and
+        their time-series is saved.
+
+        :param id_annotated_unit:
+        :param resolution: requested interval in seconds, the finest precomputed interval at least as long is used
+        :return: dict with resolution, start, packets and bytes
+        """
+        file = self.download_annotated_unit(id_annotated_unit)
+
+        levels = load_timeseries(file.location + TIMESERIES_SUFFIX)
+        if levels is None:
+            levels = build_timeseries(file.location)
+            if file.is_compressed():
+                save_timeseries(file.location + TIMESERIES_SUFFIX, levels)
+
+        level = select_level(levels, timestamp_from_seconds(resolution))
+        if level is None:
+            return dict(resolution=None, start=None, packets=[], bytes=[])
+        return level.dict()
+
+    def get_annotated_unit_conversations(self, id_annotated_unit, protocol="tcp", limit=100, page=0, ip=None, port=None,
+                                         min_frames=None, min_bytes=None, sort_by="relative_start", descending=False):
+        """
+        Find TCP or UDP conversations of annotated unit
+
+        :param id_annotated_unit:
+        :param protocol: tcp or udp
+        :param limit: number of conversations returned in one request, default 100
+        :param page: page id, starting from 0
+        :param ip: search conversations with IP address on any side
+        :param port: search conversations with port on any side
+        :param min_frames: search conversations with at least this number of frames
+        :param min_bytes: search conversations with at least this number of bytes
+        :param sort_by: key of CONVERSATION_SORT_COLUMNS
+        :param descending: True if conversations should be sorted in descending order
+        :return: tuple (total number of matching conversations, list of conversations on page)
+        """
+        if not self.get_annotated_unit(id_annotated_unit):
+            raise AnnotatedUnitDoesntExistsException()
+
+        filters = [
+            ModelAnnotatedUnitConversation.id_annotated_unit == id_annotated_unit,
+            ModelAnnotatedUnitConversation.protocol == protocol,
+        ]
+
+        if ip:
+            filters.append(or_(ModelAnnotatedUnitConversation.ip_a == ip, ModelAnnotatedUnitConversation.ip_b == ip))
+
+        if port is not None:
+            filters.append(or_(ModelAnnotatedUnitConversation.port_a == port, ModelAnnotatedUnitConversation.port_b == port))
+
+        if min_frames is not None:
+            filters.append(ModelAnnotatedUnitConversation.frames >= min_frames)
+
+        if min_bytes is not None:
+            filters.append(ModelAnnotatedUnitConversation.bytes >= min_bytes)
+
+        total = self._session.query(func.count(ModelAnnotatedUnitConversation.id_conversation)).filter(*filters).scalar()
+
+        order = desc if descending else asc
+        q = self._session.query(ModelAnnotatedUnitConversation).filter(*filters)
+        q = q.order_by(order(CONVERSATION_SORT_COLUMNS[sort_by]), order(ModelAnnotatedUnitConversation.id_conversation))
+        q = q.offset(page*limit).limit(limit)
+
+        return total, q.all()
+
     def get_annotated_units(self, limit=100, page=0, name=None, labels=None, description=None, operator=OperatorEnum.AND):
         """
         Find annotated units
@@ -198,9 +363,13 @@ class AnnotatedUnitService:
         if not ann_unit:
             raise AnnotatedUnitDoesntExistsException()
 
+        file_location = ann_unit.file_location
         try:
             self._session.delete(ann_unit)
             self._session.commit()
         except sqlalchemy.exc.IntegrityError as ex:
             self._session.rollback()
             raise UnableToRemoveAnnotatedUnitException() from ex
+
+        # File can be shared with other annotated units with the same content, storage removes it with last reference
+        self._file_storage.remove_file(file_location)
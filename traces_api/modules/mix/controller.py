@@ -1,10 +1,12 @@
-from flask import send_file, request
+from flask import request
 from flask_restplus import Resource
 from flask_injector import inject
 from pathvalidate import sanitize_filename
 
 from traces_api.api.restplus import api
-from traces_api.tools import escape
+from traces_api.tools import escape, send_stream, send_capture
+from traces_api.schemas import download_fields
+from traces_api.pcap.filter import FilterError
 from .schemas import mix_detail_response, mix_find, mix_find_response, mix_create, mix_create_response, mix_update
 from .schemas import mix_generate_status_response
 from .service import MixService, MixDoesntExistsException, AnnotatedUnitDoesntExistsException, OperatorEnum
@@ -70,24 +72,23 @@ class MixDownload(Resource):
         super().__init__(*args, **kwargs)
         self._service_mix = service_mix
 
+    @api.expect(download_fields)
     @api.response(200, "Mix returned")
     @ns.produces(["application/binary"])
-    @api.doc(responses={404: "Mix not found"})
+    @api.doc(responses={404: "Mix not found", 400: "Invalid packet filter"})
     def get(self, id_mix):
         mix = self._service_mix.get_mix(id_mix)
+
+        args = download_fields.parse_args()
+        if args["from"] is not None or args["to"] is not None or args["filter"]:
+            file, chunks = self._service_mix.download_mix_packets(id_mix, args["from"], args["to"], args["filter"])
+            file_name = "%s.%s" % (sanitize_filename(mix.name), sanitize_filename(file.format))
+            return send_stream(chunks, file_name)
+
         file = self._service_mix.download_mix(id_mix)
 
         file_name = "%s.%s" % (sanitize_filename(mix.name), sanitize_filename(file.format))
-        if file.is_compressed():
-            file_name += ".gz"
-
-        return send_file(
-            file.location,
-            mimetype="application/vnd.tcpdump.pcap",
-            attachment_filename=file_name,
-            as_attachment=True,
-            cache_timeout=0
-        )
+        return send_capture(file, file_name)
 
 
 @ns.route('/find')
@@ -164,3 +165,8 @@ def handle_mix_doesnt_exits(error):
 @ns.errorhandler(AnnotatedUnitDoesntExistsException)
 def handle_ann_unit_doesnt_exits(error):
     return {'message': "Annotated unit does not exists"}, 404, {}
+
+
+@ns.errorhandler(FilterError)
+def handle_invalid_filter(error):
+    return {'message': "Invalid packet filter: %s" % error}, 400, {}
@@ -9,8 +9,10 @@ from traces_api.database.model.mix import ModelMix, ModelMixLabel, ModelMixOrigi
 
 from traces_api.modules.annotated_unit.service import AnnotatedUnitService
 from traces_api.trace_tools import TraceNormalizer, TraceMixing
-from traces_api.storage import FileStorage, File
+from traces_api.storage import FileStorage
 from traces_api.modules.unit.service import Mapping
+from traces_api.pcap.slice import slice_capture, timestamp_from_seconds
+from traces_api.pcap.filter import compile_filter
 
 
 class AnnotatedUnitDoesntExistsException(Exception):
@@ -86,26 +88,21 @@ class MixService:
             raise AnnotatedUnitDoesntExistsException()
 
         self._update_mix_generation_progress(mix_generation_id, 1)
-        mixing = self._trace_mixing.create_new_mixer(File.create_new().location)
 
-        num_processed = 0
-        num_ann_units = len(annotated_units_data)
+        annotated_units = []
         for ann_unit in annotated_units_data:
-            id_annotated_unit = ann_unit["id_annotated_unit"]
-
-            new_ann_unit_file = File.create_new()
-            ann_unit_file = self._annotated_unit_service.download_annotated_unit(id_annotated_unit)
+            ann_unit_file = self._annotated_unit_service.download_annotated_unit(ann_unit["id_annotated_unit"])
             configuration = self._trace_normalizer.prepare_configuration(ann_unit["ip_mapping"], ann_unit["mac_mapping"], ann_unit["timestamp"])
-            self._trace_normalizer.normalize(ann_unit_file.location, new_ann_unit_file.location, configuration)
+            annotated_units.append((ann_unit_file.location, configuration))
 
-            mixing.mix(new_ann_unit_file.location)
+        num_ann_units = len(annotated_units)
 
-            num_processed = num_processed + 1
+        def update_progress(num_processed):
             self._update_mix_generation_progress(mix_generation_id, int(99*(num_processed/num_ann_units)))
 
-        mix_file = File(mixing.get_mixed_file_location())
-        with open(mix_file.location, "rb") as f:
-            file_name = self._file_storage.save_file(f, format="pcap")
+        # Mix is generated lazily and compressed on the fly while it is saved
+        mix_data = self._trace_mixing.mix_annotated_units(self._trace_normalizer, annotated_units, update_progress)
+        file_name = self._file_storage.save_file(mix_data, format=self._trace_mixing.OUTPUT_FORMAT)
 
         mix_generation = self.get_mix_generation_by_id_generation(mix_generation_id)
         mix_generation.file_location = file_name
@@ -275,6 +272,25 @@ class MixService:
             raise MixDoesntExistsException()
         return self._file_storage.get_file(mix_generation.file_location)
 
+    def download_mix_packets(self, id_mix, time_from=None, time_to=None, packet_filter=None):
+        """
+        Return packets of mix captured in time range that match packet filter
+
+        :param id_mix:
+        :param time_from: start of time range in seconds since epoch, unlimited if None
+        :param time_to: end of time range in seconds since epoch, unlimited if None
+        :param packet_filter: filter expression (see traces_api.pcap.filter), every packet matches if None
+        :return: tuple (mix File, generator of bytes chunks of capture with selected packets)
+        :raises FilterError: packet filter is invalid
+        """
+        predicate = compile_filter(packet_filter) if packet_filter else None
+        file = self.download_mix(id_mix)
+        chunks = slice_capture(
+            file.location, timestamp_from_seconds(time_from), timestamp_from_seconds(time_to),
+            format=file.format, predicate=predicate
+        )
+        return file, chunks
+
     def get_mixes(self, limit=100, page=0, name=None, labels=None, description=None, operator=OperatorEnum.AND):
         """
         Find mixes
@@ -7,6 +7,7 @@ from traces_api.database.model.unit import ModelUnit
 from traces_api.modules.annotated_unit.service import AnnotatedUnitService
 from traces_api.trace_tools import TraceAnalyzer
 from traces_api.storage import FileStorage
+from traces_api.analysis_cache import AnalysisCache
 from traces_api.tools import escape
 
 
@@ -179,17 +180,19 @@ class UnitServiceAbstract:
 
 class UnitService(UnitServiceAbstract):
 
-    def __init__(self, session_maker, annotated_unit_service: AnnotatedUnitService, file_storage: FileStorage, trace_analyzer: TraceAnalyzer):
+    def __init__(self, session_maker, annotated_unit_service: AnnotatedUnitService, file_storage: FileStorage, trace_analyzer: TraceAnalyzer, analysis_cache: AnalysisCache = None):
         """
         :param session_maker: SqlAlchemy session maker
         :param annotated_unit_service: AnnotatedUnitService
         :param file_storage: file storage for storing datasets
         :param trace_analyzer: trace analyzer is used to extract analytical data from dataset
+        :param analysis_cache: cache of analyses, every upload is analyzed if None
         """
         self._session_maker = session_maker
         self._annotated_unit_service = annotated_unit_service
         self._trace_analyzer = trace_analyzer
         self._file_storage = file_storage
+        self._analysis_cache = analysis_cache
 
     @property
     def _session(self):
@@ -211,18 +214,53 @@ class UnitService(UnitServiceAbstract):
         else:
             format = "pcap"
 
-        file_path = self._file_storage.save_file(file.stream, format)
+        # Upload is read only once, it is hashed, compressed and analyzed in one pass when analyzer supports it
+        analysis = self._trace_analyzer.create_stream_analysis()
+        file_path = self._file_storage.save_file(file.stream, format, analysis=analysis)
 
-        unit = ModelUnit(
-            creation_time=datetime.now(),
-            last_update_time=datetime.now(),
-            uploaded_file_location=file_path,
-            stage="upload"
-        )
+        try:
+            analyzed_data = self._analyze_upload(file_path, analysis)
 
-        self._session.add(unit)
-        self._session.commit()
-        return unit, escape(self._trace_analyzer.analyze(self._file_storage.get_file(file_path).location))
+            unit = ModelUnit(
+                creation_time=datetime.now(),
+                last_update_time=datetime.now(),
+                uploaded_file_location=file_path,
+                stage="upload"
+            )
+
+            self._session.add(unit)
+            self._session.commit()
+        except Exception:
+            # Saved file would not be referenced by any unit
+            self._session.rollback()
+            self._file_storage.remove_file(file_path)
+            raise
+
+        return unit, escape(analyzed_data)
+
+    def _analyze_upload(self, file_path, analysis):
+        """
+        Upload is analyzed while it is saved only with native backend, otherwise saved file is analyzed
+
+        :param file_path: relative location of saved upload
+        :param analysis: StreamAnalysis fed while upload was saved or None
+        :return: dict that contains analyzed information
+        """
+        saved_file = self._file_storage.get_file(file_path)
+        location = saved_file.location
+        # Digest computed by storage while saving is reused, re-uploaded captures are not analyzed again
+        digest = self._file_storage.get_digest(file_path) if self._analysis_cache is not None else None
+
+        if analysis is not None and analysis.finished:
+            analyzed_data = analysis.result(location, saved_file.codec.name if saved_file.codec else None)
+            # Analysis computed while saving is cached as well, so it is shared with analyses of saved files
+            if digest is not None and self._analysis_cache.get(digest, self._trace_analyzer.VERSION) is None:
+                self._analysis_cache.put(digest, self._trace_analyzer.VERSION, analyzed_data)
+            return analyzed_data
+
+        if self._analysis_cache is None:
+            return self._trace_analyzer.analyze(location)
+        return self._analysis_cache.analyze(self._trace_analyzer, location, digest)
 
     def unit_annotate(self, id_unit, name, description=None, labels=None):
         unit = self._get_unit(id_unit)
@@ -264,8 +302,14 @@ class UnitService(UnitServiceAbstract):
         )
 
         unit_file_location = unit.uploaded_file_location
-        self._session.delete(unit)
-        self._session.commit()
+        ann_unit_file_location = annotated_unit.file_location
+        try:
+            self._session.delete(unit)
+            self._session.commit()
+        except Exception:
+            self._session.rollback()
+            self._annotated_unit_service.release_annotated_unit_file(ann_unit_file_location)
+            raise
 
         self._file_storage.remove_file(unit_file_location)
 
@@ -0,0 +1,432 @@
+"""
+Single pass analysis of captured traffic dump
+
+Computes the same information as trace-analyzer tool (tshark conversations and endpoints, MAC-IP pairs and capinfos)
+while reading every packet exactly once. Every kind of conversations has its own hash table.
+"""
+import os
+import hashlib
+
+from .reader import PcapReader
+from .codecs import detect_codec
+from .decode import decode, format_ip, format_mac, IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMP, IPPROTO_ICMPV6
+
+ENCAPSULATIONS = {
+    0: "NULL/Loopback",
+    1: "Ethernet",
+    101: "Raw IP",
+    108: "OpenBSD loopback",
+    113: "Linux cooked-mode capture v1",
+    228: "Raw IPv4",
+    229: "Raw IPv6",
+}
+
+HASH_ALGORITHMS = [("SHA256", "sha256"), ("RIPEMD160", "ripemd160"), ("SHA1", "sha1")]
+
+
+class HashingStream:
+    """
+    Readable stream wrapper that computes hashes and size of all data read through it
+    """
+
+    def __init__(self, stream, hashers):
+        """
+        :param stream: readable binary stream
+        :param hashers: dict name -> hashlib object
+        """
+        self._stream = stream
+        self.hashers = hashers
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        for hasher in self.hashers.values():
+            hasher.update(data)
+        self.size += len(data)
+        return data
+
+    def drain(self, chunk_size=1024 * 1024):
+        """
+        Read remaining data so that hashes cover whole stream
+        """
+        while self.read(chunk_size):
+            pass
+
+
+def create_hashers():
+    """
+    Create hash objects for capinfos hashes, algorithms not supported by current openssl are skipped
+
+    :return: dict name -> hashlib object
+    """
+    hashers = {}
+    for name, algorithm in HASH_ALGORITHMS:
+        try:
+            hashers[name] = hashlib.new(algorithm)
+        except ValueError:
+            pass
+    return hashers
+
+
+class CaptureAnalyzer:
+    """
+    Incremental capture analyzer
+
+    Example usage:
+        analyzer = CaptureAnalyzer()
+        for packet in reader:
+            analyzer.add(packet)
+        analyzer.tcp_conversations()
+
+    Conversation tables map (A, B) and (B, A) keys to tuple (conversation, True if packet goes from A to B),
+    conversation is list [address A, address B, frames A-B, bytes A-B, frames B-A, bytes B-A, start timestamp].
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.data_bytes = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.strict_time_order = True
+
+        self._tcp_conversations = {}
+        self._tcp_conversations_list = []
+        self._udp_conversations = {}
+        self._udp_conversations_list = []
+        self._icmp_conversations = {}
+        self._icmp_conversations_list = []
+
+        # address -> [tx packets, tx bytes, rx packets, rx bytes]
+        self._ipv6_endpoints = {}
+
+        # dicts are used as ordered sets
+        self._src_pairs = {}
+        self._dst_pairs = {}
+
+    def add(self, packet):
+        """
+        Process one packet
+
+        :param packet: Packet
+        """
+        timestamp = packet.timestamp
+        self.packets += 1
+        self.data_bytes += packet.length
+
+        if self.first_timestamp is None:
+            self.first_timestamp = self.min_timestamp = self.max_timestamp = timestamp
+        else:
+            if timestamp < self.last_timestamp:
+                self.strict_time_order = False
+            if timestamp < self.min_timestamp:
+                self.min_timestamp = timestamp
+            if timestamp > self.max_timestamp:
+                self.max_timestamp = timestamp
+        self.last_timestamp = timestamp
+
+        headers = decode(packet.data, packet.link_type)
+        ip_version = headers.ip_version
+        if ip_version is None:
+            return
+
+        length = packet.length
+        protocol = headers.protocol
+        ip_src, ip_dst = headers.ip_src, headers.ip_dst
+
+        if ip_version == 6:
+            self._add_ipv6_endpoints(ip_src, ip_dst, length)
+        elif headers.eth_src is not None:
+            self._src_pairs[(headers.eth_src, ip_src)] = None
+            self._dst_pairs[(headers.eth_dst, ip_dst)] = None
+
+        if headers.src_port is not None:
+            src, dst = (ip_src, headers.src_port), (ip_dst, headers.dst_port)
+            if protocol == IPPROTO_TCP:
+                # TCP conversations are IPv4 only as in trace-analyzer
+                if ip_version == 4:
+                    self._add_conversation(
+                        self._tcp_conversations, self._tcp_conversations_list, src, dst, length, timestamp
+                    )
+            elif protocol == IPPROTO_UDP:
+                self._add_conversation(self._udp_conversations, self._udp_conversations_list, src, dst, length, timestamp)
+        elif protocol == IPPROTO_ICMP and ip_version == 4 or protocol == IPPROTO_ICMPV6 and ip_version == 6:
+            self._add_conversation(
+                self._icmp_conversations, self._icmp_conversations_list, (ip_src,), (ip_dst,), length, timestamp
+            )
+
+    @staticmethod
+    def _add_conversation(conversations, conversations_list, src, dst, length, timestamp):
+        item = conversations.get((src, dst))
+        if item is None:
+            conversation = [src, dst, 0, 0, 0, 0, timestamp]
+            conversations[(src, dst)] = (conversation, True)
+            conversations[(dst, src)] = (conversation, False)
+            conversations_list.append(conversation)
+            a_to_b = True
+        else:
+            conversation, a_to_b = item
+
+        if a_to_b:
+            conversation[2] += 1
+            conversation[3] += length
+        else:
+            conversation[4] += 1
+            conversation[5] += length
+
+    def _add_ipv6_endpoints(self, ip_src, ip_dst, length):
+        endpoint = self._ipv6_endpoints.get(ip_src)
+        if endpoint is None:
+            endpoint = self._ipv6_endpoints[ip_src] = [0, 0, 0, 0]
+        endpoint[0] += 1
+        endpoint[1] += length
+
+        endpoint = self._ipv6_endpoints.get(ip_dst)
+        if endpoint is None:
+            endpoint = self._ipv6_endpoints[ip_dst] = [0, 0, 0, 0]
+        endpoint[2] += 1
+        endpoint[3] += length
+
+    def _format_conversations(self, conversations_list):
+        result = []
+        for a, b, frames_ab, bytes_ab, frames_ba, bytes_ba, start in conversations_list:
+            conversation = {"IP A": format_ip(a[0])}
+            if len(a) > 1:
+                conversation["Port A"] = a[1]
+            conversation["IP B"] = format_ip(b[0])
+            if len(b) > 1:
+                conversation["Port B"] = b[1]
+            conversation.update({
+                "Frames B-A": frames_ba,
+                "Bytes B-A": bytes_ba,
+                "Frames A-B": frames_ab,
+                "Bytes A-B": bytes_ab,
+                "Frames": frames_ab + frames_ba,
+                "Bytes": bytes_ab + bytes_ba,
+                "Relative start": (start - self.first_timestamp) / 1000000000,
+            })
+            result.append(conversation)
+
+        # tshark orders conversations by number of frames, sort is stable as in tshark
+        result.sort(key=lambda c: c["Frames"], reverse=True)
+        return result
+
+    def tcp_conversations(self):
+        """
+        IPv4 TCP conversations in the same format and order as tshark -z conv,tcp prints them
+
+        :return: list of dicts
+        """
+        return self._format_conversations(self._tcp_conversations_list)
+
+    def udp_conversations(self):
+        """
+        UDP conversations in the same format and order as tshark -z conv,udp prints them
+
+        :return: list of dicts
+        """
+        return self._format_conversations(self._udp_conversations_list)
+
+    def icmp_conversations(self):
+        """
+        IP conversations of ICMP and ICMPv6 packets (tshark -z conv,ip,icmp -z conv,ipv6,icmpv6)
+
+        :return: list of dicts without ports
+        """
+        return self._format_conversations(self._icmp_conversations_list)
+
+    def ipv6_endpoints(self):
+        """
+        IPv6 endpoints in the same format and order as tshark -z endpoints,ipv6 prints them
+
+        :return: list of dicts
+        """
+        result = [
+            {
+                "IP": format_ip(address),
+                "Packets": tx_packets + rx_packets,
+                "Bytes": tx_bytes + rx_bytes,
+                "Tx Packets": tx_packets,
+                "Tx Bytes": tx_bytes,
+                "Rx Packets": rx_packets,
+                "Rx Bytes": rx_bytes,
+            }
+            for address, (tx_packets, tx_bytes, rx_packets, rx_bytes) in self._ipv6_endpoints.items()
+        ]
+        result.sort(key=lambda e: e["Packets"], reverse=True)
+        return result
+
+    def pairs_mac_ip(self):
+        """
+        Unique source MAC-IP pairs followed by unique destination MAC-IP pairs
+
+        :return: list of dicts
+        """
+        pairs = list(self._src_pairs) + list(self._dst_pairs)
+        return [{"MAC": format_mac(mac), "IP": format_ip(ip)} for mac, ip in pairs]
+
+    def capture_info(self, reader, file_name, file_size, compressed=None, hashers=None):
+        """
+        Capture file properties in the same format as capinfos -S -M prints them
+
+        :param reader: PcapReader used for reading packets
+        :param file_name: name of analyzed file
+        :param file_size: size of analyzed file in bytes
+        :param compressed: name of codec of analyzed file (e.g. gzip) or None if file is not compressed
+        :param hashers: dict name -> hashlib object with hashes of capture
+        :return: dict
+        """
+        digits = 9 if reader.nanosecond else 6
+
+        if reader.format == "pcapng":
+            file_type = "Wireshark/... - pcapng"
+        elif reader.nanosecond:
+            file_type = "Wireshark/tcpdump/... - nanosecond pcap"
+        else:
+            file_type = "Wireshark/tcpdump/... - pcap"
+        if compressed:
+            file_type += " (%s compressed)" % compressed
+
+        link_types = {i.link_type for i in reader.interfaces}
+        if len(link_types) == 1:
+            link_type = link_types.pop()
+            encapsulation = ENCAPSULATIONS.get(link_type, "Unknown (%s)" % link_type)
+        else:
+            encapsulation = "Per packet"
+
+        info = {
+            "File name": file_name,
+            "File type": file_type,
+            "File encapsulation": encapsulation,
+            "File timestamp precision": "nanoseconds (9)" if reader.nanosecond else "microseconds (6)",
+        }
+
+        if reader.snaplen:
+            info["Packet size limit"] = "file hdr: %s bytes" % reader.snaplen
+
+        info["Number of packets"] = str(self.packets)
+        info["File size"] = "%s bytes" % file_size
+        info["Data size"] = "%s bytes" % self.data_bytes
+
+        if self.packets:
+            duration = (self.max_timestamp - self.min_timestamp) / 1000000000
+            info["Capture duration"] = "%.*f seconds" % (digits, duration)
+            info["First packet time"] = self._format_timestamp(self.min_timestamp, digits)
+            info["Last packet time"] = self._format_timestamp(self.max_timestamp, digits)
+            if duration > 0:
+                info["Data byte rate"] = "%.2f bytes/s" % (self.data_bytes / duration)
+                info["Data bit rate"] = "%.2f bits/s" % (self.data_bytes * 8 / duration)
+            info["Average packet size"] = "%.2f bytes" % (self.data_bytes / self.packets)
+            if duration > 0:
+                info["Average packet rate"] = "%.2f packets/s" % (self.packets / duration)
+
+        for name, hasher in (hashers or {}).items():
+            info[name] = hasher.hexdigest()
+
+        info["Strict time order"] = "True" if self.strict_time_order else "False"
+
+        application = reader.section_options.get(4)
+        if application:
+            info["Capture application"] = application.decode("utf-8", "replace")
+
+        info["Number of interfaces in file"] = str(len(reader.interfaces))
+        return info
+
+    @staticmethod
+    def _format_timestamp(timestamp, digits):
+        seconds, fraction = divmod(timestamp, 1000000000)
+        if digits == 6:
+            fraction //= 1000
+        return "%d.%0*d" % (seconds, digits, fraction)
+
+
+class StreamAnalysis:
+    """
+    Analysis of capture computed while capture is read by someone else (e.g. while it is compressed)
+
+    Reader of capture passes read data to hashers, calls start with PcapReader and adds every packet.
+
+    Example usage:
+        analysis = StreamAnalysis()
+        compress_indexed(stream, output, analysis=analysis)
+        if analysis.finished:
+            analysis.result(location)
+    """
+
+    def __init__(self):
+        self.hashers = create_hashers()
+        self.analyzer = CaptureAnalyzer()
+        self.reader = None
+        self.failed = False
+
+    def start(self, reader):
+        """
+        :param reader: PcapReader that reads the capture
+        """
+        self.reader = reader
+
+    def add(self, packet):
+        self.analyzer.add(packet)
+
+    def fail(self):
+        """
+        Capture is invalid, analysis can not be used
+        """
+        self.failed = True
+
+    @property
+    def finished(self):
+        """
+        :return: True if whole valid capture was analyzed
+        """
+        return self.reader is not None and not self.failed
+
+    def result(self, location, compressed=None):
+        """
+        :param location: location of file where capture is saved
+        :param compressed: name of codec of saved file or None if file is not compressed
+        :return: dict with the same structure as analyze_capture returns
+        """
+        analyzer = self.analyzer
+        return dict(
+            tcp_conversations=analyzer.tcp_conversations(),
+            udp_conversations=analyzer.udp_conversations(),
+            icmp_conversations=analyzer.icmp_conversations(),
+            ipv6_endpoints=analyzer.ipv6_endpoints(),
+            pairs_mac_ip=analyzer.pairs_mac_ip(),
+            capture_info=analyzer.capture_info(
+                self.reader, os.path.basename(location), os.path.getsize(location), compressed=compressed,
+                hashers=self.hashers
+            ),
+        )
+
+
+def analyze_capture(location):
+    """
+    Analyze capture file in one pass
+
+    Capture hashes are computed from uncompressed capture data.
+
+    :param location: path to capture file, file can be compressed by any available codec
+    :return: dict with tcp_conversations, udp_conversations, icmp_conversations, ipv6_endpoints, pairs_mac_ip
+             and capture_info
+    """
+    analysis = StreamAnalysis()
+
+    with open(location, "rb") as f:
+        codec = detect_codec(f)
+
+        source = codec.open(f, "rb") if codec is not None else f
+        stream = HashingStream(source, analysis.hashers)
+
+        reader = PcapReader(stream)
+        analysis.start(reader)
+        for packet in reader:
+            analysis.add(packet)
+        stream.drain()
+
+        if codec is not None:
+            source.close()
+
+    return analysis.result(location, compressed=codec.name if codec else None)
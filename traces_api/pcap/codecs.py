@@ -0,0 +1,299 @@
+"""
+Compression codecs of stored captures
+
+Codec is recorded in extension of stored file (e.g. unit.pcap.xz) and it is also recognized by the first bytes of file,
+so readers always pick the right decoder. Codecs zstd and lz4 are available only when their packages are installed.
+"""
+import io
+import abc
+import bz2
+import gzip
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Number of bytes read at once when data are copied between streams
+COPY_SIZE = 1024 * 1024
+
+
+class Codec(abc.ABC):
+    """
+    Compression codec of stored files
+    """
+
+    name = None
+    extension = None
+    # bytes at the beginning of compressed data
+    magic = None
+    default_level = None
+    # HTTP Content-Encoding of compressed data, None if there is no standard encoding
+    content_encoding = None
+
+    def __init__(self, level=None):
+        """
+        :param level: compression level, default level of codec is used if None
+        """
+        self.level = self.default_level if level is None else level
+
+    @classmethod
+    def is_available(cls):
+        """
+        :return: True if libraries needed by codec are installed
+        """
+        return True
+
+    @classmethod
+    def matches(cls, header):
+        """
+        :param header: first bytes of file
+        :return: True if header is beginning of data compressed by codec
+        """
+        return header.startswith(cls.magic)
+
+    @abc.abstractmethod
+    def open(self, fileobj, mode="rb"):
+        """
+        Wrap binary file object by compressing or decompressing file object
+
+        Returned file object has to be closed before fileobj.
+
+        :param fileobj: file opened in binary mode
+        :param mode: rb or wb
+        :return: file object
+        """
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    extension = "gz"
+    magic = b"\x1f\x8b"
+    default_level = 9
+    content_encoding = "gzip"
+
+    def open(self, fileobj, mode="rb"):
+        return gzip.GzipFile(fileobj=fileobj, mode=mode, compresslevel=self.level)
+
+
+class BgzfCodec(GzipCodec):
+    """
+    Blocked gzip (BGZF), gzip members hold at most 64 KB of data, files are readable by any gzip tool
+    """
+    name = "bgzf"
+    default_level = 6
+
+
+class ZlibCodec(Codec):
+    """
+    Raw zlib stream without gzip header
+    """
+    name = "zlib"
+    extension = "zz"
+    default_level = 6
+    # HTTP deflate encoding is zlib stream
+    content_encoding = "deflate"
+
+    @classmethod
+    def matches(cls, header):
+        # Deflate method with 32K window and valid header checksum
+        return len(header) >= 2 and header[0] == 0x78 and (header[0] << 8 | header[1]) % 31 == 0
+
+    def open(self, fileobj, mode="rb"):
+        if "w" in mode:
+            return _CompressingWriter(fileobj, zlib.compressobj(self.level))
+        return io.BufferedReader(_DecompressingReader(fileobj, zlib.decompressobj()))
+
+
+class Bz2Codec(Codec):
+    name = "bz2"
+    extension = "bz2"
+    magic = b"BZh"
+    default_level = 9
+
+    def open(self, fileobj, mode="rb"):
+        return bz2.BZ2File(fileobj, mode=mode, compresslevel=self.level)
+
+
+class LzmaCodec(Codec):
+    name = "lzma"
+    extension = "xz"
+    magic = b"\xfd7zXZ\x00"
+    default_level = 6
+
+    def open(self, fileobj, mode="rb"):
+        if "w" in mode:
+            return lzma.LZMAFile(fileobj, mode=mode, preset=self.level)
+        return lzma.LZMAFile(fileobj, mode=mode)
+
+
+class ZstdCodec(Codec):
+    """
+    Zstandard, available only when zstandard package is installed
+    """
+    name = "zstd"
+    extension = "zst"
+    magic = b"\x28\xb5\x2f\xfd"
+    default_level = 3
+    content_encoding = "zstd"
+
+    @classmethod
+    def is_available(cls):
+        return zstandard is not None
+
+    def open(self, fileobj, mode="rb"):
+        if "w" in mode:
+            return zstandard.ZstdCompressor(level=self.level).stream_writer(fileobj, closefd=False)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False))
+
+
+class Lz4Codec(Codec):
+    """
+    LZ4 frame format, available only when lz4 package is installed
+    """
+    name = "lz4"
+    extension = "lz4"
+    magic = b"\x04\x22\x4d\x18"
+    default_level = 0
+
+    @classmethod
+    def is_available(cls):
+        return lz4 is not None
+
+    def open(self, fileobj, mode="rb"):
+        return lz4.frame.LZ4FrameFile(fileobj, mode=mode, compression_level=self.level)
+
+
+"""
+All known codecs, codecs that are not available are kept so files compressed by them are recognized
+"""
+CODECS = [GzipCodec, BgzfCodec, ZlibCodec, Bz2Codec, LzmaCodec, ZstdCodec, Lz4Codec]
+
+# Number of bytes needed by Codec.matches
+CODEC_HEADER_SIZE = 8
+
+
+def get_codec(name, level=None):
+    """
+    :param name: codec name (e.g. gzip, lzma)
+    :param level: compression level, default level of codec is used if None
+    :return: Codec
+    :raises ValueError: codec is unknown or its library is not installed
+    """
+    for codec in CODECS:
+        if codec.name == name:
+            if not codec.is_available():
+                raise ValueError("Compression codec %s is not installed" % name)
+            return codec(level)
+    raise ValueError("Unknown compression codec %s, use one of: %s" % (name, ", ".join(c.name for c in CODECS)))
+
+
+def find_codec_by_extension(extension):
+    """
+    :param extension: file extension without dot (e.g. gz)
+    :return: Codec or None if extension does not belong to any codec
+    """
+    for codec in CODECS:
+        if codec.extension == extension:
+            return codec()
+    return None
+
+
+def detect_codec(f):
+    """
+    Detect codec of opened file, file position is moved back to the beginning
+
+    :param f: file opened in binary mode
+    :return: Codec or None if file is not compressed by any available codec
+    """
+    header = f.read(CODEC_HEADER_SIZE)
+    f.seek(0)
+    return find_codec_by_header(header)
+
+
+def find_codec_by_header(header):
+    """
+    :param header: first CODEC_HEADER_SIZE bytes of file
+    :return: Codec or None if data are not compressed by any known codec
+    """
+    for codec in CODECS:
+        if codec.is_available() and codec.matches(header):
+            return codec()
+    return None
+
+
+class _CompressingWriter(io.RawIOBase):
+    """
+    Writable file object that compresses data by compressobj-like compressor
+    """
+
+    def __init__(self, fileobj, compressor):
+        self._fileobj = fileobj
+        self._compressor = compressor
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._fileobj.write(self._compressor.compress(data))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._fileobj.write(self._compressor.flush())
+        super().close()
+
+
+class _DecompressingReader(io.RawIOBase):
+    """
+    Readable file object that decompresses data by decompressobj-like decompressor
+    """
+
+    def __init__(self, fileobj, decompressor):
+        self._fileobj = fileobj
+        self._decompressor = decompressor
+        self._pending = b""
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._eof:
+            data = self._fileobj.read(COPY_SIZE)
+            if data:
+                self._pending = self._decompressor.decompress(data)
+            else:
+                self._pending = self._decompressor.flush()
+                self._eof = True
+
+        length = min(len(buffer), len(self._pending))
+        buffer[:length] = self._pending[:length]
+        self._pending = self._pending[length:]
+        return length
+
+
+def iter_decompressed(location, chunk_size=COPY_SIZE):
+    """
+    Read file and decompress it on the fly
+
+    :param location: file location, file does not have to be compressed
+    :param chunk_size: maximal size of returned chunks
+    :return: generator of bytes
+    """
+    with open(location, "rb") as f:
+        codec = detect_codec(f)
+        source = codec.open(f, "rb") if codec is not None else f
+        try:
+            for chunk in iter(lambda: source.read(chunk_size), b""):
+                yield chunk
+        finally:
+            if codec is not None:
+                source.close()
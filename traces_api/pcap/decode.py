@@ -0,0 +1,183 @@
+"""
+Decoding of link, network and transport layer headers
+
+Only headers needed for analysis and rewriting are decoded, packet payload is never touched.
+"""
+import socket
+import struct
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_ARP = 0x0806
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPES_VLAN = (0x8100, 0x88a8, 0x9100)
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+
+# IPv6 extension headers that can be skipped to reach transport header
+_IPV6_EXTENSION_HEADERS = (0, 43, 60)
+_IPV6_FRAGMENT_HEADER = 44
+
+_unpack_ethertype = struct.Struct("!H").unpack_from
+_unpack_ports = struct.Struct("!HH").unpack_from
+
+
+class Headers:
+    """
+    Decoded packet headers
+
+    Offsets point into packet data, addresses are raw bytes.
+    Attributes of layers that are not present in packet are None.
+    """
+
+    __slots__ = (
+        "eth_src", "eth_dst", "ethertype", "ip_offset", "ip_version", "ip_src", "ip_dst", "protocol",
+        "fragment", "l4_offset", "src_port", "dst_port", "tcp_flags", "icmp_type", "icmp_code",
+    )
+
+    def __init__(self):
+        self.eth_src = None
+        self.eth_dst = None
+        self.ethertype = None
+        self.ip_offset = None
+        self.ip_version = None
+        self.ip_src = None
+        self.ip_dst = None
+        self.protocol = None
+        self.fragment = False
+        self.l4_offset = None
+        self.src_port = None
+        self.dst_port = None
+        self.tcp_flags = None
+        self.icmp_type = None
+        self.icmp_code = None
+
+
+def decode(data, link_type):
+    """
+    Decode packet headers
+
+    :param data: packet data (bytes or memoryview)
+    :param link_type: link-layer header type of packet
+    :return: Headers
+    """
+    headers = Headers()
+    length = len(data)
+
+    if link_type == LINKTYPE_ETHERNET:
+        if length < 14:
+            return headers
+        headers.eth_dst = bytes(data[0:6])
+        headers.eth_src = bytes(data[6:12])
+        ethertype, = _unpack_ethertype(data, 12)
+        offset = 14
+        while ethertype in ETHERTYPES_VLAN and length >= offset + 4:
+            ethertype, = _unpack_ethertype(data, offset + 2)
+            offset += 4
+    elif link_type == LINKTYPE_LINUX_SLL:
+        if length < 16:
+            return headers
+        ethertype, = _unpack_ethertype(data, 14)
+        offset = 16
+    elif link_type in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if length < 5:
+            return headers
+        ethertype = ETHERTYPE_IPV6 if data[4] >> 4 == 6 else ETHERTYPE_IPV4
+        offset = 4
+    elif link_type in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if length < 1:
+            return headers
+        ethertype = ETHERTYPE_IPV6 if data[0] >> 4 == 6 else ETHERTYPE_IPV4
+        offset = 0
+    else:
+        return headers
+
+    headers.ethertype = ethertype
+
+    if ethertype == ETHERTYPE_IPV4:
+        if length < offset + 20 or data[offset] >> 4 != 4:
+            return headers
+        header_length = (data[offset] & 0x0f) * 4
+        headers.ip_offset = offset
+        headers.ip_version = 4
+        headers.protocol = data[offset + 9]
+        headers.ip_src = bytes(data[offset + 12:offset + 16])
+        headers.ip_dst = bytes(data[offset + 16:offset + 20])
+        flags_fragment, = _unpack_ethertype(data, offset + 6)
+        headers.fragment = (flags_fragment & 0x1fff) != 0
+        l4_offset = offset + header_length
+    elif ethertype == ETHERTYPE_IPV6:
+        if length < offset + 40 or data[offset] >> 4 != 6:
+            return headers
+        headers.ip_offset = offset
+        headers.ip_version = 6
+        headers.ip_src = bytes(data[offset + 8:offset + 24])
+        headers.ip_dst = bytes(data[offset + 24:offset + 40])
+        protocol = data[offset + 6]
+        l4_offset = offset + 40
+        while protocol in _IPV6_EXTENSION_HEADERS or protocol == _IPV6_FRAGMENT_HEADER:
+            if length < l4_offset + 8:
+                break
+            if protocol == _IPV6_FRAGMENT_HEADER:
+                fragment_offset, = _unpack_ethertype(data, l4_offset + 2)
+                headers.fragment = (fragment_offset & 0xfff8) != 0
+                protocol = data[l4_offset]
+                l4_offset += 8
+            else:
+                protocol, extension_length = data[l4_offset], data[l4_offset + 1]
+                l4_offset += (extension_length + 1) * 8
+        headers.protocol = protocol
+    else:
+        return headers
+
+    if headers.fragment:
+        # Transport header is only in first fragment
+        return headers
+
+    protocol = headers.protocol
+    if protocol == IPPROTO_TCP:
+        if length >= l4_offset + 14:
+            headers.l4_offset = l4_offset
+            headers.src_port, headers.dst_port = _unpack_ports(data, l4_offset)
+            headers.tcp_flags = data[l4_offset + 13]
+    elif protocol == IPPROTO_UDP:
+        if length >= l4_offset + 8:
+            headers.l4_offset = l4_offset
+            headers.src_port, headers.dst_port = _unpack_ports(data, l4_offset)
+    elif protocol in (IPPROTO_ICMP, IPPROTO_ICMPV6):
+        if length >= l4_offset + 4:
+            headers.l4_offset = l4_offset
+            headers.icmp_type = data[l4_offset]
+            headers.icmp_code = data[l4_offset + 1]
+
+    return headers
+
+
+def format_mac(address):
+    """
+    Format MAC address the same way as wireshark does
+
+    :param address: 6 bytes
+    :return: string e.g. 08:00:27:bd:c2:37
+    """
+    return ":".join("%02x" % b for b in address)
+
+
+def format_ip(address):
+    """
+    Format IPv4 or IPv6 address
+
+    :param address: 4 or 16 bytes
+    :return: string representation of address
+    """
+    return socket.inet_ntop(socket.AF_INET if len(address) == 4 else socket.AF_INET6, address)
@@ -0,0 +1,272 @@
+"""
+Packet filter expressions
+
+Subset of pcap-filter (BPF) syntax is supported:
+    [ip|ip6] [src|dst] host ADDRESS     e.g. host 10.0.0.1, src host fe80::1
+    [ip|ip6] [src|dst] net CIDR         e.g. net 192.168.0.0/16
+    [tcp|udp] [src|dst] port PORT       e.g. tcp dst port 80, port http
+    [tcp|udp] [src|dst] portrange A-B   e.g. portrange 1024-65535
+    ether [src|dst] host MAC            e.g. ether src 08:00:27:bd:c2:37
+    [ip|ip6] proto PROTOCOL             e.g. proto 47, ip proto udp
+    ether, ip, ip6, arp, tcp, udp, icmp, icmp6
+    less LENGTH, greater LENGTH
+Bare IP address, CIDR or MAC address stands for host, net or ether host primitive.
+
+Primitives are combined by not (!), and (&&), or (||) and parentheses. As in pcap-filter, negation has highest
+precedence, and/or have equal precedence and associate left to right.
+
+Expression is compiled once into predicate over Packet, every packet is decoded only once.
+"""
+import re
+import socket
+import ipaddress
+
+from .decode import decode, ETHERTYPE_ARP, IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMPV6
+
+_TOKEN = re.compile(r"\s*(\(|\)|&&|\|\||!|[^\s()!&|]+)")
+
+_MAC = re.compile(r"^[0-9a-fA-F]{1,2}([:-][0-9a-fA-F]{1,2}){5}$")
+
+_PROTOCOLS = {"ether", "ip", "ip6", "arp", "tcp", "udp", "icmp", "icmp6"}
+_DIRECTIONS = {"src", "dst"}
+_KINDS = {"host", "net", "port", "portrange", "proto"}
+
+_IP_PROTOCOLS = dict(icmp=IPPROTO_ICMP, tcp=IPPROTO_TCP, udp=IPPROTO_UDP, icmp6=IPPROTO_ICMPV6)
+
+_PROTOCOL_TESTS = dict(
+    ether=lambda p, h: h.eth_src is not None,
+    ip=lambda p, h: h.ip_version == 4,
+    ip6=lambda p, h: h.ip_version == 6,
+    arp=lambda p, h: h.ethertype == ETHERTYPE_ARP,
+    tcp=lambda p, h: h.protocol == IPPROTO_TCP,
+    udp=lambda p, h: h.protocol == IPPROTO_UDP,
+    icmp=lambda p, h: h.protocol == IPPROTO_ICMP and h.ip_version == 4,
+    icmp6=lambda p, h: h.protocol == IPPROTO_ICMPV6 and h.ip_version == 6,
+)
+
+
+class FilterError(Exception):
+    """
+    Packet filter expression is invalid
+    """
+    pass
+
+
+def compile_filter(expression):
+    """
+    Compile filter expression into predicate
+
+    :param expression: filter expression, empty expression matches every packet
+    :return: function that takes Packet and returns True if packet matches the filter
+    """
+    test = _Parser(_tokenize(expression or "")).parse()
+    if test is None:
+        return lambda packet: True
+
+    def predicate(packet):
+        return test(packet, decode(packet.data, packet.link_type))
+
+    return predicate
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if not match:
+            raise FilterError("Unexpected character '%s'" % expression[position])
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+def _either(test_src, test_dst, direction):
+    if direction == "src":
+        return test_src
+    if direction == "dst":
+        return test_dst
+    return lambda p, h: test_src(p, h) or test_dst(p, h)
+
+
+def _both(first, second):
+    if first is None:
+        return second
+    return lambda p, h: first(p, h) and second(p, h)
+
+
+class _Parser:
+    """
+    Recursive descent parser which builds test functions taking packet and its decoded headers
+    """
+
+    def __init__(self, tokens):
+        self._tokens = tokens
+        self._position = 0
+
+    def _peek(self):
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _next(self, expected=None):
+        token = self._peek()
+        if token is None:
+            raise FilterError("Unexpected end of expression, %s expected" % (expected or "value"))
+        self._position += 1
+        return token
+
+    def parse(self):
+        if not self._tokens:
+            return None
+        test = self._expression()
+        if self._peek() is not None:
+            raise FilterError("Unexpected '%s'" % self._peek())
+        return test
+
+    def _expression(self):
+        test = self._unary()
+        while self._peek() in ("and", "&&", "or", "||"):
+            operator = self._next()
+            left, right = test, self._unary()
+            if operator in ("and", "&&"):
+                test = lambda p, h, left=left, right=right: left(p, h) and right(p, h)
+            else:
+                test = lambda p, h, left=left, right=right: left(p, h) or right(p, h)
+        return test
+
+    def _unary(self):
+        token = self._peek()
+        if token in ("not", "!"):
+            self._next()
+            operand = self._unary()
+            return lambda p, h: not operand(p, h)
+        if token == "(":
+            self._next()
+            test = self._expression()
+            if self._next("')'") != ")":
+                raise FilterError("')' expected")
+            return test
+        return self._primitive()
+
+    def _primitive(self):
+        token = self._next("primitive")
+
+        if token in ("less", "greater"):
+            length = self._number(self._next("length"))
+            if token == "less":
+                return lambda p, h: p.length <= length
+            return lambda p, h: p.length >= length
+
+        protocol = direction = kind = None
+        if token in _PROTOCOLS:
+            protocol, token = token, self._peek()
+            if token not in _DIRECTIONS and token not in _KINDS:
+                return _PROTOCOL_TESTS[protocol]
+            self._next()
+        if token in _DIRECTIONS:
+            direction, token = token, self._next("host, net, port or value")
+        if token in _KINDS:
+            kind, token = token, self._next()
+        elif token in ("and", "or", "not", "(", ")", "&&", "||", "!"):
+            raise FilterError("Unexpected '%s'" % token)
+
+        if kind is None:
+            kind = self._guess_kind(token, protocol)
+
+        if protocol == "ether" or kind == "ether":
+            if kind not in ("host", "ether"):
+                raise FilterError("Only host can be used with ether")
+            return self._ether_host(token, direction)
+
+        protocol_test = _PROTOCOL_TESTS[protocol] if protocol else None
+        if kind == "host":
+            return _both(protocol_test, self._host(token, direction))
+        if kind == "net":
+            return _both(protocol_test, self._net(token, direction))
+        if kind in ("port", "portrange"):
+            if protocol not in (None, "tcp", "udp"):
+                raise FilterError("Port can be used only with tcp or udp")
+            return _both(protocol_test, self._port(token, direction, kind == "portrange"))
+
+        # proto
+        if direction is not None:
+            raise FilterError("Direction can not be used with proto")
+        number = _IP_PROTOCOLS.get(token)
+        if number is None:
+            number = self._number(token)
+        return _both(protocol_test, lambda p, h: h.protocol == number)
+
+    @staticmethod
+    def _guess_kind(value, protocol):
+        if protocol == "ether" or _MAC.match(value):
+            return "ether"
+        if "/" in value:
+            return "net"
+        try:
+            ipaddress.ip_address(value)
+        except ValueError:
+            raise FilterError("Unknown primitive '%s'" % value)
+        return "host"
+
+    @staticmethod
+    def _number(value):
+        try:
+            return int(value, 0)
+        except ValueError:
+            raise FilterError("Invalid number '%s'" % value)
+
+    @staticmethod
+    def _ether_host(value, direction):
+        if not _MAC.match(value):
+            raise FilterError("Invalid MAC address '%s'" % value)
+        address = bytes(int(part, 16) for part in re.split("[:-]", value))
+        return _either(lambda p, h: h.eth_src == address, lambda p, h: h.eth_dst == address, direction)
+
+    @staticmethod
+    def _host(value, direction):
+        try:
+            address = ipaddress.ip_address(value).packed
+        except ValueError:
+            raise FilterError("Invalid IP address '%s'" % value)
+        return _either(lambda p, h: h.ip_src == address, lambda p, h: h.ip_dst == address, direction)
+
+    @staticmethod
+    def _net(value, direction):
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            raise FilterError("Invalid network '%s'" % value)
+
+        length = len(network.network_address.packed)
+        prefix = int(network.network_address)
+        mask = int(network.netmask)
+
+        def in_network(address):
+            return address is not None and len(address) == length and int.from_bytes(address, "big") & mask == prefix
+
+        return _either(lambda p, h: in_network(h.ip_src), lambda p, h: in_network(h.ip_dst), direction)
+
+    @classmethod
+    def _port(cls, value, direction, is_range):
+        if is_range:
+            bounds = value.split("-")
+            if len(bounds) != 2:
+                raise FilterError("Invalid port range '%s'" % value)
+            low, high = cls._service(bounds[0]), cls._service(bounds[1])
+        else:
+            low = high = cls._service(value)
+
+        return _either(
+            lambda p, h: h.src_port is not None and low <= h.src_port <= high,
+            lambda p, h: h.dst_port is not None and low <= h.dst_port <= high,
+            direction,
+        )
+
+    @staticmethod
+    def _service(value):
+        if value.isdigit():
+            return int(value)
+        try:
+            return socket.getservbyname(value)
+        except OSError:
+            raise FilterError("Unknown port '%s'" % value)
@@ -0,0 +1,759 @@
+"""
+Packet index of gzip compressed captures
+
+Capture is compressed as multi-member gzip (still readable by any gzip tool), the first member holds file header
+and new member starts every `interval` packets. Sidecar index holds for every block of packets compressed position
+of its member, uncompressed offset, number of its first packet and range of its timestamps. Any block can be
+decompressed without decompressing previous data.
+
+Members can be compressed in parallel in the style of pigz: member data are split into blocks that are deflated
+concurrently by thread pool (zlib releases GIL), blocks are primed by the end of previous block and are joined
+by sync flush, so output is the same multi-member gzip.
+
+Blocked format (BGZF) limits members to BGZF_BLOCK_SIZE bytes of uncompressed data, every member holds its size
+in gzip extra field and file ends with empty EOF member, so it can be also read by bgzip tools. Index blocks end
+before the packet that would not fit into member, packets bigger than member are split into several members.
+Indexed blocks are decompressed in parallel by readers.
+
+Pcapng blocks that describe interfaces (or start new section) after the first packet are kept in index too, they are
+inserted before selected blocks when blocks that contain them are skipped, so every packet refers to known interface.
+"""
+import os
+import sys
+import json
+import zlib
+import array
+import bisect
+import struct
+import threading
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .reader import PcapReader, PcapError
+
+INDEX_SUFFIX = ".idx"
+
+INDEX_MAGIC = b"TRACEIDX"
+INDEX_VERSION = 2
+
+DEFAULT_INTERVAL = 1024
+
+# Uncompressed data are compressed at least when this amount of data is waiting
+_MAX_PENDING = 4 * 1024 * 1024
+
+_READ_SIZE = 1024 * 1024
+
+# Size of uncompressed blocks deflated in parallel
+PARALLEL_BLOCK_SIZE = 128 * 1024
+# Maximal number of blocks waiting for compression or output, bounds memory used by one compression
+_MAX_QUEUED_BLOCKS = 64
+# Deflate window, end of previous block is used as dictionary of next block
+_WINDOW_SIZE = 32 * 1024
+
+_GZIP_OS_UNKNOWN = 255
+
+# Maximal uncompressed size of BGZF member, compressed member always fits into 64 KB
+BGZF_BLOCK_SIZE = 65280
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+# Space reserved for packet record header when it is decided whether packet fits into BGZF member
+_RECORD_OVERHEAD = 64
+
+# Indexed blocks with bigger compressed size are decompressed as stream by calling thread
+_MAX_PARALLEL_RANGE = 1024 * 1024
+_DECOMPRESSION_THREADS = os.cpu_count() or 1
+
+_decompression_executor = None
+_decompression_executor_lock = threading.Lock()
+
+# Name and typecode of index arrays, every item has 8 bytes
+_ARRAYS = (
+    ("packets", "Q"),
+    ("offsets", "Q"),
+    ("positions", "Q"),
+    ("min_timestamps", "q"),
+    ("max_timestamps", "q"),
+)
+
+
+class PacketIndex:
+    """
+    Index of blocks of packets in multi-member gzip compressed capture
+    """
+
+    def __init__(self, format=None, link_type=None, interval=DEFAULT_INTERVAL, header_length=0):
+        """
+        :param format: capture format - pcap or pcapng
+        :param link_type: link type of first interface
+        :param interval: number of packets in one block
+        :param header_length: length of uncompressed file header (first gzip member)
+        """
+        self.format = format
+        self.link_type = link_type
+        self.interval = interval
+        self.header_length = header_length
+
+        self.packet_count = 0
+        self.uncompressed_size = 0
+        self.compressed_size = 0
+        # True if timestamps of packets never decrease
+        self.ordered = True
+        # List of tuples (uncompressed offset, data) of pcapng blocks that change interfaces after the first packet
+        self.interface_blocks = []
+
+        for name, typecode in _ARRAYS:
+            setattr(self, name, array.array(typecode))
+
+    def __len__(self):
+        """
+        :return: number of blocks
+        """
+        return len(self.offsets)
+
+    def add_block(self, packet, offset, position, min_timestamp, max_timestamp):
+        """
+        Add block of packets
+
+        :param packet: number of first packet of block
+        :param offset: uncompressed offset of first packet of block
+        :param position: compressed position of gzip member with block
+        :param min_timestamp: minimal timestamp of block packets in nanoseconds
+        :param max_timestamp: maximal timestamp of block packets in nanoseconds
+        """
+        self.packets.append(packet)
+        self.offsets.append(offset)
+        self.positions.append(position)
+        self.min_timestamps.append(min_timestamp)
+        self.max_timestamps.append(max_timestamp)
+
+    def block_range(self, block):
+        """
+        :param block: block number
+        :return: tuple (compressed position, compressed end position, uncompressed offset, uncompressed end offset)
+        """
+        if block + 1 < len(self):
+            return self.positions[block], self.positions[block + 1], self.offsets[block], self.offsets[block + 1]
+        return self.positions[block], self.compressed_size, self.offsets[block], self.uncompressed_size
+
+    def block_of_packet(self, packet):
+        """
+        :param packet: packet number, starting from 0
+        :return: number of block which contains the packet, the last block if packet number is too big
+        """
+        return max(bisect.bisect_right(self.packets, packet) - 1, 0)
+
+    def blocks_in_time_range(self, start=None, end=None):
+        """
+        Find blocks that can contain packets with timestamps in given range
+
+        :param start: start of range in nanoseconds, unlimited if None
+        :param end: end of range in nanoseconds (inclusive), unlimited if None
+        :return: list of block numbers
+        """
+        return [
+            block for block in range(len(self))
+            if (start is None or self.max_timestamps[block] >= start)
+            and (end is None or self.min_timestamps[block] <= end)
+        ]
+
+    def save(self, location):
+        """
+        Save index to file
+
+        :param location: index file location
+        """
+        meta = json.dumps(dict(
+            version=INDEX_VERSION,
+            format=self.format,
+            link_type=self.link_type,
+            interval=self.interval,
+            header_length=self.header_length,
+            packet_count=self.packet_count,
+            uncompressed_size=self.uncompressed_size,
+            compressed_size=self.compressed_size,
+            ordered=self.ordered,
+            interface_blocks=[[offset, data.hex()] for offset, data in self.interface_blocks],
+            blocks=len(self),
+        )).encode()
+
+        with open(location, "wb") as f:
+            f.write(INDEX_MAGIC + struct.pack("<I", len(meta)) + meta)
+            for name, _ in _ARRAYS:
+                values = getattr(self, name)
+                if sys.byteorder == "big":
+                    values = array.array(values.typecode, values)
+                    values.byteswap()
+                values.tofile(f)
+
+    @staticmethod
+    def load(location):
+        """
+        Load index from file
+
+        :param location: index file location
+        :return: PacketIndex
+        """
+        with open(location, "rb") as f:
+            header = f.read(len(INDEX_MAGIC) + 4)
+            if len(header) != len(INDEX_MAGIC) + 4 or header[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+                raise ValueError("Invalid packet index %s" % location)
+
+            meta_length, = struct.unpack("<I", header[len(INDEX_MAGIC):])
+            meta = json.loads(f.read(meta_length).decode())
+            # Interfaces of pcap files can not change, so the first version without interface blocks is valid
+            if meta["version"] != INDEX_VERSION and (meta["version"], meta["format"]) != (1, "pcap"):
+                raise ValueError("Unsupported packet index version %s" % meta["version"])
+
+            index = PacketIndex(meta["format"], meta["link_type"], meta["interval"], meta["header_length"])
+            index.packet_count = meta["packet_count"]
+            index.uncompressed_size = meta["uncompressed_size"]
+            index.compressed_size = meta["compressed_size"]
+            index.ordered = meta["ordered"]
+            index.interface_blocks = [(offset, bytes.fromhex(data)) for offset, data in meta.get("interface_blocks", [])]
+
+            for name, typecode in _ARRAYS:
+                values = array.array(typecode)
+                try:
+                    values.fromfile(f, meta["blocks"])
+                except EOFError as ex:
+                    raise ValueError("Packet index %s is truncated" % location) from ex
+                if sys.byteorder == "big":
+                    values.byteswap()
+                setattr(index, name, values)
+
+        return index
+
+
+class _TeeStream:
+    """
+    Readable stream that keeps read data until they are taken for compression
+    """
+
+    def __init__(self, source, hashers=None):
+        """
+        :param source: readable binary stream or iterable of bytes
+        :param hashers: hashlib objects updated by all read data, optional
+        """
+        if hasattr(source, "read"):
+            self._read = source.read
+        else:
+            chunks = iter(source)
+            self._read = lambda size: next(chunks, b"")
+
+        self._hashers = list(hashers or [])
+        self.pending = bytearray()
+        self.pending_offset = 0
+        self.size = 0
+
+    def read(self, size=_READ_SIZE):
+        """
+        Read data, chunks of iterable sources are returned whole
+        """
+        data = self._read(size)
+        for hasher in self._hashers:
+            hasher.update(data)
+        self.pending += data
+        self.size += len(data)
+        return data
+
+    def take(self, offset=None):
+        """
+        Take pending data up to given offset
+
+        :param offset: offset from the beginning of stream, all pending data are taken if None
+        :return: bytes
+        """
+        length = len(self.pending) if offset is None else offset - self.pending_offset
+        data = bytes(self.pending[:length])
+        del self.pending[:length]
+        self.pending_offset += length
+        return data
+
+
+class _MemberWriter:
+    """
+    Writer of multi-member gzip
+    """
+
+    def __init__(self, output, level):
+        self._output = output
+        self._level = level
+        self._compressor = None
+        self.position = 0
+        self.member_positions = []
+
+    def write(self, data):
+        if not data:
+            return
+        if self._compressor is None:
+            self._compressor = zlib.compressobj(self._level, zlib.DEFLATED, 31)
+            self.member_positions.append(self.position)
+        self._write(self._compressor.compress(data))
+
+    def _write(self, data):
+        self._output.write(data)
+        self.position += len(data)
+
+    def end_member(self):
+        """
+        Finish current gzip member
+
+        :return: number of next member, its position is in member_positions after close
+        """
+        if self._compressor is not None:
+            self._write(self._compressor.flush())
+            self._compressor = None
+        return len(self.member_positions)
+
+    def close(self):
+        self.end_member()
+        if not self.position:
+            # Empty input is stored as valid empty gzip
+            self._write(zlib.compressobj(self._level, zlib.DEFLATED, 31).flush())
+
+
+def _gzip_header(level):
+    if level == 9:
+        extra_flags = 2
+    elif level == 1:
+        extra_flags = 4
+    else:
+        extra_flags = 0
+    # deflate, no flags, no modification time
+    return struct.pack("<BBBBIBB", 0x1f, 0x8b, 8, 0, 0, extra_flags, _GZIP_OS_UNKNOWN)
+
+
+def _deflate_block(data, level, dictionary, last):
+    """
+    Deflate block of gzip member into raw deflate data that can be concatenated with data of following blocks
+    """
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+_MEMBER_START = object()
+
+
+class _ParallelMemberWriter:
+    """
+    Writer of multi-member gzip that deflates blocks of members by thread pool
+
+    Output is written in order by the calling thread, CRC of members is computed by the calling thread too.
+    """
+
+    def __init__(self, output, level, executor, block_size=PARALLEL_BLOCK_SIZE):
+        self._output = output
+        self._level = level
+        self._executor = executor
+        self._block_size = block_size
+
+        # futures of compressed blocks, bytes and _MEMBER_START markers in output order
+        self._queue = collections.deque()
+        self._buffer = bytearray()
+        self._dictionary = None
+        self._crc = 0
+        self._size = 0
+        self._in_member = False
+        self._members = 0
+
+        self.position = 0
+        self.member_positions = []
+
+    def write(self, data):
+        if not data:
+            return
+        if not self._in_member:
+            self._in_member = True
+            self._members += 1
+            self._crc = self._size = 0
+            self._dictionary = None
+            self._queue.append(_MEMBER_START)
+            self._queue.append(_gzip_header(self._level))
+
+        self._buffer += data
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[:self._block_size])
+            del self._buffer[:self._block_size]
+            self._submit(block, last=False)
+
+    def _submit(self, block, last):
+        self._queue.append(self._executor.submit(_deflate_block, block, self._level, self._dictionary, last))
+        self._dictionary = block[-_WINDOW_SIZE:]
+        self._drain(_MAX_QUEUED_BLOCKS)
+
+    def _drain(self, limit):
+        while len(self._queue) > limit:
+            item = self._queue.popleft()
+            if item is _MEMBER_START:
+                self.member_positions.append(self.position)
+                continue
+            if not isinstance(item, bytes):
+                item = item.result()
+            self._output.write(item)
+            self.position += len(item)
+
+    def end_member(self):
+        """
+        Finish current gzip member
+
+        :return: number of next member, its position is in member_positions after close
+        """
+        if self._in_member:
+            block = bytes(self._buffer)
+            self._buffer.clear()
+            self._submit(block, last=True)
+            self._queue.append(struct.pack("<II", self._crc, self._size & 0xffffffff))
+            self._in_member = False
+        return self._members
+
+    def close(self):
+        self.end_member()
+        if not self._members:
+            # Empty input is stored as valid empty gzip
+            self._queue.append(zlib.compressobj(self._level, zlib.DEFLATED, 31).flush())
+        self._drain(0)
+
+
+def _bgzf_member(data, level):
+    """
+    Compress data into one BGZF member
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    # deflate, extra field, no modification time, extra field with BC subfield holding member size - 1
+    header = struct.pack(
+        "<BBBBIBBHBBHH", 0x1f, 0x8b, 8, 4, 0, 0, _GZIP_OS_UNKNOWN, 6, ord("B"), ord("C"), 2, len(deflated) + 25
+    )
+    return header + deflated + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+class _BlockedMemberWriter:
+    """
+    Writer of BGZF, every member is compressed at once, by thread pool if it is given
+    """
+
+    def __init__(self, output, level, executor=None, block_size=BGZF_BLOCK_SIZE):
+        self._output = output
+        self._level = level
+        self._executor = executor
+        self._block_size = block_size
+
+        # futures or bytes of members in output order
+        self._queue = collections.deque()
+        self._buffer = bytearray()
+        self._members = 0
+
+        self.position = 0
+        self.member_positions = []
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            member = bytes(self._buffer[:self._block_size])
+            del self._buffer[:self._block_size]
+            self._submit(member)
+
+    def _submit(self, data):
+        self._members += 1
+        if self._executor is None:
+            self._queue.append(_bgzf_member(data, self._level))
+        else:
+            self._queue.append(self._executor.submit(_bgzf_member, data, self._level))
+        self._drain(_MAX_QUEUED_BLOCKS)
+
+    def _drain(self, limit):
+        while len(self._queue) > limit:
+            item = self._queue.popleft()
+            if not isinstance(item, bytes):
+                item = item.result()
+            self.member_positions.append(self.position)
+            self._output.write(item)
+            self.position += len(item)
+
+    def end_member(self):
+        """
+        Finish current member
+
+        :return: number of next member, its position is in member_positions after close
+        """
+        if self._buffer:
+            member = bytes(self._buffer)
+            self._buffer.clear()
+            self._submit(member)
+        return self._members
+
+    def close(self):
+        self.end_member()
+        self._drain(0)
+        self._output.write(BGZF_EOF)
+        self.position += len(BGZF_EOF)
+
+
+def compress_indexed(file_stream, output, interval=DEFAULT_INTERVAL, level=9, timeseries=None, executor=None,
+                     block_size=None, analysis=None):
+    """
+    Compress capture into multi-member gzip and build its packet index in one pass
+
+    Data that are not capture (or are corrupted) are compressed completely, but index is not created.
+
+    :param file_stream: readable binary stream or iterable of bytes
+    :param output: writable binary stream
+    :param interval: number of packets in one block
+    :param level: compression level
+    :param timeseries: TimeSeriesBuilder to which every packet is added, optional
+    :param executor: concurrent.futures.Executor used for parallel compression, data are compressed
+                     by calling thread if None
+    :param block_size: maximal uncompressed size of member (e.g. BGZF_BLOCK_SIZE), output is BGZF if set
+    :param analysis: StreamAnalysis that is fed by read data and packets, so capture is analyzed in the same pass
+    :return: PacketIndex or None
+    """
+    tee = _TeeStream(file_stream, analysis.hashers.values() if analysis is not None else None)
+    if block_size:
+        writer = _BlockedMemberWriter(output, level, executor, block_size)
+    elif executor is None:
+        writer = _MemberWriter(output, level)
+    else:
+        writer = _ParallelMemberWriter(output, level, executor)
+
+    index = None
+    try:
+        reader = PcapReader(tee)
+        index = PacketIndex(reader.format, reader.link_type, interval, reader.data_offset)
+        if analysis is not None:
+            analysis.start(reader)
+        _index_packets(reader, index, tee, writer, timeseries, block_size, analysis)
+    except PcapError:
+        index = None
+        if analysis is not None:
+            analysis.fail()
+
+    while tee.read(_READ_SIZE):
+        writer.write(tee.take())
+    writer.write(tee.take())
+    writer.close()
+
+    if index is not None:
+        index.uncompressed_size = tee.size
+        index.compressed_size = writer.position
+        # Blocks hold numbers of their members until all members are written
+        index.positions = array.array("Q", (_member_position(writer, member) for member in index.positions))
+    return index
+
+
+def _member_position(writer, member):
+    if member < len(writer.member_positions):
+        return writer.member_positions[member]
+    return writer.position
+
+
+def _index_packets(reader, index, tee, writer, timeseries, block_size=None, analysis=None):
+    count = 0
+    interval = index.interval
+    first_packet = first_offset = first_member = None
+    min_timestamp = max_timestamp = last_timestamp = None
+    interfaces, interface_count, packet_end = reader.interfaces, len(reader.interfaces), None
+
+    for packet in reader:
+        timestamp = packet.timestamp
+        if reader.interfaces is not interfaces or len(reader.interfaces) != interface_count:
+            # Blocks between previous and this packet changed interfaces, they are still pending in tee
+            if count:
+                index.interface_blocks.append((packet_end, bytes(
+                    tee.pending[packet_end - tee.pending_offset:reader.record_offset - tee.pending_offset]
+                )))
+            interfaces, interface_count = reader.interfaces, len(reader.interfaces)
+        packet_end = reader.tell()
+
+        if timeseries is not None:
+            timeseries.add(timestamp, packet.length)
+        if analysis is not None:
+            analysis.add(packet)
+
+        if not count or count - first_packet >= interval or (
+            block_size and reader.record_offset - first_offset + len(packet.data) + _RECORD_OVERHEAD > block_size
+        ):
+            if count:
+                index.add_block(first_packet, first_offset, first_member, min_timestamp, max_timestamp)
+
+            first_packet, first_offset = count, reader.record_offset
+            writer.write(tee.take(first_offset))
+            first_member = writer.end_member()
+            min_timestamp = max_timestamp = timestamp
+        else:
+            if timestamp < min_timestamp:
+                min_timestamp = timestamp
+            if timestamp > max_timestamp:
+                max_timestamp = timestamp
+            if len(tee.pending) > _MAX_PENDING:
+                writer.write(tee.take(reader.record_offset))
+
+        if last_timestamp is not None and timestamp < last_timestamp:
+            index.ordered = False
+        last_timestamp = timestamp
+        count += 1
+
+    if count:
+        index.add_block(first_packet, first_offset, first_member, min_timestamp, max_timestamp)
+    index.packet_count = count
+
+
+def iter_analyzed(file_stream, analysis, chunk_size=_READ_SIZE):
+    """
+    Pass data through StreamAnalysis, so capture is analyzed while data are consumed (e.g. compressed by any codec)
+
+    Data that are not capture are passed whole, analysis is marked as failed.
+
+    :param file_stream: readable binary stream or iterable of bytes
+    :param analysis: StreamAnalysis
+    :param chunk_size: approximate size of returned chunks
+    :return: generator of bytes
+    """
+    tee = _TeeStream(file_stream, analysis.hashers.values())
+    try:
+        reader = PcapReader(tee)
+        analysis.start(reader)
+        for packet in reader:
+            analysis.add(packet)
+            if len(tee.pending) >= chunk_size:
+                yield tee.take()
+    except PcapError:
+        analysis.fail()
+
+    while tee.read(chunk_size):
+        yield tee.take()
+    yield tee.take()
+
+
+def load_index(location):
+    """
+    Load packet index of compressed capture if it exists and matches the file
+
+    :param location: compressed capture location
+    :return: PacketIndex or None
+    """
+    try:
+        index = PacketIndex.load(location + INDEX_SUFFIX)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    try:
+        if os.path.getsize(location) != index.compressed_size:
+            return None
+    except OSError:
+        return None
+    return index
+
+
+def _get_decompression_executor():
+    """
+    :return: thread pool shared by all readers of indexed captures or None if there is only one CPU
+    """
+    global _decompression_executor
+    if _DECOMPRESSION_THREADS < 2:
+        return None
+    with _decompression_executor_lock:
+        if _decompression_executor is None:
+            _decompression_executor = ThreadPoolExecutor(_DECOMPRESSION_THREADS, thread_name_prefix="decompression")
+    return _decompression_executor
+
+
+def _decompress_members(data):
+    """
+    Decompress all gzip members in data
+    """
+    output = []
+    while data:
+        decompressor = zlib.decompressobj(31)
+        output.append(decompressor.decompress(data))
+        if not decompressor.eof:
+            raise PcapError("Compressed capture is truncated")
+        data = decompressor.unused_data
+    return b"".join(output)
+
+
+def _iter_range(f, position, end_position, chunk_size):
+    """
+    Decompress gzip members in range of compressed file as stream
+    """
+    f.seek(position)
+    decompressor = zlib.decompressobj(31)
+    remaining = end_position - position
+    while remaining > 0:
+        data = f.read(min(chunk_size, remaining))
+        if not data:
+            raise PcapError("Compressed capture is truncated")
+        remaining -= len(data)
+        while data:
+            yield decompressor.decompress(data)
+            data = decompressor.unused_data
+            if decompressor.eof:
+                decompressor = zlib.decompressobj(31)
+    yield decompressor.flush()
+
+
+def iter_blocks(f, index, blocks, chunk_size=_READ_SIZE, parallel=True):
+    """
+    Decompress file header and given blocks of indexed capture
+
+    Concatenation of returned data is valid capture which contains only packets of given blocks.
+
+    :param f: compressed capture opened in binary mode
+    :param index: PacketIndex of capture
+    :param blocks: ordered list of block numbers
+    :param chunk_size: number of compressed bytes read at once
+    :param parallel: decompress small blocks ahead by shared thread pool
+    :return: generator of bytes
+    """
+    parts = [(0, index.positions[0] if len(index) else index.compressed_size)]
+    # Interface blocks of skipped blocks are inserted before next selected block
+    covered, interface_block = 0, 0
+    for block in blocks:
+        position, end_position, offset, end_offset = index.block_range(block)
+        while interface_block < len(index.interface_blocks) and index.interface_blocks[interface_block][0] < offset:
+            if index.interface_blocks[interface_block][0] >= covered:
+                parts.append(index.interface_blocks[interface_block][1])
+            interface_block += 1
+        parts.append((position, end_position))
+        covered = end_offset
+
+    executor = _get_decompression_executor() if parallel else None
+    if executor is None:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield from _iter_range(f, part[0], part[1], chunk_size)
+        return
+
+    # Futures of decompressed small blocks in output order, blocks are read in order by calling thread
+    pending = collections.deque()
+    for part in parts:
+        if isinstance(part, bytes):
+            while pending:
+                yield pending.popleft().result()
+            yield part
+            continue
+
+        position, end_position = part
+        if end_position - position > _MAX_PARALLEL_RANGE:
+            while pending:
+                yield pending.popleft().result()
+            yield from _iter_range(f, position, end_position, chunk_size)
+            continue
+
+        f.seek(position)
+        data = f.read(end_position - position)
+        if len(data) != end_position - position:
+            raise PcapError("Compressed capture is truncated")
+        pending.append(executor.submit(_decompress_members, data))
+        if len(pending) > 2 * _DECOMPRESSION_THREADS:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
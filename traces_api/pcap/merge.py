@@ -0,0 +1,53 @@
+"""
+Merging of captured traffic dumps ordered by timestamp
+"""
+import heapq
+import contextlib
+from operator import attrgetter
+
+from .reader import open_capture
+from .writer import create_writer
+
+# Read buffer per merged file, keeps memory bounded even when hundreds of files are merged
+MERGE_CHUNK_SIZE = 64 * 1024
+
+
+def merge_packets(sources):
+    """
+    Merge packet streams into one stream ordered by timestamp
+
+    Heap based k-way merge, only one packet from every source is held in memory.
+    Every source should be ordered by timestamp (as mergecap expects), packets with equal
+    timestamps are returned in order of sources.
+
+    :param sources: list of iterables of Packets
+    :return: iterator of Packets
+    """
+    return heapq.merge(*sources, key=attrgetter("timestamp"))
+
+
+def merge_files(locations, output_stream, format="pcapng"):
+    """
+    Merge capture files into one output stream in one pass
+
+    :param locations: list of capture file locations, files can be gzip compressed
+    :param output_stream: writable binary stream
+    :param format: output format - pcap or pcapng
+    :return: number of written packets
+    """
+    with contextlib.ExitStack() as stack:
+        readers = [stack.enter_context(open_capture(l, use_mmap=False, chunk_size=MERGE_CHUNK_SIZE)) for l in locations]
+
+        writer = create_writer(
+            output_stream, format,
+            snaplen=max([r.snaplen or 0 for r in readers] + [0]),
+            nanosecond=any(r.nanosecond for r in readers),
+        )
+
+        count = 0
+        for packet in merge_packets(readers):
+            writer.write(packet)
+            count += 1
+        writer.close()
+
+    return count
@@ -0,0 +1,84 @@
+"""
+Preview of packet headers
+
+Only packets up to the end of requested window are read. Packet index of compressed capture is used to start
+decompression at the block which contains the first requested packet.
+"""
+import itertools
+
+from .reader import PcapReader, open_capture
+from .decode import decode, format_mac, format_ip, IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMPV6
+from .index import load_index, iter_blocks
+from .slice import _ChunkStream
+
+MAX_LIMIT = 1000
+
+PROTOCOL_NAMES = {IPPROTO_ICMP: "icmp", IPPROTO_TCP: "tcp", IPPROTO_UDP: "udp", IPPROTO_ICMPV6: "icmpv6"}
+
+TCP_FLAGS = ("FIN", "SYN", "RST", "PSH", "ACK", "URG", "ECE", "CWR")
+
+
+def describe_packet(number, packet):
+    """
+    Decode packet headers into JSON serializable dict
+
+    :param number: number of packet in capture, starting from 0
+    :param packet: Packet
+    :return: dict, values of layers that are not present in packet are None
+    """
+    headers = decode(packet.data, packet.link_type)
+    protocol = headers.protocol
+    return dict(
+        number=number,
+        time=packet.time,
+        length=packet.length,
+        captured_length=len(packet.data),
+        eth_src=format_mac(headers.eth_src) if headers.eth_src is not None else None,
+        eth_dst=format_mac(headers.eth_dst) if headers.eth_dst is not None else None,
+        ip_src=format_ip(headers.ip_src) if headers.ip_src is not None else None,
+        ip_dst=format_ip(headers.ip_dst) if headers.ip_dst is not None else None,
+        protocol=PROTOCOL_NAMES.get(protocol, str(protocol)) if protocol is not None else None,
+        src_port=headers.src_port,
+        dst_port=headers.dst_port,
+        tcp_flags=[
+            name for bit, name in enumerate(TCP_FLAGS) if headers.tcp_flags & (1 << bit)
+        ] if headers.tcp_flags is not None else None,
+    )
+
+
+def _open_from_packet(location, offset):
+    """
+    Open reader positioned as close as possible before packet with given number
+
+    :return: tuple (PcapReader, number of first packet returned by reader)
+    """
+    index = load_index(location)
+    if index is None or not len(index):
+        return open_capture(location, use_mmap=False), 0
+
+    block = index.block_of_packet(offset)
+    f = open(location, "rb")
+    try:
+        reader = PcapReader(_ChunkStream(iter_blocks(f, index, range(block, len(index)))), closing=[f])
+    except Exception:
+        f.close()
+        raise
+    return reader, index.packets[block]
+
+
+def preview_capture(location, offset=0, limit=100):
+    """
+    Decode headers of window of packets
+
+    :param location: capture location, file can be gzip compressed
+    :param offset: number of first returned packet, starting from 0
+    :param limit: maximal number of returned packets, at most MAX_LIMIT
+    :return: list of dicts (see describe_packet)
+    """
+    offset = max(offset, 0)
+    limit = min(max(limit, 0), MAX_LIMIT)
+
+    reader, first = _open_from_packet(location, offset)
+    with reader:
+        packets = itertools.islice(reader, offset - first, offset - first + limit)
+        return [describe_packet(number, packet) for number, packet in enumerate(packets, offset)]
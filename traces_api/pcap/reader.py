@@ -0,0 +1,520 @@
+"""
+Streaming reader of captured traffic dumps
+
+Supported formats:
+- pcap (both byte orders, microsecond and nanosecond timestamp precision)
+- pcapng (Section Header, Interface Description, Enhanced Packet, Simple Packet and obsolete Packet blocks)
+
+Packet data are returned as memoryview slices of the reader buffer, packet data are never copied by the reader.
+"""
+import os
+import mmap
+import zlib
+import struct
+
+from .codecs import detect_codec
+
+PCAP_MAGIC_MICROSECONDS = 0xa1b2c3d4
+PCAP_MAGIC_NANOSECONDS = 0xa1b23c4d
+
+PCAPNG_BLOCK_SECTION_HEADER = 0x0a0d0d0a
+PCAPNG_BLOCK_INTERFACE_DESCRIPTION = 0x00000001
+PCAPNG_BLOCK_PACKET = 0x00000002
+PCAPNG_BLOCK_SIMPLE_PACKET = 0x00000003
+PCAPNG_BLOCK_ENHANCED_PACKET = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+PCAPNG_OPTION_END = 0
+PCAPNG_OPTION_IF_TSRESOL = 9
+PCAPNG_OPTION_IF_TSOFFSET = 14
+
+# Larger packets are considered as a sign of corrupted file (same limit as wireshark uses)
+MAX_PACKET_SIZE = 262144
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_SECTION_HEADER_MAGIC = struct.pack("<I", PCAPNG_BLOCK_SECTION_HEADER)
+
+
+class PcapError(Exception):
+    """
+    Capture file is corrupted or it is not in supported format
+    """
+    pass
+
+
+class Packet:
+    """
+    One packet read from capture file
+    """
+
+    __slots__ = ("timestamp", "length", "link_type", "interface", "data")
+
+    def __init__(self, timestamp, length, link_type, interface, data):
+        """
+        :param timestamp: capture time in nanoseconds since epoch
+        :param length: original length of packet on the wire
+        :param link_type: link-layer header type (LINKTYPE_* value)
+        :param interface: index of interface the packet was captured on
+        :param data: captured bytes (memoryview)
+        """
+        self.timestamp = timestamp
+        self.length = length
+        self.link_type = link_type
+        self.interface = interface
+        self.data = data
+
+    @property
+    def time(self):
+        """
+        :return: capture time in seconds since epoch
+        """
+        return self.timestamp / 1000000000
+
+
+class Interface:
+    """
+    Capture interface - link type, snapshot length and timestamp resolution
+    """
+
+    def __init__(self, link_type, snaplen, units_per_second=1000000, offset=0):
+        """
+        :param link_type: link-layer header type (LINKTYPE_* value)
+        :param snaplen: maximal number of captured bytes per packet, 0 if unknown
+        :param units_per_second: timestamp resolution
+        :param offset: offset of timestamps in seconds
+        """
+        self.link_type = link_type
+        self.snaplen = snaplen
+        self.units_per_second = units_per_second
+        self.offset = offset
+
+        if 1000000000 % units_per_second == 0:
+            self._multiplier = 1000000000 // units_per_second
+        else:
+            self._multiplier = None
+
+    @property
+    def nanosecond(self):
+        """
+        :return: True if interface timestamps are more precise than microseconds
+        """
+        return self.units_per_second > 1000000
+
+    def timestamp(self, units):
+        """
+        Convert raw timestamp to nanoseconds since epoch
+
+        :param units: timestamp in interface resolution
+        :return: timestamp in nanoseconds
+        """
+        if self._multiplier is not None:
+            ns = units * self._multiplier
+        else:
+            ns = units * 1000000000 // self.units_per_second
+        return ns + self.offset * 1000000000 if self.offset else ns
+
+
+class _Buffer:
+    """
+    Buffer over stream or over memory block (bytes, mmap)
+
+    Returned memoryviews reference buffer data, buffer is never modified in place
+    so returned views remain valid after buffer is refilled.
+    """
+
+    def __init__(self, source, chunk_size):
+        """
+        :param source: readable binary stream or object supporting buffer protocol
+        :param chunk_size: number of bytes read from stream at once
+        """
+        if hasattr(source, "read"):
+            self._stream = source
+            self._view = memoryview(b"")
+        else:
+            self._stream = None
+            self._view = memoryview(source).cast("B")
+
+        self._position = 0
+        self._base = 0
+        self._chunk_size = chunk_size
+
+    def tell(self):
+        """
+        :return: offset of current position from the beginning of source
+        """
+        return self._base + self._position
+
+    def read(self, size):
+        """
+        Read exactly size bytes
+
+        :param size: number of bytes
+        :return: memoryview or None if there is not enough data
+        """
+        start = self._position
+        end = start + size
+        if end > len(self._view):
+            if not self._fill(size):
+                return None
+            start, end = 0, size
+
+        self._position = end
+        return self._view[start:end]
+
+    def unread(self, size):
+        """
+        Return last read bytes back to buffer
+
+        :param size: number of bytes, has to be at most size of last read
+        """
+        self._position -= size
+
+    def _fill(self, size):
+        """
+        Load data from stream so that at least size bytes are available
+
+        :param size: number of bytes required
+        :return: True if enough data is available
+        """
+        if self._stream is None:
+            return False
+
+        chunks = []
+        available = len(self._view) - self._position
+        if available:
+            chunks.append(self._view[self._position:].tobytes())
+
+        try:
+            while available < size:
+                chunk = self._stream.read(max(self._chunk_size, size - available))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                available += len(chunk)
+        except (EOFError, zlib.error, OSError) as ex:
+            raise PcapError("Unable to read capture: %s" % ex) from ex
+
+        self._base += self._position
+        self._view = memoryview(chunks[0] if len(chunks) == 1 else b"".join(chunks))
+        self._position = 0
+        return available >= size
+
+    def release(self):
+        """
+        Drop reference to buffered data
+        """
+        self._view = memoryview(b"")
+        self._position = 0
+
+
+class PcapReader:
+    """
+    Streaming reader of pcap and pcapng files
+
+    Example usage:
+        with open_capture(location) as reader:
+            for packet in reader:
+                print(packet.timestamp, len(packet.data))
+
+    Packet data reference reader buffer, use bytes(packet.data) to keep data after reader is closed.
+    """
+
+    def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE, closing=None):
+        """
+        :param source: readable binary stream (file, GzipFile, ...) or buffer (bytes, mmap, ...)
+        :param chunk_size: number of bytes read from stream at once
+        :param closing: list of objects that will be closed together with reader
+        """
+        self._buffer = _Buffer(source, chunk_size)
+        self._closing = closing or []
+
+        self.format = None
+        self.interfaces = []
+        self.section_options = {}
+        # Offset of record (pcap) or block (pcapng) of last returned packet
+        self.record_offset = None
+
+        self._endian = "<"
+        self._read_file_header()
+
+        # Offset of first record, everything before it is file header
+        self.data_offset = self._buffer.tell()
+
+    @property
+    def link_type(self):
+        """
+        :return: link type of first interface, None if there is no interface
+        """
+        return self.interfaces[0].link_type if self.interfaces else None
+
+    @property
+    def snaplen(self):
+        """
+        :return: snapshot length of first interface, None if there is no interface
+        """
+        return self.interfaces[0].snaplen if self.interfaces else None
+
+    @property
+    def nanosecond(self):
+        """
+        :return: True if any interface uses precision better than microseconds
+        """
+        return any(i.nanosecond for i in self.interfaces)
+
+    def tell(self):
+        """
+        :return: offset of data that were not parsed yet, end of last returned packet during iteration
+        """
+        return self._buffer.tell()
+
+    def _read_file_header(self):
+        header = self._buffer.read(8)
+        if header is None:
+            raise PcapError("File is too short")
+
+        if header[:4] == _SECTION_HEADER_MAGIC:
+            self.format = "pcapng"
+            self._read_section_header(header)
+            self._read_interfaces()
+            return
+
+        for endian in ("<", ">"):
+            magic, = struct.unpack(endian + "I", header[:4])
+            if magic in (PCAP_MAGIC_MICROSECONDS, PCAP_MAGIC_NANOSECONDS):
+                self._endian = endian
+                break
+        else:
+            raise PcapError("Unknown file format")
+
+        rest = self._buffer.read(16)
+        if rest is None:
+            raise PcapError("File header is truncated")
+
+        _, _, snaplen, link_type = struct.unpack(self._endian + "iIII", rest)
+        units_per_second = 1000000000 if magic == PCAP_MAGIC_NANOSECONDS else 1000000
+
+        self.format = "pcap"
+        self.interfaces = [Interface(link_type & 0x0fffffff, snaplen, units_per_second)]
+
+    def _read_section_header(self, header):
+        byte_order = self._buffer.read(4)
+        if byte_order is None:
+            raise PcapError("Section header block is truncated")
+
+        for endian in ("<", ">"):
+            if struct.unpack(endian + "I", byte_order)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+                self._endian = endian
+                break
+        else:
+            raise PcapError("Invalid byte order magic in section header block")
+
+        block_length, = struct.unpack(self._endian + "I", header[4:8])
+        if block_length < 28 or block_length % 4:
+            raise PcapError("Invalid section header block length")
+
+        body = self._buffer.read(block_length - 12)
+        if body is None:
+            raise PcapError("Section header block is truncated")
+
+        major, _ = struct.unpack(self._endian + "HH", body[:4])
+        if major != 1:
+            raise PcapError("Unsupported pcapng version %s" % major)
+
+        self.interfaces = []
+        self.section_options = {code: value.tobytes() for code, value in self._parse_options(body[12:-4])}
+
+    def _read_interfaces(self):
+        """
+        Read interface description blocks that precede first packet
+        """
+        while True:
+            header = self._buffer.read(8)
+            if header is None:
+                return
+
+            block_type, block_length = struct.unpack(self._endian + "II", header)
+            if block_type != PCAPNG_BLOCK_INTERFACE_DESCRIPTION or block_length < 20 or block_length % 4:
+                self._buffer.unread(8)
+                return
+
+            body = self._buffer.read(block_length - 8)
+            if body is None:
+                return
+            self._add_interface(body)
+
+    def _parse_options(self, options):
+        """
+        Parse pcapng options
+
+        :param options: memoryview with options
+        :return: list of tuples (code, value)
+        """
+        header = struct.Struct(self._endian + "HH")
+        result = []
+        position = 0
+        while position + 4 <= len(options):
+            code, length = header.unpack_from(options, position)
+            if code == PCAPNG_OPTION_END:
+                break
+            position += 4
+            result.append((code, options[position:position + length]))
+            position += (length + 3) & ~3
+        return result
+
+    def _add_interface(self, body):
+        link_type, _, snaplen = struct.unpack_from(self._endian + "HHI", body)
+
+        units_per_second = 1000000
+        offset = 0
+        for code, value in self._parse_options(body[8:-4]):
+            if code == PCAPNG_OPTION_IF_TSRESOL and len(value) >= 1:
+                resolution = value[0]
+                if resolution & 0x80:
+                    units_per_second = 2 ** (resolution & 0x7f)
+                else:
+                    units_per_second = 10 ** resolution
+            elif code == PCAPNG_OPTION_IF_TSOFFSET and len(value) >= 8:
+                offset, = struct.unpack(self._endian + "q", value[:8])
+
+        self.interfaces.append(Interface(link_type, snaplen, units_per_second, offset))
+
+    def _check_length(self, caplen):
+        if caplen > max(MAX_PACKET_SIZE, self.snaplen or 0):
+            raise PcapError("Packet length %s is too large, file is probably corrupted" % caplen)
+
+    def __iter__(self):
+        if self.format == "pcap":
+            return self._iter_pcap()
+        return self._iter_pcapng()
+
+    def _iter_pcap(self):
+        read = self._buffer.read
+        record_header = struct.Struct(self._endian + "IIII")
+        interface = self.interfaces[0]
+        link_type = interface.link_type
+        multiplier = 1000000000 // interface.units_per_second
+
+        tell = self._buffer.tell
+
+        while True:
+            self.record_offset = tell()
+            header = read(16)
+            if header is None:
+                return
+
+            seconds, fraction, caplen, length = record_header.unpack(header)
+            self._check_length(caplen)
+
+            data = read(caplen)
+            if data is None:
+                return
+
+            yield Packet(seconds * 1000000000 + fraction * multiplier, length, link_type, 0, data)
+
+    def _iter_pcapng(self):
+        read = self._buffer.read
+        tell = self._buffer.tell
+        last_timestamp = 0
+
+        while True:
+            self.record_offset = tell()
+            header = read(8)
+            if header is None:
+                return
+
+            if header[:4] == _SECTION_HEADER_MAGIC:
+                self._read_section_header(header)
+                continue
+
+            block_type, block_length = struct.unpack(self._endian + "II", header)
+            if block_length < 12 or block_length % 4:
+                raise PcapError("Invalid block length %s" % block_length)
+
+            body = read(block_length - 8)
+            if body is None:
+                return
+
+            if block_type == PCAPNG_BLOCK_ENHANCED_PACKET:
+                interface_id, ts_high, ts_low, caplen, length = struct.unpack_from(self._endian + "IIIII", body)
+                interface = self._get_interface(interface_id)
+                last_timestamp = interface.timestamp((ts_high << 32) | ts_low)
+                yield Packet(last_timestamp, length, interface.link_type, interface_id, body[20:20 + caplen])
+
+            elif block_type == PCAPNG_BLOCK_SIMPLE_PACKET:
+                # Simple packet block does not contain timestamp, timestamp of previous packet is used
+                interface = self._get_interface(0)
+                length, = struct.unpack_from(self._endian + "I", body)
+                caplen = min(length, block_length - 16)
+                if interface.snaplen:
+                    caplen = min(caplen, interface.snaplen)
+                yield Packet(last_timestamp, length, interface.link_type, 0, body[4:4 + caplen])
+
+            elif block_type == PCAPNG_BLOCK_PACKET:
+                interface_id, _, ts_high, ts_low, caplen, length = struct.unpack_from(self._endian + "HHIIII", body)
+                interface = self._get_interface(interface_id)
+                last_timestamp = interface.timestamp((ts_high << 32) | ts_low)
+                yield Packet(last_timestamp, length, interface.link_type, interface_id, body[20:20 + caplen])
+
+            elif block_type == PCAPNG_BLOCK_INTERFACE_DESCRIPTION:
+                self._add_interface(body)
+
+    def _get_interface(self, interface_id):
+        if interface_id >= len(self.interfaces):
+            raise PcapError("Packet refers to unknown interface %s" % interface_id)
+        return self.interfaces[interface_id]
+
+    def close(self):
+        """
+        Close reader and all underlying resources
+        """
+        self._buffer.release()
+        for resource in self._closing:
+            try:
+                resource.close()
+            except BufferError:
+                # mmap is still referenced by packets, it will be closed by garbage collector
+                pass
+        self._closing = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_capture(location, use_mmap=True, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Open capture file saved on disk
+
+    Compressed files (e.g. files from FileStorage) are decompressed on the fly by codec detected from file header,
+    uncompressed files are memory mapped when use_mmap is True.
+
+    :param location: path to capture file
+    :param use_mmap: memory map uncompressed files instead of reading them
+    :param chunk_size: number of bytes read from stream at once
+    :return: PcapReader
+    """
+    f = open(location, "rb")
+    closing = [f]
+    try:
+        codec = detect_codec(f)
+
+        if codec is not None:
+            source = codec.open(f, "rb")
+            closing.insert(0, source)
+        elif use_mmap and os.fstat(f.fileno()).st_size > 0:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            closing.insert(0, source)
+        else:
+            source = f
+
+        return PcapReader(source, chunk_size, closing=closing)
+    except Exception:
+        for resource in closing:
+            try:
+                resource.close()
+            except BufferError:
+                pass
+        raise
@@ -0,0 +1,202 @@
+"""
+Rewriting of captured packets - IP and MAC address mapping and timestamp shift
+
+All changes are made in one pass, checksums are updated incrementally (RFC 1624) instead of being recomputed.
+"""
+import struct
+import ipaddress
+
+from .reader import Packet
+from .decode import decode, ETHERTYPE_ARP, IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMPV6
+
+_checksum = struct.Struct("!H")
+
+# Offset of checksum field in transport header
+_L4_CHECKSUM_OFFSETS = {
+    IPPROTO_TCP: 16,
+    IPPROTO_UDP: 6,
+}
+
+
+def _fold(value):
+    while value >> 16:
+        value = (value & 0xffff) + (value >> 16)
+    return value
+
+
+def checksum_delta(old, new):
+    """
+    Compute one's complement sum difference used for incremental checksum update
+
+    :param old: original bytes covered by checksum (even length)
+    :param new: replacement bytes
+    :return: value that is added to complemented checksum, see update_checksum
+    """
+    total = 0
+    for i in range(0, len(old), 2):
+        total += (~((old[i] << 8) | old[i + 1]) & 0xffff) + ((new[i] << 8) | new[i + 1])
+    return _fold(total)
+
+
+def update_checksum(checksum, *deltas):
+    """
+    Incrementally update internet checksum - RFC 1624, eqn. 3: HC' = ~(~HC + ~m + m')
+
+    :param checksum: original checksum
+    :param deltas: values computed by checksum_delta for every changed part
+    :return: new checksum
+    """
+    return ~_fold((~checksum & 0xffff) + sum(deltas)) & 0xffff
+
+
+def parse_mac(mac):
+    """
+    :param mac: MAC address string e.g. 08:00:27:bd:c2:37
+    :return: 6 bytes
+    """
+    address = bytes.fromhex(mac.replace(":", "").replace("-", ""))
+    if len(address) != 6:
+        raise ValueError("Invalid MAC address %s" % mac)
+    return address
+
+
+def parse_ip(ip):
+    """
+    :param ip: IPv4 or IPv6 address string
+    :return: 4 or 16 bytes
+    """
+    return ipaddress.ip_address(ip).packed
+
+
+class PacketRewriter:
+    """
+    Rewrite IP addresses, MAC addresses and timestamps of packets
+
+    IP addresses are replaced in IPv4, IPv6 and ARP headers, MAC addresses in ethernet header.
+    """
+
+    def __init__(self, ip_mapping=None, mac_mapping=None, timestamp_shift=0):
+        """
+        :param ip_mapping: dict original IP -> new IP
+        :param mac_mapping: dict original MAC -> new MAC
+        :param timestamp_shift: number of nanoseconds subtracted from every timestamp, shifted timestamps can be
+                                negative (as in editcap -t), relative timing of packets is always preserved
+        """
+        self._ip_mapping = {}
+        for original, new in (ip_mapping or {}).items():
+            original, new = parse_ip(original), parse_ip(new)
+            if len(original) != len(new):
+                raise ValueError("IP address %s can not be replaced by address of other version" % original)
+            self._ip_mapping[original] = (new, checksum_delta(original, new))
+
+        self._mac_mapping = {parse_mac(original): parse_mac(new) for original, new in (mac_mapping or {}).items()}
+        self._timestamp_shift = timestamp_shift
+
+    @staticmethod
+    def from_configuration(configuration):
+        """
+        Create rewriter from trace-normalizer configuration
+
+        :param configuration: dict with optional keys IP, MAC (lists of dicts original/new) and timestamp (seconds)
+        :return: PacketRewriter
+        """
+        return PacketRewriter(
+            ip_mapping={m["original"]: m["new"] for m in configuration.get("IP", [])},
+            mac_mapping={m["original"]: m["new"] for m in configuration.get("MAC", [])},
+            timestamp_shift=round(float(configuration.get("timestamp", 0)) * 1000000000),
+        )
+
+    def rewrite(self, packet):
+        """
+        Rewrite one packet
+
+        :param packet: Packet
+        :return: new Packet, data are copied only if packet content changes
+        """
+        timestamp = packet.timestamp - self._timestamp_shift
+        data = packet.data
+
+        if self._ip_mapping or self._mac_mapping:
+            headers = decode(data, packet.link_type)
+
+            mac_src = self._mac_mapping.get(headers.eth_src)
+            mac_dst = self._mac_mapping.get(headers.eth_dst)
+            ip_src = self._ip_mapping.get(headers.ip_src)
+            ip_dst = self._ip_mapping.get(headers.ip_dst)
+            arp = headers.ethertype == ETHERTYPE_ARP and self._ip_mapping
+
+            if mac_src or mac_dst or ip_src or ip_dst or arp:
+                data = bytearray(data)
+                if mac_dst:
+                    data[0:6] = mac_dst
+                if mac_src:
+                    data[6:12] = mac_src
+                if ip_src or ip_dst:
+                    self._rewrite_ip(data, headers, ip_src, ip_dst)
+                if arp:
+                    self._rewrite_arp(data)
+
+        return Packet(timestamp, packet.length, packet.link_type, packet.interface, data)
+
+    @staticmethod
+    def _rewrite_ip(data, headers, ip_src, ip_dst):
+        offset = headers.ip_offset
+        size = len(headers.ip_src)
+        src_offset = offset + (12 if headers.ip_version == 4 else 8)
+        dst_offset = src_offset + size
+
+        deltas = []
+        if ip_src:
+            data[src_offset:src_offset + size] = ip_src[0]
+            deltas.append(ip_src[1])
+        if ip_dst:
+            data[dst_offset:dst_offset + size] = ip_dst[0]
+            deltas.append(ip_dst[1])
+
+        if headers.ip_version == 4:
+            old, = _checksum.unpack_from(data, offset + 10)
+            _checksum.pack_into(data, offset + 10, update_checksum(old, *deltas))
+
+        # Transport checksums cover pseudo header with IP addresses
+        if headers.l4_offset is None:
+            return
+
+        if headers.protocol == IPPROTO_ICMPV6:
+            checksum_offset = headers.l4_offset + 2
+        elif headers.protocol in _L4_CHECKSUM_OFFSETS:
+            checksum_offset = headers.l4_offset + _L4_CHECKSUM_OFFSETS[headers.protocol]
+        else:
+            return
+
+        if len(data) < checksum_offset + 2:
+            return
+
+        old, = _checksum.unpack_from(data, checksum_offset)
+        if headers.protocol == IPPROTO_UDP:
+            if old == 0 and headers.ip_version == 4:
+                # UDP checksum is not used
+                return
+            new = update_checksum(old, *deltas) or 0xffff
+        else:
+            new = update_checksum(old, *deltas)
+        _checksum.pack_into(data, checksum_offset, new)
+
+    def _rewrite_arp(self, data):
+        # Ethernet/IPv4 ARP - sender IP at 28, target IP at 38 (14 bytes of ethernet header included)
+        if len(data) < 42 or data[14:20] != b"\x00\x01\x08\x00\x06\x04":
+            return
+        for offset in (28, 38):
+            replacement = self._ip_mapping.get(bytes(data[offset:offset + 4]))
+            if replacement:
+                data[offset:offset + 4] = replacement[0]
+
+    def rewrite_all(self, packets):
+        """
+        Rewrite stream of packets
+
+        :param packets: iterable of Packets
+        :return: generator of rewritten Packets
+        """
+        rewrite = self.rewrite
+        for packet in packets:
+            yield rewrite(packet)
@@ -0,0 +1,83 @@
+"""
+Extraction of packets captured in time range and matching filter
+
+Packet index of compressed capture is used when it is available, only blocks that can contain packets from
+requested range are decompressed. Captures without index are scanned whole.
+"""
+from .reader import PcapReader, open_capture, DEFAULT_CHUNK_SIZE
+from .writer import iter_capture, FORMATS
+from .index import load_index, iter_blocks
+
+
+def timestamp_from_seconds(seconds):
+    """
+    :param seconds: time in seconds since epoch or None
+    :return: time in nanoseconds since epoch or None
+    """
+    return None if seconds is None else int(round(seconds * 1000000000))
+
+
+class _ChunkStream:
+    """
+    Readable stream over iterable of bytes
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def read(self, size=-1):
+        # Whole chunks are returned, PcapReader accepts chunks of any size
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+
+def _open_indexed(location, start, end):
+    """
+    Open reader over blocks of indexed capture that can contain packets from time range
+
+    :return: PcapReader or None if capture has no index
+    """
+    index = load_index(location)
+    if index is None:
+        return None
+
+    f = open(location, "rb")
+    try:
+        blocks = index.blocks_in_time_range(start, end)
+        return PcapReader(_ChunkStream(iter_blocks(f, index, blocks)), closing=[f])
+    except Exception:
+        f.close()
+        raise
+
+
+def slice_capture(location, start=None, end=None, format=None, predicate=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Select packets captured in time range that match predicate
+
+    Capture is opened immediately, so invalid captures are detected before any data are returned.
+
+    :param location: capture location, file can be gzip compressed
+    :param start: start of range in nanoseconds since epoch, unlimited if None
+    :param end: end of range in nanoseconds since epoch (inclusive), unlimited if None
+    :param format: output format (pcap or pcapng), format of capture is used if None
+    :param predicate: function that takes Packet and returns True if it should be returned (see compile_filter)
+    :param chunk_size: approximate size of returned chunks
+    :return: generator of bytes chunks of valid capture file
+    """
+    reader = _open_indexed(location, start, end) or open_capture(location, use_mmap=False)
+    return _iter_slice(reader, start, end, predicate, format if format in FORMATS else reader.format, chunk_size)
+
+
+def _iter_slice(reader, start, end, predicate, format, chunk_size):
+    with reader:
+        packets = (
+            p for p in reader
+            if (start is None or p.timestamp >= start) and (end is None or p.timestamp <= end)
+        )
+        if predicate is not None:
+            packets = filter(predicate, packets)
+        yield from iter_capture(
+            packets, format, snaplen=reader.snaplen, nanosecond=reader.nanosecond, chunk_size=chunk_size
+        )
@@ -0,0 +1,243 @@
+"""
+Traffic time-series of captures
+
+Number of packets and bytes are counted in fixed time buckets. Bucket width starts at BASE_WIDTH and is multiplied by
+FACTOR whenever captured time span would need more than MAX_BUCKETS buckets, so memory is bounded for any capture.
+Coarser levels are created by downsampling the finest level, every level is FACTOR times coarser than previous one.
+Time-series is saved next to compressed capture (location + TIMESERIES_SUFFIX).
+"""
+import sys
+import json
+import array
+import struct
+
+from .reader import open_capture
+
+TIMESERIES_SUFFIX = ".ts"
+
+TIMESERIES_MAGIC = b"TRACETS\0"
+TIMESERIES_VERSION = 1
+
+# 1 ms
+BASE_WIDTH = 1000000
+FACTOR = 10
+MAX_BUCKETS = 100000
+# Downsampling stops at level with at most this number of buckets
+MIN_BUCKETS = 100
+# Level returned when no resolution is requested has at most this number of buckets
+DEFAULT_BUCKETS = 1000
+
+
+class TimeSeriesLevel:
+    """
+    Packets and bytes per bucket of fixed width
+    """
+
+    def __init__(self, width, start, packets, bytes):
+        """
+        :param width: bucket width in nanoseconds
+        :param start: number of first bucket, first bucket starts at start * width nanoseconds since epoch
+        :param packets: array of number of packets per bucket
+        :param bytes: array of number of bytes per bucket
+        """
+        self.width = width
+        self.start = start
+        self.packets = packets
+        self.bytes = bytes
+
+    def __len__(self):
+        return len(self.packets)
+
+    def downsample(self, factor=FACTOR):
+        """
+        :param factor: number of buckets merged into one
+        :return: TimeSeriesLevel with factor times wider buckets
+        """
+        start = self.start // factor
+        length = (self.start + len(self) - 1) // factor - start + 1 if len(self) else 0
+        packet_counts, byte_counts = _zeros(length), _zeros(length)
+
+        shift = self.start - start * factor
+        for i in range(len(self)):
+            bucket = (shift + i) // factor
+            packet_counts[bucket] += self.packets[i]
+            byte_counts[bucket] += self.bytes[i]
+
+        return TimeSeriesLevel(self.width * factor, start, packet_counts, byte_counts)
+
+    def dict(self):
+        return dict(
+            resolution=self.width / 1000000000,
+            start=self.start * self.width / 1000000000,
+            packets=self.packets.tolist(),
+            bytes=self.bytes.tolist(),
+        )
+
+
+def _zeros(length):
+    return array.array("Q", bytes(8 * length))
+
+
+class TimeSeriesBuilder:
+    """
+    Incremental builder of time-series, packets can be added in any order
+
+    Example usage:
+        builder = TimeSeriesBuilder()
+        for packet in reader:
+            builder.add(packet.timestamp, packet.length)
+        levels = builder.levels()
+    """
+
+    def __init__(self, width=BASE_WIDTH, max_buckets=MAX_BUCKETS):
+        """
+        :param width: width of finest buckets in nanoseconds
+        :param max_buckets: maximal number of buckets of finest level
+        """
+        self.width = width
+        self._max_buckets = max_buckets
+        # bucket -> [packets, bytes]
+        self._buckets = {}
+        self._first = self._last = None
+
+    def add(self, timestamp, length):
+        """
+        :param timestamp: packet timestamp in nanoseconds
+        :param length: original length of packet
+        """
+        bucket = timestamp // self.width
+        item = self._buckets.get(bucket)
+        if item is None:
+            if self._first is None:
+                self._first = self._last = bucket
+            elif bucket < self._first or bucket > self._last:
+                self._first, self._last = min(self._first, bucket), max(self._last, bucket)
+                if self._last - self._first >= self._max_buckets:
+                    self._coarsen()
+                    bucket = timestamp // self.width
+            item = self._buckets.setdefault(bucket, [0, 0])
+        item[0] += 1
+        item[1] += length
+
+    def _coarsen(self):
+        while self._last - self._first >= self._max_buckets:
+            self.width *= FACTOR
+            self._first //= FACTOR
+            self._last //= FACTOR
+
+            buckets = {}
+            for bucket, (packets, size) in self._buckets.items():
+                item = buckets.setdefault(bucket // FACTOR, [0, 0])
+                item[0] += packets
+                item[1] += size
+            self._buckets = buckets
+
+    def levels(self):
+        """
+        :return: list of TimeSeriesLevel from finest to coarsest, empty list if no packet was added
+        """
+        if self._first is None:
+            return []
+
+        length = self._last - self._first + 1
+        packet_counts, byte_counts = _zeros(length), _zeros(length)
+        for bucket, (packets, size) in self._buckets.items():
+            packet_counts[bucket - self._first] = packets
+            byte_counts[bucket - self._first] = size
+
+        levels = [TimeSeriesLevel(self.width, self._first, packet_counts, byte_counts)]
+        while len(levels[-1]) > MIN_BUCKETS:
+            levels.append(levels[-1].downsample())
+        return levels
+
+
+def save_timeseries(location, levels):
+    """
+    Save time-series levels to file
+
+    :param location: time-series file location
+    :param levels: list of TimeSeriesLevel
+    """
+    meta = json.dumps(dict(
+        version=TIMESERIES_VERSION,
+        levels=[dict(width=level.width, start=level.start, length=len(level)) for level in levels],
+    )).encode()
+
+    with open(location, "wb") as f:
+        f.write(TIMESERIES_MAGIC + struct.pack("<I", len(meta)) + meta)
+        for level in levels:
+            for values in (level.packets, level.bytes):
+                if sys.byteorder == "big":
+                    values = array.array(values.typecode, values)
+                    values.byteswap()
+                values.tofile(f)
+
+
+def load_timeseries(location):
+    """
+    Load time-series levels from file
+
+    :param location: time-series file location
+    :return: list of TimeSeriesLevel or None if file does not exist or is invalid
+    """
+    try:
+        with open(location, "rb") as f:
+            header = f.read(len(TIMESERIES_MAGIC) + 4)
+            if len(header) != len(TIMESERIES_MAGIC) + 4 or header[:len(TIMESERIES_MAGIC)] != TIMESERIES_MAGIC:
+                return None
+
+            meta_length, = struct.unpack("<I", header[len(TIMESERIES_MAGIC):])
+            meta = json.loads(f.read(meta_length).decode())
+            if meta["version"] != TIMESERIES_VERSION:
+                return None
+
+            levels = []
+            for level in meta["levels"]:
+                arrays = []
+                for _ in range(2):
+                    values = array.array("Q")
+                    values.fromfile(f, level["length"])
+                    if sys.byteorder == "big":
+                        values.byteswap()
+                    arrays.append(values)
+                levels.append(TimeSeriesLevel(level["width"], level["start"], *arrays))
+    except (OSError, ValueError, KeyError, EOFError):
+        return None
+    return levels
+
+
+def build_timeseries(location):
+    """
+    Compute time-series levels by reading whole capture
+
+    :param location: capture location, file can be gzip compressed
+    :return: list of TimeSeriesLevel
+    """
+    builder = TimeSeriesBuilder()
+    with open_capture(location, use_mmap=False) as reader:
+        for packet in reader:
+            builder.add(packet.timestamp, packet.length)
+    return builder.levels()
+
+
+def select_level(levels, resolution=None):
+    """
+    Select the finest level with buckets at least as wide as requested resolution
+
+    :param levels: list of TimeSeriesLevel from finest to coarsest
+    :param resolution: requested bucket width in nanoseconds, level with at most DEFAULT_BUCKETS buckets is selected
+                       if None
+    :return: TimeSeriesLevel or None if there are no levels, coarsest level is downsampled when it is finer than
+             requested resolution
+    """
+    for level in levels:
+        if resolution is None and len(level) <= DEFAULT_BUCKETS:
+            return level
+        if resolution is not None and level.width >= resolution:
+            return level
+
+    if not levels:
+        return None
+    if resolution is None:
+        return levels[-1]
+    return levels[-1].downsample(int(-(-resolution // levels[-1].width)))
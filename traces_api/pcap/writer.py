@@ -0,0 +1,196 @@
+"""
+Writers of captured traffic dumps in pcap and pcapng format
+"""
+import io
+import struct
+
+from .reader import PcapError, PCAP_MAGIC_MICROSECONDS, PCAP_MAGIC_NANOSECONDS, PCAPNG_BLOCK_SECTION_HEADER
+from .reader import PCAPNG_BLOCK_INTERFACE_DESCRIPTION, PCAPNG_BLOCK_ENHANCED_PACKET, PCAPNG_BYTE_ORDER_MAGIC
+from .reader import PCAPNG_OPTION_IF_TSRESOL
+from .decode import LINKTYPE_ETHERNET
+
+FORMATS = ("pcap", "pcapng")
+
+DEFAULT_SNAPLEN = 262144
+
+_PADDING = b"\x00\x00\x00"
+
+_pcap_record_header = struct.Struct("<IIII")
+_pcapng_packet_header = struct.Struct("<IIIIIII")
+_uint32 = struct.Struct("<I")
+
+
+class PcapWriter:
+    """
+    Writer of pcap files
+
+    File header is written together with first packet, all packets must have the same link type.
+    """
+
+    def __init__(self, stream, link_type=None, snaplen=DEFAULT_SNAPLEN, nanosecond=False):
+        """
+        :param stream: writable binary stream
+        :param link_type: link type written in file header, link type of first packet is used if None
+        :param snaplen: snapshot length written in file header
+        :param nanosecond: True to write timestamps with nanosecond precision
+        """
+        self._stream = stream
+        self._link_type = link_type
+        self._snaplen = snaplen or DEFAULT_SNAPLEN
+        self._nanosecond = nanosecond
+        self._header_written = False
+
+    def _write_header(self):
+        magic = PCAP_MAGIC_NANOSECONDS if self._nanosecond else PCAP_MAGIC_MICROSECONDS
+        link_type = LINKTYPE_ETHERNET if self._link_type is None else self._link_type
+        self._stream.write(struct.pack("<IHHiIII", magic, 2, 4, 0, 0, self._snaplen, link_type))
+        self._header_written = True
+
+    def write(self, packet):
+        """
+        Write one packet
+
+        :param packet: packet with timestamp, length, link_type and data attributes
+        """
+        if not self._header_written:
+            if self._link_type is None:
+                self._link_type = packet.link_type
+            self._write_header()
+
+        if packet.link_type != self._link_type:
+            raise PcapError("Pcap file can not contain packets with different link types")
+
+        seconds, fraction = divmod(packet.timestamp, 1000000000)
+        if not self._nanosecond:
+            fraction //= 1000
+
+        # Timestamps before epoch (e.g. shifted by normalizer) wrap around the unsigned field as in editcap
+        data = packet.data
+        self._stream.write(_pcap_record_header.pack(seconds & 0xffffffff, fraction, len(data), packet.length))
+        self._stream.write(data)
+
+    def close(self):
+        """
+        Finish file, header is written even if there is no packet
+        """
+        if not self._header_written:
+            self._write_header()
+
+
+class PcapngWriter:
+    """
+    Writer of pcapng files
+
+    One interface description block is written for every link type before first packet with this link type.
+    """
+
+    def __init__(self, stream, snaplen=DEFAULT_SNAPLEN, nanosecond=False, application=None):
+        """
+        :param stream: writable binary stream
+        :param snaplen: snapshot length written in interface description blocks
+        :param nanosecond: True to write timestamps with nanosecond precision
+        :param application: name of application written in section header block
+        """
+        self._stream = stream
+        self._snaplen = snaplen or DEFAULT_SNAPLEN
+        self._nanosecond = nanosecond
+        self._interfaces = {}
+
+        options = b""
+        if application:
+            options = self._option(4, application.encode()) + self._option(0, b"")
+        self._write_block(
+            PCAPNG_BLOCK_SECTION_HEADER,
+            struct.pack("<IHHq", PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1) + options
+        )
+
+    @staticmethod
+    def _option(code, value):
+        return struct.pack("<HH", code, len(value)) + value + _PADDING[:-len(value) % 4]
+
+    def _write_block(self, block_type, body):
+        length = 12 + len(body)
+        self._stream.write(struct.pack("<II", block_type, length) + body + _uint32.pack(length))
+
+    def _get_interface(self, link_type):
+        interface = self._interfaces.get(link_type)
+        if interface is None:
+            options = b""
+            if self._nanosecond:
+                options = self._option(PCAPNG_OPTION_IF_TSRESOL, b"\x09") + self._option(0, b"")
+            self._write_block(PCAPNG_BLOCK_INTERFACE_DESCRIPTION, struct.pack("<HHI", link_type, 0, self._snaplen) + options)
+            interface = self._interfaces[link_type] = len(self._interfaces)
+        return interface
+
+    def write(self, packet):
+        """
+        Write one packet
+
+        :param packet: packet with timestamp, length, link_type and data attributes
+        """
+        interface = self._get_interface(packet.link_type)
+
+        timestamp = packet.timestamp if self._nanosecond else packet.timestamp // 1000
+        # Timestamps before epoch wrap around the unsigned field as in editcap
+        timestamp &= 0xffffffffffffffff
+        data = packet.data
+        padding = -len(data) % 4
+        length = 32 + len(data) + padding
+
+        self._stream.write(_pcapng_packet_header.pack(
+            PCAPNG_BLOCK_ENHANCED_PACKET, length, interface, timestamp >> 32, timestamp & 0xffffffff,
+            len(data), packet.length
+        ))
+        self._stream.write(data)
+        self._stream.write(_PADDING[:padding] + _uint32.pack(length))
+
+    def close(self):
+        """
+        Finish file
+        """
+        pass
+
+
+def create_writer(stream, format, snaplen=DEFAULT_SNAPLEN, nanosecond=False):
+    """
+    Create writer for given format
+
+    :param stream: writable binary stream
+    :param format: pcap or pcapng
+    :param snaplen: snapshot length written in file
+    :param nanosecond: True to write timestamps with nanosecond precision
+    :return: PcapWriter or PcapngWriter
+    """
+    if format == "pcap":
+        return PcapWriter(stream, snaplen=snaplen, nanosecond=nanosecond)
+    if format == "pcapng":
+        return PcapngWriter(stream, snaplen=snaplen, nanosecond=nanosecond)
+    raise PcapError("Unknown capture format %s" % format)
+
+
+def iter_capture(packets, format, snaplen=DEFAULT_SNAPLEN, nanosecond=False, chunk_size=1024 * 1024):
+    """
+    Serialize packets into capture file chunks
+
+    Output is produced lazily, so it can be streamed (e.g. compressed on the fly) without temporary file.
+
+    :param packets: iterable of packets
+    :param format: pcap or pcapng
+    :param snaplen: snapshot length written in file
+    :param nanosecond: True to write timestamps with nanosecond precision
+    :param chunk_size: approximate size of returned chunks
+    :return: generator of bytes
+    """
+    buffer = io.BytesIO()
+    writer = create_writer(buffer, format, snaplen=snaplen, nanosecond=nanosecond)
+
+    for packet in packets:
+        writer.write(packet)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    writer.close()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -1,4 +1,4 @@
-from flask_restplus import fields
+from flask_restplus import fields, reqparse
 
 from traces_api.api.restplus import api
 
@@ -29,44 +29,83 @@ label_field = fields.String(name="Label", example="IMPORTANT")
 
 id_annotated_unit = fields.Integer(example=156, description="ID of annotated unit", required=True)
 
+tcp_conversation = api.model("TCPConversations", {
+    "IP A": fields.String(),
+    "Port A": fields.Integer(),
+    "IP B": fields.String(),
+    "Port B": fields.Integer(),
+    "Frames B-A": fields.Integer(),
+    "Bytes B-A": fields.Integer(),
+    "Frames A-B": fields.Integer(),
+    "Bytes A-B": fields.Integer(),
+    "Frames": fields.Integer(),
+    "Bytes": fields.Integer(),
+    "Relative start": fields.Float(example=1541346574.1234),
+})
+
+udp_conversation = api.model("UDPConversations", dict(tcp_conversation))
+
+icmp_conversations = fields.List(fields.Nested(api.model("ICMPConversations", {
+    "IP A": fields.String(),
+    "IP B": fields.String(),
+    "Frames B-A": fields.Integer(),
+    "Bytes B-A": fields.Integer(),
+    "Frames A-B": fields.Integer(),
+    "Bytes A-B": fields.Integer(),
+    "Frames": fields.Integer(),
+    "Bytes": fields.Integer(),
+    "Relative start": fields.Float(example=0.0012),
+})))
+
+ipv6_endpoints = fields.List(fields.Nested(api.model("IPv6Endpoints", {
+    "IP": fields.String(example="fe80::1"),
+    "Packets": fields.Integer(),
+    "Bytes": fields.Integer(),
+    "Tx Packets": fields.Integer(),
+    "Tx Bytes": fields.Integer(),
+    "Rx Packets": fields.Integer(),
+    "Rx Bytes": fields.Integer(),
+})))
+
+pairs_mac_ip = fields.List(fields.Nested(api.model("PairsMacIp", {
+    "IP": ip_original,
+    "MAC": mac,
+})))
+
+capture_info = fields.List(fields.Nested(api.model("CaptureInfo", {
+    "File name": fields.String(),
+    "File type": fields.String(),
+    "File encapsulation": fields.String(),
+    "File timestamp precision": fields.String(),
+    "Packet size limit": fields.String(),
+    "Number of packets": fields.String(),
+    "File size": fields.String(),
+    "Capture duration": fields.String(),
+    "First packet time": fields.String(),
+    "Last packet time": fields.String(),
+    "Data byte rate": fields.String(),
+    "Data bit rate": fields.String(),
+    "Average packet size": fields.String(),
+    "Average packet rate": fields.String(),
+    "SHA256": fields.String(),
+    "RIPEMD160": fields.String(),
+    "SHA1": fields.String(),
+    "Strict time order": fields.String(),
+    "Capture application": fields.String(),
+    "Number of interfaces in file": fields.String(),
+})))
+
 analytical_data = fields.Nested(api.model("AnalyticalData", dict(
-    tcp_conversations=fields.List(fields.Nested(api.model("TCPConversations", {
-        "IP A": fields.String(),
-        "Port A": fields.Integer(),
-        "IP B": fields.String(),
-        "Port B": fields.Integer(),
-        "Frames B-A": fields.Integer(),
-        "Bytes B-A": fields.Integer(),
-        "Frames A-B": fields.Integer(),
-        "Bytes A-B": fields.Integer(),
-        "Frames": fields.Integer(),
-        "Bytes": fields.Integer(),
-        "Relative start": fields.Float(example=1541346574.1234),
-    }))),
-    pairs_mac_ip=fields.List(fields.Nested(api.model("PairsMacIp", {
-        "IP": ip_original,
-        "MAC": mac,
-    }))),
-    capture_info=fields.List(fields.Nested(api.model("CaptureInfo", {
-        "File name": fields.String(),
-        "File type": fields.String(),
-        "File encapsulation": fields.String(),
-        "File timestamp precision": fields.String(),
-        "Packet size limit": fields.String(),
-        "Number of packets": fields.String(),
-        "File size": fields.String(),
-        "Capture duration": fields.String(),
-        "First packet time": fields.String(),
-        "Last packet time": fields.String(),
-        "Data byte rate": fields.String(),
-        "Data bit rate": fields.String(),
-        "Average packet size": fields.String(),
-        "Average packet rate": fields.String(),
-        "SHA256": fields.String(),
-        "RIPEMD160": fields.String(),
-        "SHA1": fields.String(),
-        "Strict time order": fields.String(),
-        "Capture application": fields.String(),
-        "Number of interfaces in file": fields.String(),
-    })))
+    tcp_conversations=fields.List(fields.Nested(tcp_conversation)),
+    udp_conversations=fields.List(fields.Nested(udp_conversation)),
+    icmp_conversations=icmp_conversations,
+    ipv6_endpoints=ipv6_endpoints,
+    pairs_mac_ip=pairs_mac_ip,
+    capture_info=capture_info,
 )))
+
+
+download_fields = reqparse.RequestParser()
+download_fields.add_argument('from', type=float, location='args', help='Start of time range (epoch seconds)')
+download_fields.add_argument('to', type=float, location='args', help='End of time range (epoch seconds)')
+download_fields.add_argument('filter', type=str, location='args', help='Packet filter e.g. "tcp port 80 and net 10.0.0.0/8"')
@@ -1,11 +1,18 @@
 import uuid
+import glob
+import contextlib
 import shutil
+import hashlib
 import os
 import os.path
 
+import sqlalchemy.exc
 from datetime import datetime
 from pathvalidate import sanitize_filename
 
+from traces_api.database.model.stored_file import ModelStoredFile
+from traces_api.pcap.codecs import find_codec_by_extension, COPY_SIZE
+
 
 class File:
     """
@@ -19,10 +26,14 @@ class File:
         """
         self.location = location
 
-        if self.location.endswith(".gz"):
-            self.format = self.location.split(".")[-2]
+        parts = self.location.split(".")
+        # Codec used for compression of file is recorded in file extension
+        self.codec = find_codec_by_extension(parts[-1]) if len(parts) > 2 else None
+
+        if self.codec is not None:
+            self.format = parts[-2]
         else:
-            self.format = self.location.split(".")[-1]
+            self.format = parts[-1]
 
     def move_file(self, new_location):
         """
@@ -39,7 +50,7 @@ class File:
 
         :return: True if compressed otherwise False
         """
-        return self.location.endswith(".gz")
+        return self.codec is not None
 
     @staticmethod
     def create_new():
@@ -61,7 +72,7 @@ class FileStorage:
         """
         :param storage_folder: Storage folder where files will be saved.
                                Application should have correct permissions to write to this folder.
-        :param compression: Used for compressing files
+        :param compression: Used for compressing files, its extension is appended to names of saved files
         :param subdirectories: True if enable subdirectories in storage
         """
         self._storage_folder = storage_folder
@@ -78,10 +89,11 @@ class FileStorage:
         t = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
         return "{}_{}".format(t, str(uuid.uuid4())[:5])
 
-    def save_file(self, file_stream, format):
+    def save_file(self, file_stream, format, analysis=None):
         """
         :param file_stream:
         :param format: file format (e.g. pcap, ...)
+        :param analysis: StreamAnalysis fed while file is saved, so saved capture does not have to be read again
         :return: Relative file location
         """
         if self._subdirectories:
@@ -90,19 +102,21 @@ class FileStorage:
             if not os.path.isdir("{}/{}".format(self._storage_folder, current_date)):
                 os.mkdir("{}/{}".format(self._storage_folder, current_date))
 
-            file_name = "{}/{}.{}.gz".format(current_date, self._generate_file_name(), sanitize_filename(format))
+            file_name = "{}/{}.{}.{}".format(
+                current_date, self._generate_file_name(), sanitize_filename(format), self._compression.extension
+            )
         else:
-            file_name = "{}.{}.gz".format(self._generate_file_name(), sanitize_filename(format))
+            file_name = "{}.{}.{}".format(self._generate_file_name(), sanitize_filename(format), self._compression.extension)
 
         file_path = "{}/{}".format(self._storage_folder, file_name)
 
-        self._compression.compress(file_stream, file_path)
+        self._compression.compress(file_stream, file_path, analysis=analysis)
 
         return file_name
 
     def remove_file(self, relative_path):
         """
-        Permanently remove file
+        Permanently remove file together with its sidecar files (e.g. packet index)
 
         :param relative_path:
         :return:
@@ -110,6 +124,9 @@ class FileStorage:
         file_path = self._get_absolute_file_path(relative_path)
         os.remove(file_path)
 
+        for sidecar_path in glob.glob(glob.escape(file_path) + ".*"):
+            os.remove(sidecar_path)
+
     def get_file(self, relative_path):
         """
         Get File using relative path
@@ -120,6 +137,13 @@ class FileStorage:
         abs_path = self._get_absolute_file_path(relative_path)
         return File(abs_path)
 
+    def get_digest(self, relative_path):
+        """
+        :param relative_path:
+        :return: SHA-256 of uncompressed content of file if storage knows it, otherwise None
+        """
+        return None
+
     def _get_absolute_file_path(self, relative_path):
         """
         Return absolute path of saved file
@@ -127,3 +151,163 @@ class FileStorage:
         :return: absolute path on disk
         """
         return "{}/{}".format(self._storage_folder, relative_path)
+
+
+class ContentAddressedStorage(FileStorage):
+    """
+    File storage that saves every distinct content only once
+
+    Files are named by SHA-256 of their uncompressed content, which is computed while the content is compressed.
+    References to saved content are counted in stored_file table, file is removed when its last reference is removed.
+    """
+
+    def __init__(self, storage_folder, compression, session_maker, name, subdirectories=True):
+        """
+        :param storage_folder: Storage folder where files will be saved.
+        :param compression: Used for compressing files
+        :param session_maker: SqlAlchemy session maker
+        :param name: Name of storage that distinguishes its files in stored_file table (e.g. units)
+        :param subdirectories: True if files are saved in subdirectories named by hash prefix
+        """
+        super().__init__(storage_folder, compression, subdirectories)
+        self._session_maker = session_maker
+        self._name = name
+
+    @contextlib.contextmanager
+    def _own_session(self):
+        """
+        Session used for reference counting, it is separate from session of caller, so pending changes of caller
+        are neither committed nor discarded by storage
+        """
+        session = getattr(self._session_maker, "session_factory", self._session_maker)()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    @staticmethod
+    def _hash_chunks(file_stream, hasher, size):
+        """
+        Pass chunks of stream through hasher
+
+        :param size: one item list, number of passed bytes is added to it
+        """
+        if hasattr(file_stream, "read"):
+            chunks = iter(lambda: file_stream.read(COPY_SIZE), b"")
+        else:
+            chunks = file_stream
+
+        for chunk in chunks:
+            hasher.update(chunk)
+            size[0] += len(chunk)
+            yield chunk
+
+    def save_file(self, file_stream, format, analysis=None):
+        """
+        Save content, content that is already saved is only referenced again
+
+        :param file_stream: stream or iterable of bytes
+        :param format: file format (e.g. pcap, ...)
+        :param analysis: StreamAnalysis fed while file is saved
+        :return: Relative file location
+        """
+        hasher, size = hashlib.sha256(), [0]
+        temp_path = self._get_absolute_file_path(".tmp_{}".format(uuid.uuid4()))
+        try:
+            self._compression.compress(self._hash_chunks(file_stream, hasher, size), temp_path, analysis=analysis)
+        except Exception:
+            self._remove_with_sidecars(temp_path)
+            raise
+
+        digest = hasher.hexdigest()
+        file_name = "{}.{}.{}".format(digest, sanitize_filename(format), self._compression.extension)
+        if self._subdirectories:
+            os.makedirs(self._get_absolute_file_path(digest[:2]), exist_ok=True)
+            file_name = "{}/{}".format(digest[:2], file_name)
+
+        file_path = self._get_absolute_file_path(file_name)
+        if self._add_reference(file_name, digest, size[0]) and os.path.exists(file_path):
+            self._remove_with_sidecars(temp_path)
+        else:
+            for sidecar_path in glob.glob(glob.escape(temp_path) + ".*"):
+                os.replace(sidecar_path, file_path + sidecar_path[len(temp_path):])
+            os.replace(temp_path, file_path)
+
+        return file_name
+
+    def _add_reference(self, file_name, digest, size):
+        """
+        Add reference to content, content is registered if it is not known
+
+        :return: True if content was already saved
+        """
+        with self._own_session() as session:
+            for _ in range(2):
+                # Waits for concurrent remove_file of the same content, which holds lock of the row
+                updated = session.query(ModelStoredFile).filter(
+                    ModelStoredFile.storage == self._name, ModelStoredFile.file_location == file_name
+                ).update(
+                    {ModelStoredFile.reference_count: ModelStoredFile.reference_count + 1}, synchronize_session=False
+                )
+                if updated:
+                    session.commit()
+                    return True
+
+                session.add(ModelStoredFile(
+                    storage=self._name,
+                    file_location=file_name,
+                    sha256=digest,
+                    size=size,
+                    reference_count=1,
+                    creation_time=datetime.now(),
+                ))
+                try:
+                    session.commit()
+                    return False
+                except sqlalchemy.exc.IntegrityError:
+                    # Same content was registered concurrently, it is referenced instead
+                    session.rollback()
+        raise RuntimeError("Unable to register stored file %s" % file_name)
+
+    def remove_file(self, relative_path):
+        """
+        Remove one reference to content, file is removed when no reference remains
+
+        Files saved without reference counting are removed immediately.
+
+        :param relative_path:
+        """
+        with self._own_session() as session:
+            stored_file = session.query(ModelStoredFile).filter(
+                ModelStoredFile.storage == self._name, ModelStoredFile.file_location == relative_path
+            ).with_for_update().first()
+
+            if stored_file is None:
+                super().remove_file(relative_path)
+                return
+
+            stored_file.reference_count -= 1
+            if stored_file.reference_count == 0:
+                session.delete(stored_file)
+                session.flush()
+                # File is removed before row lock is released, so concurrent save of the same content waits
+                # and registers the content again after the file is gone
+                super().remove_file(relative_path)
+            session.commit()
+
+    def get_digest(self, relative_path):
+        """
+        :param relative_path:
+        :return: SHA-256 of uncompressed content of file or None if file is not content addressed
+        """
+        with self._own_session() as session:
+            stored_file = session.query(ModelStoredFile).filter(
+                ModelStoredFile.storage == self._name, ModelStoredFile.file_location == relative_path
+            ).first()
+            return stored_file.sha256 if stored_file else None
+
+    @staticmethod
+    def _remove_with_sidecars(file_path):
+        for path in [file_path] + glob.glob(glob.escape(file_path) + ".*"):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,288 @@
+import os
+import abc
+import sys
+import time
+import queue
+import threading
+import subprocess
+
+EXT_FOLDER = os.path.dirname(os.path.realpath(__file__)) + "/../ext"
+
+DOCKER_IMAGE = "trace-tools"
+
+
+class ToolRunnerError(Exception):
+    """
+    External tool can not be run (e.g. docker container can not be started)
+    """
+    pass
+
+
+def _run_process(cmd, cwd=None):
+    try:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=cwd)
+    except OSError as ex:
+        raise ToolRunnerError(str(ex)) from ex
+
+    stdout, stderr = p.communicate()
+    return p.returncode, stdout
+
+
+def _local_command(args):
+    # Scripts are run by the same interpreter as the application
+    args = list(args)
+    if args and args[0] == "python3":
+        args[0] = sys.executable
+    return args
+
+
+class DockerRunner:
+    """
+    Run every command in new trace-tools container
+
+    Files used by the command are mounted into the container at the same paths as on the host.
+    """
+
+    def __init__(self, image=DOCKER_IMAGE):
+        """
+        :param image: docker image with trace tools
+        """
+        self._image = image
+
+    def run(self, args, files=()):
+        """
+        Run command in trace-tools working directory
+
+        :param args: list of command arguments e.g. ["python3", "trace-analyzer/trace-analyzer.py", ...]
+        :param files: host paths used by command
+        :return: tuple (return code, stdout)
+        """
+        cmd = ["docker", "run", "--rm"]
+        for location in files:
+            cmd += ["-v", "{0}:{0}".format(location)]
+        cmd += [self._image] + list(args)
+
+        return _run_process(cmd)
+
+
+class LocalRunner:
+    """
+    Run commands directly on the host, tools (tshark, capinfos, tcprewrite, ...) have to be on PATH
+    """
+
+    def __init__(self, cwd=EXT_FOLDER):
+        """
+        :param cwd: directory with trace tools scripts
+        """
+        self._cwd = cwd
+
+    def run(self, args, files=()):
+        """
+        Run command in trace-tools directory
+
+        :param args: list of command arguments
+        :param files: host paths used by command
+        :return: tuple (return code, stdout)
+        """
+        return _run_process(_local_command(args), cwd=self._cwd)
+
+
+class Worker(abc.ABC):
+    """
+    Long-lived process which executes trace-tools commands, used by PooledRunner
+    """
+
+    def __init__(self):
+        self.jobs = 0
+        self.checked_at = time.monotonic()
+
+    def can_access(self, location):
+        """
+        :param location: host path
+        :return: True if file on given path is accessible by the worker
+        """
+        return True
+
+    @abc.abstractmethod
+    def execute(self, args):
+        """
+        Execute one command
+
+        :param args: list of command arguments
+        :return: tuple (return code, stdout)
+        """
+
+    def is_healthy(self):
+        """
+        :return: True if worker is able to execute commands
+        """
+        return True
+
+    def stop(self):
+        """
+        Release all resources of worker
+        """
+        pass
+
+
+class ContainerWorker(Worker):
+    """
+    Long-lived trace-tools container, commands are executed using docker exec
+
+    Only files inside of mounted directories are accessible, directories are mounted at the same paths as on the host.
+    """
+
+    def __init__(self, mounts, image=DOCKER_IMAGE):
+        """
+        :param mounts: list of host directories mounted into container
+        :param image: docker image with trace tools
+        """
+        super().__init__()
+        self._mounts = [os.path.realpath(m) for m in mounts]
+
+        cmd = ["docker", "run", "-d", "--rm", "--label", "trace-api-worker"]
+        for location in self._mounts:
+            cmd += ["-v", "{0}:{0}".format(location)]
+        cmd += [image, "sleep", "infinity"]
+
+        try:
+            self.container_id = subprocess.check_output(cmd).decode().strip()
+        except (OSError, subprocess.CalledProcessError) as ex:
+            raise ToolRunnerError("Unable to start trace-tools container: %s" % ex) from ex
+
+    def can_access(self, location):
+        location = os.path.realpath(location)
+        return any(os.path.commonpath([m, location]) == m for m in self._mounts)
+
+    def execute(self, args):
+        return _run_process(["docker", "exec", self.container_id] + list(args))
+
+    def is_healthy(self):
+        return subprocess.call(
+            ["docker", "exec", self.container_id, "true"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ) == 0
+
+    def stop(self):
+        subprocess.call(["docker", "kill", self.container_id], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class LocalWorker(Worker):
+    """
+    Stand-in for ContainerWorker which runs commands directly on the host in trace-tools directory
+    """
+
+    def __init__(self, cwd=EXT_FOLDER):
+        """
+        :param cwd: directory with trace tools scripts
+        """
+        super().__init__()
+        self._cwd = cwd
+
+    def execute(self, args):
+        return _run_process(_local_command(args), cwd=self._cwd)
+
+
+class PooledRunner:
+    """
+    Run commands in pool of long-lived workers
+
+    Workers are created lazily up to pool size. Idle worker is health checked before it is used when its last check
+    is older than health_check_interval, unhealthy workers are replaced. Every worker is recycled after max_jobs jobs.
+
+    Example usage:
+        runner = PooledRunner(lambda: ContainerWorker(["/tmp"]), size=4)
+        return_code, stdout = runner.run(["python3", "trace-analyzer/trace-analyzer.py", ...], files=[...])
+        runner.close()
+    """
+
+    def __init__(self, worker_factory, size=2, max_jobs=100, health_check_interval=60):
+        """
+        :param worker_factory: callable that creates new Worker
+        :param size: maximum number of workers
+        :param max_jobs: number of jobs after which worker is replaced by new one
+        :param health_check_interval: number of seconds after which idle worker is health checked again
+        """
+        if size < 1:
+            raise ValueError("Pool size has to be positive")
+
+        self._worker_factory = worker_factory
+        self._max_jobs = max_jobs
+        self._health_check_interval = health_check_interval
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._workers = set()
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    worker = self._worker_factory()
+                    with self._lock:
+                        self._workers.add(worker)
+                    return worker
+
+                if time.monotonic() - worker.checked_at < self._health_check_interval:
+                    return worker
+                if worker.is_healthy():
+                    worker.checked_at = time.monotonic()
+                    return worker
+                self._discard(worker)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, worker, failed=False):
+        worker.jobs += 1
+        if failed or worker.jobs >= self._max_jobs:
+            self._discard(worker)
+        else:
+            self._idle.put(worker)
+        self._slots.release()
+
+    def _discard(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.stop()
+
+    @property
+    def workers(self):
+        """
+        :return: list of live workers
+        """
+        with self._lock:
+            return list(self._workers)
+
+    def run(self, args, files=()):
+        """
+        Run command in one of workers
+
+        :param args: list of command arguments
+        :param files: host paths used by command
+        :return: tuple (return code, stdout)
+        """
+        worker = self._acquire()
+        failed = True
+        try:
+            inaccessible = [f for f in files if not worker.can_access(f)]
+            if inaccessible:
+                failed = False
+                raise ToolRunnerError("Files are not accessible by trace-tools workers: %s" % ", ".join(inaccessible))
+
+            result = worker.execute(args)
+            failed = False
+        finally:
+            self._release(worker, failed=failed)
+
+        return result
+
+    def close(self):
+        """
+        Stop all workers
+        """
+        for worker in self.workers:
+            self._discard(worker)
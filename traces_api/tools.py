@@ -1,6 +1,8 @@
 import datetime
 import flask
 
+from traces_api.pcap.codecs import iter_decompressed
+
 
 def escape(input):
     """
@@ -38,3 +40,54 @@ def escape_str(input):
     """
 
     return str(flask.escape(input))
+
+
+def send_stream(chunks, file_name, mimetype="application/vnd.tcpdump.pcap"):
+    """
+    Send generated data as attachment without saving them to disk
+
+    :param chunks: iterable of bytes
+    :param file_name: name of attachment
+    :param mimetype:
+    :return: flask response
+    """
+    return flask.Response(
+        flask.stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": "attachment; filename=%s" % file_name,
+            "Cache-Control": "no-cache",
+        },
+    )
+
+
+def send_capture(file, file_name, mimetype="application/vnd.tcpdump.pcap", chunk_size=1024 * 1024):
+    """
+    Send stored capture as attachment, encoding of response is negotiated by Accept-Encoding header
+
+    Compressed file is sent as it is with Content-Encoding when client accepts encoding of its codec,
+    otherwise file is decompressed on the fly and sent in chunks.
+
+    :param file: File
+    :param file_name: name of uncompressed attachment
+    :param mimetype:
+    :param chunk_size: maximal size of decompressed chunks
+    :return: flask response
+    """
+    encoding = file.codec.content_encoding if file.is_compressed() else None
+
+    if not file.is_compressed() or (encoding and flask.request.accept_encodings[encoding] > 0):
+        response = flask.send_file(
+            file.location,
+            mimetype=mimetype,
+            attachment_filename=file_name,
+            as_attachment=True,
+            cache_timeout=0
+        )
+        if file.is_compressed():
+            response.headers["Content-Encoding"] = encoding
+    else:
+        response = send_stream(iter_decompressed(file.location, chunk_size), file_name, mimetype)
+
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
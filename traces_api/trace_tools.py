@@ -1,10 +1,24 @@
 import os.path
 import re
-import subprocess
 import json
 import tempfile
+import contextlib
+from collections import namedtuple
 
-EXT_FOLDER = os.path.dirname(os.path.realpath(__file__)) + "/../ext"
+from traces_api.pcap.codecs import GzipCodec
+from traces_api.pcap.reader import PcapError, open_capture
+from traces_api.pcap.analyzer import analyze_capture, StreamAnalysis
+from traces_api.pcap.rewrite import PacketRewriter
+from traces_api.pcap.writer import create_writer, iter_capture
+from traces_api.pcap.merge import merge_files, merge_packets, MERGE_CHUNK_SIZE
+from traces_api.tool_runner import DockerRunner, LocalRunner, ToolRunnerError, EXT_FOLDER
+
+CHUNK_SIZE = 1024 * 1024
+
+# Keys of dict returned by TraceAnalyzer.analyze
+ANALYSIS_KEYS = [
+    "tcp_conversations", "udp_conversations", "icmp_conversations", "ipv6_endpoints", "pairs_mac_ip", "capture_info"
+]
 
 
 class TraceAnalyzerError(Exception):
@@ -28,6 +42,46 @@ class TraceMixerError(Exception):
     pass
 
 
+class TraceToolsConfigError(Exception):
+    """
+    Trace tools backend can't read files of configured storage
+    """
+    pass
+
+
+def _run_batch(runner, args, jobs, files, error_class):
+    """
+    Run trace-tools script in batch mode
+
+    :param runner: runner of trace-tools commands
+    :param args: script command arguments, manifest argument is appended
+    :param jobs: list of job dicts written to manifest
+    :param files: host paths used by jobs
+    :param error_class: exception raised when any job fails
+    :return: list of job results in order of jobs
+    """
+    with tempfile.NamedTemporaryFile(mode="w", prefix="trace_api_", suffix=".json") as f:
+        json.dump(jobs, f)
+        f.flush()
+        f.file.close()
+
+        try:
+            returncode, stdout = runner.run(list(args) + ["-b", f.name], files=list(files) + [f.name])
+        except ToolRunnerError as ex:
+            raise error_class(str(ex)) from ex
+
+    try:
+        results = [json.loads(line.decode()) for line in stdout.splitlines() if line.startswith(b"{")]
+    except json.decoder.JSONDecodeError:
+        raise error_class("Invalid output of batch, error_code: %s" % returncode)
+
+    failed = [r["input"] for r in results if not r["success"]]
+    if returncode != 0 or failed or len(results) != len(jobs):
+        raise error_class("error_code: %s, failed: %s" % (returncode, ", ".join(failed)))
+
+    return results
+
+
 class TraceAnalyzer:
     """
     Analyze captured traffic dump
@@ -37,12 +91,22 @@ class TraceAnalyzer:
         https://github.com/CSIRT-MU/Trace-Share/tree/master/trace-analyzer
     """
 
+    # Version of analysis output, cached analyses of other versions are not used
+    VERSION = "trace-analyzer-1"
+
+    def __init__(self, runner=None):
+        """
+        :param runner: runner of trace-tools commands, new docker container is used for every command by default
+        """
+        self._runner = runner or DockerRunner()
+
     def analyze(self, filepath):
         """
         Analyze captured traffic dump
 
         Tool is able to extract this information from captured traffic dump:
-        - tcp conversations
+        - tcp, udp and icmp conversations
+        - ipv6 endpoints
         - ip paris
         - mac pairs
         - other capture information
@@ -50,20 +114,22 @@ class TraceAnalyzer:
         :param filepath: path to file to be analyzed
         :return: dict that contains analyzed information
         """
-        docker_params = "docker run --rm  -v \"{}\":/dumps/file.pcap trace-tools".format(filepath)
-        cmd = '{} python3 trace-analyzer/trace-analyzer.py -f "{}" -tcp -q'.format(docker_params, "/dumps/file.pcap")
-
-        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-
-        stdout, stderr = p.communicate()
+        try:
+            returncode, stdout = self._runner.run(
+                ["python3", "trace-analyzer/trace-analyzer.py", "-f", filepath, "-tcps", "-q", "--concurrent"],
+                files=[filepath]
+            )
+        except ToolRunnerError as ex:
+            raise TraceAnalyzerError(str(ex)) from ex
 
-        if p.returncode != 0:
-            raise TraceAnalyzerError("error_code: %s" % p.returncode)
+        if returncode != 0:
+            raise TraceAnalyzerError("error_code: %s" % returncode)
 
+        # First line holds all conversations and endpoints computed by single tshark run
         parts = re.split(b"\n", stdout)
         try:
-            out = dict(
-                tcp_conversations=json.loads(parts[0].decode()),
+            out = json.loads(parts[0].decode())
+            out.update(
                 pairs_mac_ip=json.loads(parts[1].decode()),
                 capture_info=json.loads(parts[2].decode()),
             )
@@ -72,6 +138,64 @@ class TraceAnalyzer:
 
         return out
 
+    def create_stream_analysis(self):
+        """
+        Create analysis that is computed while capture is saved
+
+        Only native analyzer supports it, trace-analyzer of other backends always reads saved file.
+
+        :return: StreamAnalysis or None if analyzer has to read saved file
+        """
+        return None
+
+    def analyze_batch(self, filepaths):
+        """
+        Analyze multiple captured traffic dumps by single run of trace-analyzer
+
+        :param filepaths: list of paths to files to be analyzed
+        :return: list of dicts that contain analyzed information, in order of filepaths
+        """
+        results = _run_batch(
+            self._runner, ["python3", "trace-analyzer/trace-analyzer.py", "-tcps", "-q", "--concurrent"],
+            [dict(input=filepath) for filepath in filepaths], filepaths, TraceAnalyzerError
+        )
+        return [{key: r[key] for key in ANALYSIS_KEYS} for r in results]
+
+
+class NativeTraceAnalyzer(TraceAnalyzer):
+    """
+    Analyze captured traffic dump in process
+
+    All information is computed in one pass over captured packets, no external tool is used.
+    Returned dict has the same structure as dict returned by TraceAnalyzer.
+    """
+
+    VERSION = "native-1"
+
+    def analyze(self, filepath):
+        """
+        Analyze captured traffic dump
+
+        :param filepath: path to file to be analyzed, file can be compressed
+        :return: dict that contains analyzed information
+        """
+        try:
+            return analyze_capture(filepath)
+        except (OSError, PcapError) as ex:
+            raise TraceAnalyzerError(str(ex)) from ex
+
+    def create_stream_analysis(self):
+        return StreamAnalysis()
+
+    def analyze_batch(self, filepaths):
+        """
+        Analyze multiple captured traffic dumps
+
+        :param filepaths: list of paths to files to be analyzed
+        :return: list of dicts that contain analyzed information, in order of filepaths
+        """
+        return [self.analyze(filepath) for filepath in filepaths]
+
 
 class TraceNormalizer:
     """
@@ -84,6 +208,12 @@ class TraceNormalizer:
         https://github.com/CSIRT-MU/Trace-Share/tree/master/trace-normalizer
     """
 
+    def __init__(self, runner=None):
+        """
+        :param runner: runner of trace-tools commands, new docker container is used for every command by default
+        """
+        self._runner = runner or DockerRunner()
+
     def normalize(self, target_file_location, output_file_location, configuration):
 
         with tempfile.NamedTemporaryFile(mode="w") as f:
@@ -93,28 +223,43 @@ class TraceNormalizer:
 
             configuration_file = f.name
 
-            docker_params = 'docker run --rm -v "{}":/data/target.pcap -v "{}":/data/output.pcap ' \
-                            '-v "{}":/data/config.conf trace-tools'.format(
-                                target_file_location, output_file_location, configuration_file
-                            )
-            cmd = '{} python3 trace-normalizer/trace-normalizer.py -i "{}" -o "{}" -c "{}"'\
-                .format(docker_params, "/data/target.pcap", "/data/output.pcap", "/data/config.conf")
+            try:
+                returncode, stdout = self._runner.run(
+                    ["python3", "trace-normalizer/trace-normalizer.py",
+                     "-i", target_file_location, "-o", output_file_location, "-c", configuration_file],
+                    files=[target_file_location, output_file_location, configuration_file]
+                )
+            except ToolRunnerError as ex:
+                raise TraceNormalizerError(str(ex)) from ex
 
-            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
+            if returncode != 0:
+                raise TraceNormalizerError("error_code: %s" % returncode)
+
+    def normalize_batch(self, jobs):
+        """
+        Normalize multiple captured traffic dumps by single run of trace-normalizer
 
-            stdout, stderr = p.communicate()
+        :param jobs: list of tuples (target file location, output file location, configuration)
+        """
+        files = []
+        for target_file_location, output_file_location, _ in jobs:
+            files += [target_file_location, output_file_location]
 
-            if p.returncode != 0:
-                raise TraceNormalizerError("error_code: %s" % p.returncode)
+        _run_batch(
+            self._runner, ["python3", "trace-normalizer/trace-normalizer.py", "-q"],
+            [dict(input=target, output=output, configuration=configuration) for target, output, configuration in jobs],
+            files, TraceNormalizerError
+        )
 
     @staticmethod
-    def prepare_configuration(ip_mapping, mac_mapping, timestamp):
+    def prepare_configuration(ip_mapping, mac_mapping, timestamp, output_format=None):
         """
         Prepare configuration dict with given parameters
 
         :param ip_mapping:
         :param mac_mapping:
         :param timestamp:
+        :param output_format: format of normalized file (pcap or pcapng), pcapng is used if None
         :return: configuration dict
         """
         configuration = {}
@@ -129,9 +274,61 @@ class TraceNormalizer:
         if timestamp:
             configuration["timestamp"] = timestamp
 
+        if output_format:
+            configuration["output_format"] = output_format
+
         return configuration
 
 
+class NativeTraceNormalizer(TraceNormalizer):
+    """
+    Normalize captured traffic dump in process
+
+    IP mapping, MAC mapping and timestamp shift are applied in one pass over captured packets,
+    checksums are updated incrementally. No external tool is used.
+    """
+
+    OUTPUT_FORMAT = "pcapng"
+
+    def normalize(self, target_file_location, output_file_location, configuration):
+        """
+        Normalize captured traffic dump
+
+        :param target_file_location: file to be normalized, file can be compressed
+        :param output_file_location: location of normalized file
+        :param configuration: configuration created by prepare_configuration
+        """
+        try:
+            output_format = configuration.get("output_format", self.OUTPUT_FORMAT)
+            with open_capture(target_file_location) as reader, open(output_file_location, "wb") as f_out:
+                writer = create_writer(f_out, output_format, snaplen=reader.snaplen, nanosecond=reader.nanosecond)
+                for packet in self.normalize_packets(reader, configuration):
+                    writer.write(packet)
+                writer.close()
+        except (OSError, ValueError, PcapError) as ex:
+            raise TraceNormalizerError(str(ex)) from ex
+
+    def normalize_batch(self, jobs):
+        """
+        Normalize multiple captured traffic dumps
+
+        :param jobs: list of tuples (target file location, output file location, configuration)
+        """
+        for target_file_location, output_file_location, configuration in jobs:
+            self.normalize(target_file_location, output_file_location, configuration)
+
+    @staticmethod
+    def normalize_packets(packets, configuration):
+        """
+        Normalize stream of packets
+
+        :param packets: iterable of packets (e.g. PcapReader)
+        :param configuration: configuration created by prepare_configuration
+        :return: generator of normalized packets
+        """
+        return PacketRewriter.from_configuration(configuration).rewrite_all(packets)
+
+
 class TraceMixer:
     """
     One specific mixing operation
@@ -144,9 +341,14 @@ class TraceMixer:
 
     BASE_PCAP_FILE = EXT_FOLDER + "/trace-mixer/base.pcap"
 
-    def __init__(self, output_location):
+    def __init__(self, output_location, runner=None):
+        """
+        :param output_location: location of mixed file
+        :param runner: runner of trace-tools commands, new docker container is used for every command by default
+        """
         self._previous_pcap = self.BASE_PCAP_FILE
         self._output_location = output_location
+        self._runner = runner or DockerRunner()
 
     def mix(self, annotated_unit_file):
         """
@@ -167,21 +369,67 @@ class TraceMixer:
             f_tmp.file.close()
             tmp_file = f_tmp.name
 
-            docker_params = 'docker run --rm -v "{}":/data/target.pcap -v "{}":/data/output.pcap ' \
-                            '-v "{}":/data/mix_file.pcap trace-tools'.format(
-                                tmp_file, self._output_location, annotated_unit_file
-                            )
+            try:
+                returncode, stdout = self._runner.run(
+                    ["python3", "trace-mixer/trace-mixer.py",
+                     "-b", tmp_file, "-o", self._output_location, "-m", annotated_unit_file],
+                    files=[tmp_file, self._output_location, annotated_unit_file]
+                )
+            except ToolRunnerError as ex:
+                raise TraceMixerError(str(ex)) from ex
 
-            cmd = '{} python3 trace-mixer/trace-mixer.py -b "{}" -o "{}" -m "{}"'\
-                      .format(docker_params, "/data/target.pcap", "/data/output.pcap", "/data/mix_file.pcap")
+            if returncode != 0:
+                raise TraceMixerError("error_code: %s" % returncode)
 
-            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-            stdout, stderr = p.communicate()
+    def get_mixed_file_location(self):
+        return self._output_location
+
+
+class NativeTraceMixer(TraceMixer):
+    """
+    Mixing operation performed in process in one pass
+
+    Annotated units are only collected by mix(). All collected units together with base pcap
+    are merged by timestamp in single k-way merge when the mixed file location is requested.
+    Memory usage is bounded by small read buffer per merged file.
+
+    Example usage:
+        tm = NativeTraceMixer(output_location)
+        tm.mix(ann_unit1)
+        tm.mix(ann_unit2)
+        tm.get_mixed_file_location()
+    """
 
-            if p.returncode != 0:
-                raise TraceMixerError("error_code: %s" % p.returncode)
+    OUTPUT_FORMAT = "pcapng"
+
+    def __init__(self, output_location):
+        super().__init__(output_location)
+        self._files = [self.BASE_PCAP_FILE]
+        self._merged = False
+
+    def mix(self, annotated_unit_file):
+        """
+        Add annotated unit to mix
+        :param annotated_unit_file: annotated unit file, it has to exist until mix is merged
+        """
+        self._files.append(annotated_unit_file)
+        self._merged = False
+
+    def _merge(self):
+        try:
+            with open(self._output_location, "wb") as f_out:
+                merge_files(self._files, f_out, self.OUTPUT_FORMAT)
+        except (OSError, PcapError) as ex:
+            raise TraceMixerError(str(ex)) from ex
 
     def get_mixed_file_location(self):
+        """
+        Merge all collected annotated units (if not merged yet)
+        :return: location of mixed file
+        """
+        if not self._merged:
+            self._merge()
+            self._merged = True
         return self._output_location
 
 
@@ -189,14 +437,180 @@ class TraceMixing:
     """
     Provide ability to combine multiple annotated units into one mix
     """
-    @staticmethod
-    def create_new_mixer(output_location):
+
+    OUTPUT_FORMAT = "pcap"
+
+    def __init__(self, runner=None):
+        """
+        :param runner: runner of trace-tools commands passed to created mixers
+        """
+        self._runner = runner
+
+    def create_new_mixer(self, output_location):
         """
         Create one Trace mixer instance
         :param output_location
         :return: TraceMixer
         """
-        return TraceMixer(output_location)
+        return TraceMixer(output_location, runner=self._runner)
+
+    def mix_annotated_units(self, trace_normalizer, annotated_units, progress=None):
+        """
+        Normalize annotated units and mix them together
+
+        All annotated units are normalized by one batch into temporary files which are then added to mix.
+        Mix is produced lazily while returned generator is consumed.
+
+        :param trace_normalizer: TraceNormalizer
+        :param annotated_units: list of tuples (annotated unit file location, normalizer configuration)
+        :param progress: callback called with number of already processed annotated units
+        :return: generator of bytes chunks of mixed file
+        """
+        temporary_files = []
+
+        def create_temporary_file():
+            fd, location = tempfile.mkstemp(prefix="trace_api_")
+            os.close(fd)
+            temporary_files.append(location)
+            return location
+
+        try:
+            mixer = self.create_new_mixer(create_temporary_file())
+
+            jobs = [(location, create_temporary_file(), configuration) for location, configuration in annotated_units]
+            trace_normalizer.normalize_batch(jobs)
+
+            for num_processed, (_, normalized_location, _) in enumerate(jobs, 1):
+                mixer.mix(normalized_location)
+
+                if progress:
+                    progress(num_processed)
+
+            with open(mixer.get_mixed_file_location(), "rb") as f:
+                yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+        finally:
+            for location in temporary_files:
+                os.remove(location)
+
+
+class NativeTraceMixing(TraceMixing):
+    """
+    Provide ability to combine multiple annotated units into one mix in process
+    """
+
+    OUTPUT_FORMAT = NativeTraceMixer.OUTPUT_FORMAT
+
+    @staticmethod
+    def create_new_mixer(output_location):
+        """
+        Create one native Trace mixer instance
+        :param output_location
+        :return: NativeTraceMixer
+        """
+        return NativeTraceMixer(output_location)
+
+    def mix_annotated_units(self, trace_normalizer, annotated_units, progress=None):
+        """
+        Normalize annotated units and mix them together in one fused pipeline
+
+        Every stored annotated unit is decompressed, normalized and merged on the fly,
+        no intermediate file is written. Normalizer has to be NativeTraceNormalizer,
+        otherwise annotated units are normalized into temporary files.
+
+        :param trace_normalizer: TraceNormalizer
+        :param annotated_units: list of tuples (annotated unit file location, normalizer configuration)
+        :param progress: callback called with number of already processed annotated units
+        :return: generator of bytes chunks of mixed file
+        """
+        if not isinstance(trace_normalizer, NativeTraceNormalizer):
+            return super().mix_annotated_units(trace_normalizer, annotated_units, progress)
+        return self._mix_stream(trace_normalizer, annotated_units, progress)
+
+    def _mix_stream(self, trace_normalizer, annotated_units, progress):
+        num_processed = 0
+
+        def track(packets):
+            nonlocal num_processed
+            yield from packets
+            num_processed += 1
+            if progress:
+                progress(num_processed)
+
+        try:
+            with contextlib.ExitStack() as stack:
+                def open_reader(location):
+                    return stack.enter_context(open_capture(location, use_mmap=False, chunk_size=MERGE_CHUNK_SIZE))
+
+                readers = [open_reader(NativeTraceMixer.BASE_PCAP_FILE)]
+                sources = [readers[0]]
+                for location, configuration in annotated_units:
+                    reader = open_reader(location)
+                    readers.append(reader)
+                    sources.append(track(trace_normalizer.normalize_packets(reader, configuration)))
+
+                yield from iter_capture(
+                    merge_packets(sources), self.OUTPUT_FORMAT, chunk_size=CHUNK_SIZE,
+                    snaplen=max(r.snaplen or 0 for r in readers), nanosecond=any(r.nanosecond for r in readers),
+                )
+        except (OSError, ValueError, PcapError) as ex:
+            raise TraceMixerError(str(ex)) from ex
+
+
+TraceTools = namedtuple("TraceTools", ["analyzer", "normalizer", "mixing"])
+
+BACKENDS = ("docker", "local", "pool", "native")
+
+
+def create_trace_tools(backend="docker", runner=None):
+    """
+    Create analyzer, normalizer and mixing of given backend
+
+    Backends:
+    - docker - every command is run in new trace-tools container
+    - local - tools installed on the host are used
+    - pool - commands are run in pool of long-lived containers, runner has to be provided
+    - native - everything is computed in process, no external tool is used
+
+    :param backend: name of backend
+    :param runner: runner of trace-tools commands, default runner of backend is used if None
+    :return: TraceTools
+    """
+    if backend == "native":
+        return TraceTools(NativeTraceAnalyzer(), NativeTraceNormalizer(), NativeTraceMixing())
+
+    if runner is None:
+        if backend == "docker":
+            runner = DockerRunner()
+        elif backend == "local":
+            runner = LocalRunner()
+        elif backend == "pool":
+            raise ValueError("Runner has to be provided for pool backend")
+
+    if backend not in BACKENDS:
+        raise ValueError("Unknown trace tools backend %s" % backend)
+
+    return TraceTools(TraceAnalyzer(runner), TraceNormalizer(runner), TraceMixing(runner))
+
+
+def check_storage_compression(backend, compressions):
+    """
+    Check that trace tools of backend can read files compressed by storages
+
+    External tools read only gzip (and bgzf) files, other codecs can be used only with native backend.
+
+    :param backend: name of backend
+    :param compressions: dict of Compression by name of storage (e.g. config key)
+    :raises TraceToolsConfigError: backend can't read files of some storage
+    """
+    if backend == "native":
+        return
+
+    for name, compression in compressions.items():
+        if not isinstance(compression.codec, GzipCodec):
+            raise TraceToolsConfigError(
+                "Compression %s of %s requires native trace tools backend, backend %s reads only gzip files"
+                % (compression.codec.name, name, backend)
+            )
 
 
 if __name__ == "__main__":